@@ -0,0 +1,328 @@
+"""
+Motor Analítico em Colunas (NumPy)
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- As transações do usuário (ativas e arquivadas) são lidas do banco uma vez
+  e ficam em colunas NumPy compactas, ordenadas por data: dia (int32, dias
+  desde 1970-01-01), mês (int32, meses desde 1970-01), valor (int64,
+  centavos), categoria (int16, código -> categoria_id), tipo (uint8,
+  máscara RECEITA | DESPESA), id (int64) e descrição (int32, código -> texto)
+- Kernels vetorizados para qualquer período: totais por tipo, somas por
+  categoria (bincount), série mensal, média móvel (cumsum) e maiores
+  valores (argpartition); relatórios e o resumo do dashboard não voltam ao
+  banco enquanto as colunas estão em memória
+- Escritas do próprio worker entram nas colunas na hora (inserção na
+  posição da data, exclusão por id), sem recarregar
+- LRU limitado por bytes (ANALITICO_MAX_BYTES) e com TTL; uma marca por
+  usuário em disco (arquivo trocado a cada escrita) avisa os outros workers
+  de que as colunas deles ficaram velhas; diretório 0700 do usuário do app,
+  para ninguém mais trocar ou plantar marcas
+
+Colunas são imutáveis: a escrita monta colunas novas e troca a entrada do
+cache, então quem está calculando sobre as antigas não vê arrays misturados.
+"""
+
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+import numpy as np
+
+from diretorio_privado import abrir_privado, preparar_diretorio
+
+# ============== CONFIGURAÇÕES ==============
+
+ANALITICO_DIR = os.getenv('ANALITICO_DIR', os.path.join(tempfile.gettempdir(), 'simplifica_analitico'))
+ANALITICO_TTL = float(os.getenv('ANALITICO_TTL', 300))
+ANALITICO_MAX_BYTES = int(os.getenv('ANALITICO_MAX_BYTES', 64 * 1024 * 1024))
+
+RECEITA, DESPESA = 1, 2
+MASCARA_TIPO = {'receita': RECEITA, 'despesa': DESPESA}
+NOME_TIPO = {RECEITA: 'receita', DESPESA: 'despesa'}
+
+EPOCA = date(1970, 1, 1)
+# Estimativa do que um texto de descrição ocupa além dos caracteres (objeto str + lista)
+BYTES_POR_DESCRICAO = 64
+
+COLUNAS = ('dia', 'mes', 'valor', 'categoria', 'tipo', 'id', 'descricao')
+
+
+def numero_do_dia(data):
+    return (data - EPOCA).days
+
+
+def numero_do_mes(data):
+    return (data.year - 1970) * 12 + data.month - 1
+
+
+def mes_do_numero(numero):
+    """Meses desde 1970-01 -> 'AAAA-MM' (formato da evolução mensal)"""
+    return f'{1970 + numero // 12:04d}-{numero % 12 + 1:02d}'
+
+
+def consultar_colunas(cursor, usuario_id):
+    """Todas as transações do usuário, ativas e arquivadas, em tuplas (id, tipo, valor, descricao, categoria_id, data)"""
+    cursor.execute('''
+        /* consulta: analitico_colunas */
+        SELECT id, tipo, valor_centavos, descricao, categoria_id, data
+        FROM transacoes WHERE usuario_id = %s
+        UNION ALL
+        SELECT id, tipo, valor_centavos, descricao, categoria_id, data
+        FROM transacoes_arquivo WHERE usuario_id = %s
+    ''', (usuario_id, usuario_id))
+    return [(linha['id'], linha['tipo'], linha['valor_centavos'], linha['descricao'],
+             linha['categoria_id'], linha['data']) for linha in cursor.fetchall()]
+
+
+# ============== COLUNAS DE UM USUÁRIO ==============
+
+class ColunasUsuario:
+    """Transações de um usuário em colunas, ordenadas por (dia, id)"""
+
+    def __init__(self, linhas=()):
+        self.categorias = []  # código -> categoria_id
+        self.descricoes = []  # código -> texto
+        self._codigo_categoria = {}
+        self._codigo_descricao = {}
+        ids, tipos, valores, descricoes, categorias, datas = zip(*linhas) if linhas else ((),) * 6
+        # Aceita date e 'AAAA-MM-DD' (SQLite não declara o tipo numa coluna de UNION)
+        dias = np.array(datas, dtype='datetime64[D]')
+        colunas = {
+            'dia': dias.astype(np.int32),
+            'mes': dias.astype('datetime64[M]').astype(np.int32),
+            'valor': np.array(valores, dtype=np.int64),
+            'categoria': np.array([self._codigo_de_categoria(c) for c in categorias], dtype=np.int16),
+            'tipo': np.array([MASCARA_TIPO[t] for t in tipos], dtype=np.uint8),
+            'id': np.array(ids, dtype=np.int64),
+            'descricao': np.array([self._codigo_de_descricao(d) for d in descricoes], dtype=np.int32),
+        }
+        ordem = np.lexsort((colunas['id'], colunas['dia']))
+        for nome in COLUNAS:
+            setattr(self, nome, colunas[nome][ordem])
+
+    def _codigo_de_categoria(self, categoria_id):
+        codigo = self._codigo_categoria.get(categoria_id)
+        if codigo is None:
+            codigo = self._codigo_categoria[categoria_id] = len(self.categorias)
+            self.categorias.append(categoria_id)
+        return codigo
+
+    def _codigo_de_descricao(self, descricao):
+        codigo = self._codigo_descricao.get(descricao)
+        if codigo is None:
+            codigo = self._codigo_descricao[descricao] = len(self.descricoes)
+            self.descricoes.append(descricao)
+        return codigo
+
+    def _derivar(self, **colunas):
+        """Cópia com outras colunas; os dicionários de códigos (só crescem) são compartilhados"""
+        nova = object.__new__(ColunasUsuario)
+        nova.__dict__.update(self.__dict__)
+        nova.__dict__.update(colunas)
+        return nova
+
+    def __len__(self):
+        return len(self.id)
+
+    @property
+    def nbytes(self):
+        return (sum(getattr(self, nome).nbytes for nome in COLUNAS)
+                + sum(len(texto) + BYTES_POR_DESCRICAO for texto in self.descricoes))
+
+    def com_transacao(self, transacao_id, tipo, valor_centavos, descricao, categoria_id, data):
+        """Colunas novas com a transação na posição da data"""
+        dia = numero_do_dia(data)
+        posicao = int(np.searchsorted(self.dia, dia, side='right'))
+        valores = {'dia': dia, 'mes': numero_do_mes(data), 'valor': valor_centavos,
+                   'categoria': self._codigo_de_categoria(categoria_id), 'tipo': MASCARA_TIPO[tipo],
+                   'id': transacao_id, 'descricao': self._codigo_de_descricao(descricao)}
+        return self._derivar(**{nome: np.insert(getattr(self, nome), posicao, valores[nome])
+                                for nome in COLUNAS})
+
+    def sem_transacao(self, transacao_id):
+        """Colunas novas sem a transação (as mesmas se ela não estiver aqui)"""
+        manter = self.id != transacao_id
+        if manter.all():
+            return self
+        return self._derivar(**{nome: getattr(self, nome)[manter] for nome in COLUNAS})
+
+    def faixa(self, de=None, ate=None):
+        """Fatia das linhas com de <= data < ate (None: sem limite), por busca binária"""
+        inicio = 0 if de is None else int(np.searchsorted(self.dia, numero_do_dia(de), side='left'))
+        fim = len(self.dia) if ate is None else int(np.searchsorted(self.dia, numero_do_dia(ate), side='left'))
+        return slice(inicio, max(inicio, fim))
+
+
+# ============== KERNELS ==============
+# Somas em bincount (float64) são exatas enquanto o total fica abaixo de 2**53
+# centavos, muito acima de qualquer histórico com VALOR_MAXIMO_CENTAVOS por lançamento
+
+def totais_por_tipo(colunas, de=None, ate=None):
+    """{'receitas': centavos, 'despesas': centavos} no período"""
+    faixa = colunas.faixa(de, ate)
+    tipo, valor = colunas.tipo[faixa], colunas.valor[faixa]
+    return {'receitas': int(valor[tipo == RECEITA].sum()),
+            'despesas': int(valor[tipo == DESPESA].sum())}
+
+
+def saldo(colunas, de=None, ate=None):
+    totais = totais_por_tipo(colunas, de, ate)
+    return totais['receitas'] - totais['despesas']
+
+
+def somas_por_categoria(colunas, tipo, de=None, ate=None):
+    """[(categoria_id, total, quantidade)] do tipo no período, maior total primeiro"""
+    faixa = colunas.faixa(de, ate)
+    filtro = (colunas.tipo[faixa] & MASCARA_TIPO[tipo]) != 0
+    codigos = colunas.categoria[faixa][filtro]
+    if not codigos.size:
+        return []
+    tamanho = len(colunas.categorias)
+    totais = np.rint(np.bincount(codigos, weights=colunas.valor[faixa][filtro], minlength=tamanho)).astype(np.int64)
+    quantidades = np.bincount(codigos, minlength=tamanho)
+    usados = np.flatnonzero(quantidades)
+    ordem = usados[np.argsort(-totais[usados], kind='stable')]
+    return [(colunas.categorias[codigo], int(totais[codigo]), int(quantidades[codigo])) for codigo in ordem]
+
+
+def serie_mensal(colunas, mes_inicio, mes_fim):
+    """Receitas, despesas e quantidade por mês, de mes_inicio a mes_fim (números de mês, inclusive)
+
+    Devolve (meses, receitas, despesas, quantidades), arrays do mesmo tamanho,
+    com zero nos meses sem transação.
+    """
+    tamanho = max(mes_fim - mes_inicio + 1, 0)
+    meses = np.arange(mes_inicio, mes_inicio + tamanho, dtype=np.int32)
+    # Meses são crescentes como os dias: a faixa sai por busca binária
+    inicio, fim = np.searchsorted(colunas.mes, [mes_inicio, mes_fim + 1], side='left')
+    posicao = colunas.mes[inicio:fim] - mes_inicio
+    tipo, valor = colunas.tipo[inicio:fim], colunas.valor[inicio:fim]
+
+    def somar(mascara):
+        pesos = np.where(tipo == mascara, valor, 0)
+        return np.rint(np.bincount(posicao, weights=pesos, minlength=tamanho)).astype(np.int64)
+
+    return meses, somar(RECEITA), somar(DESPESA), np.bincount(posicao, minlength=tamanho)
+
+
+def media_movel(serie, janela):
+    """Média dos últimos `janela` pontos de cada posição (no começo, dos que houver)"""
+    acumulado = np.cumsum(serie, dtype=np.float64)
+    acumulado[janela:] = acumulado[janela:] - acumulado[:-janela]
+    return acumulado / np.minimum(np.arange(1, len(acumulado) + 1), janela)
+
+
+def maiores(colunas, tipo, quantidade, de=None, ate=None):
+    """Posições (nas colunas) das `quantidade` transações de maior valor do tipo no período"""
+    faixa = colunas.faixa(de, ate)
+    candidatas = np.flatnonzero((colunas.tipo[faixa] & MASCARA_TIPO[tipo]) != 0) + faixa.start
+    if candidatas.size > quantidade:
+        candidatas = candidatas[np.argpartition(-colunas.valor[candidatas], quantidade - 1)[:quantidade]]
+    return candidatas[np.argsort(-colunas.valor[candidatas], kind='stable')]
+
+
+def transacao(colunas, posicao):
+    """Linha de uma posição, com os campos de transacoes (categoria ainda como id)"""
+    return {'id': int(colunas.id[posicao]),
+            'tipo': NOME_TIPO[int(colunas.tipo[posicao])],
+            'valor_centavos': int(colunas.valor[posicao]),
+            'descricao': colunas.descricoes[colunas.descricao[posicao]],
+            'categoria_id': colunas.categorias[colunas.categoria[posicao]],
+            'data': date.fromordinal(EPOCA.toordinal() + int(colunas.dia[posicao]))}
+
+
+# ============== COLUNAS DE TODOS OS USUÁRIOS ==============
+
+class MotorAnalitico:
+    """LRU de usuários -> ColunasUsuario, limitado por bytes, com marca de escrita em disco"""
+
+    def __init__(self, diretorio=ANALITICO_DIR, ttl=ANALITICO_TTL, max_bytes=ANALITICO_MAX_BYTES):
+        self.diretorio = diretorio
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._usuarios = OrderedDict()  # usuario_id -> (carregado_em, marca, colunas)
+        self._lock = threading.Lock()
+        preparar_diretorio(self.diretorio)
+
+    def _caminho(self, usuario_id):
+        return os.path.join(self.diretorio, f'{int(usuario_id)}.marca')
+
+    def _marca(self, usuario_id):
+        """Identidade do arquivo de marca: muda a cada escrita de qualquer worker"""
+        try:
+            estado = os.stat(self._caminho(usuario_id))
+        except OSError:
+            return None
+        return estado.st_ino, estado.st_mtime_ns
+
+    def _marcar(self, usuario_id):
+        """Troca o arquivo de marca (arquivo novo, inode novo) e devolve a marca nova"""
+        caminho = self._caminho(usuario_id)
+        temporario = f'{caminho}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with abrir_privado(temporario):
+            pass
+        os.replace(temporario, caminho)
+        return self._marca(usuario_id)
+
+    def _guardar(self, usuario_id, carregado_em, marca, colunas):
+        """Com o lock: troca a entrada e despeja os menos usados até caber no limite"""
+        anterior = self._usuarios.pop(usuario_id, None)
+        if anterior is not None:
+            self.bytes -= anterior[2].nbytes
+        self._usuarios[usuario_id] = (carregado_em, marca, colunas)
+        self.bytes += colunas.nbytes
+        while self.bytes > self.max_bytes and len(self._usuarios) > 1:
+            _, (_, _, despejadas) = self._usuarios.popitem(last=False)
+            self.bytes -= despejadas.nbytes
+
+    def do_usuario(self, usuario_id, carregar):
+        """Colunas do usuário: da memória ou de carregar(usuario_id) (tuplas de consultar_colunas)"""
+        marca = self._marca(usuario_id)
+        with self._lock:
+            item = self._usuarios.get(usuario_id)
+            if item is not None and item[1] == marca and time.monotonic() - item[0] < self.ttl:
+                self._usuarios.move_to_end(usuario_id)
+                return item[2]
+        # Marca lida antes da carga: escrita durante a carga faz a próxima leitura recarregar
+        colunas = ColunasUsuario(carregar(usuario_id))
+        with self._lock:
+            self._guardar(usuario_id, time.monotonic(), marca, colunas)
+        return colunas
+
+    def _alterar(self, usuario_id, mudar):
+        with self._lock:
+            marca_anterior = self._marca(usuario_id)
+            marca = self._marcar(usuario_id)
+            item = self._usuarios.get(usuario_id)
+            if item is None:
+                return
+            if item[1] != marca_anterior:
+                # Outro worker escreveu depois da carga: estas colunas já não servem
+                self.bytes -= self._usuarios.pop(usuario_id)[2].nbytes
+                return
+            self._guardar(usuario_id, item[0], marca, mudar(item[2]))
+
+    def adicionar(self, usuario_id, transacao_id, tipo, valor_centavos, descricao, categoria_id, data):
+        """Transação recém-gravada (depois do commit)"""
+        self._alterar(usuario_id, lambda colunas: colunas.com_transacao(
+            transacao_id, tipo, valor_centavos, descricao, categoria_id, data))
+
+    def remover(self, usuario_id, transacao_id):
+        """Transação recém-excluída (depois do commit)"""
+        self._alterar(usuario_id, lambda colunas: colunas.sem_transacao(transacao_id))
+
+    def invalidar(self, usuario_id):
+        """Descarta as colunas em todos os workers (próxima leitura vem do banco)"""
+        with self._lock:
+            self._marcar(usuario_id)
+            item = self._usuarios.pop(usuario_id, None)
+            if item is not None:
+                self.bytes -= item[2].nbytes
+
+
+motor_analitico = MotorAnalitico()
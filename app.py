@@ -1,26 +1,83 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, abort, send_file
+from flask import Flask, render_template, request, redirect, url_for, session, flash, abort, send_file, send_from_directory, has_request_context
 from werkzeug.security import generate_password_hash, check_password_hash
+from flask.json.provider import DefaultJSONProvider
+from jinja2 import FileSystemBytecodeCache, TemplateError
 from datetime import datetime, timedelta
 import psycopg2
-from psycopg2.extras import RealDictCursor
 from functools import wraps
 import os
 from dotenv import load_dotenv
 import io
+import json
+import logging
+import time
+import mimetypes
 import pandas as pd
 from fpdf import FPDF
+from construir_assets import ASSETS_VENDOR, DIST_DIR, MANIFESTO, url_cdn
+from compressao import CompressaoMiddleware
+import metricas
+from metricas import CursorMedido
+from pool_conexoes import ConexaoPool, PoolConexoes, PoolEsgotado
+import limites_consulta
+import controle_admissao
+from disjuntor import Disjuntor, disjuntor_db
+from replicas import RoteadorLeituras
+from shards import MapaShards, Shard, criar_diretorio
+import shards as shards_config
+from snapshot_dashboard import SnapshotsDashboard
+from linhas import Linha
+from categorias import cache_categorias, normalizar_nome
+from particoes import (ManutencaoParticoes, garantir_particoes, inicio_do_mes, intervalo_do_mes,
+                       intervalo_mes_atual, somar_meses)
+from banco_sqlite import SQL_TABELAS, BancoSQLite, caminho_da_url
+from analitico import (consultar_colunas, maiores, media_movel, mes_do_numero, motor_analitico, numero_do_mes,
+                       saldo as saldo_das_colunas, serie_mensal, somas_por_categoria, totais_por_tipo, transacao)
+from previsao_metas import criar_colunas_previsao, fluxo_mensal_colunas, prever_metas_usuario
+from sugestoes import CAMPOS_SUGESTAO, consultar_usos, indice_sugestoes
+from busca_transacoes import condicao_busca, criar_indices_busca
+from arquivo_transacoes import COLUNAS_TRANSACAO, corte_do_arquivo, criar_tabelas_arquivo, excluir_arquivada
+from recorrencias import FREQUENCIAS, criar_tabelas_recorrencias, materializar
+from diretorio_privado import preparar_diretorio
+from dinheiro import VALOR_MAXIMO_CENTAVOS, formatar_moeda, para_centavos, para_reais, valor_para_campo
+import orcamento_consultas
+import perfilador
+import log_estruturado
 
 # Carrega variáveis de ambiente
 load_dotenv()
 
-print("=" * 60)
-print("🚀 SIMPLE - Sistema Financeiro PostgreSQL (RENDER)")
-print("=" * 60)
+# Logs em JSON, escritos por uma thread de fundo (nunca bloqueiam a requisição)
+log_estruturado.configurar_logging(arquivo=os.getenv('LOG_ARQUIVO'))
+logger = logging.getLogger(__name__)
+
+logger.info("🚀 SIMPLE - Sistema Financeiro PostgreSQL (RENDER)")
+
+FLASK_DEBUG = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
 
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'sua-chave-secreta-render-2025')
 app.permanent_session_lifetime = timedelta(hours=24)  # Sessão de 24 horas
 
+class ProvedorJSON(DefaultJSONProvider):
+    """JSON do Flask (|tojson, jsonify) que também serializa as linhas do banco"""
+    @staticmethod
+    def default(o):
+        if isinstance(o, Linha):
+            return dict(o)
+        return DefaultJSONProvider.default(o)
+
+app.json = ProvedorJSON(app)
+
+# Compressão gzip/brotli das respostas (HTML, JSON, CSS...), inclusive em streaming
+if os.getenv('COMPRESSAO_ATIVA', 'true').lower() == 'true':
+    app.wsgi_app = CompressaoMiddleware(
+        app.wsgi_app,
+        tamanho_minimo=int(os.getenv('COMPRESSAO_TAMANHO_MINIMO', 500)),
+        nivel_gzip=int(os.getenv('COMPRESSAO_NIVEL_GZIP', 6)),
+        qualidade_brotli=int(os.getenv('COMPRESSAO_QUALIDADE_BROTLI', 4))
+    )
+
 # ============== CONFIGURAÇÃO POSTGRESQL ==============
 DATABASE_URL = os.getenv('DATABASE_URL')
 
@@ -28,34 +85,138 @@ if DATABASE_URL and DATABASE_URL.startswith('postgres://'):
     # Render usa postgres:// mas psycopg2 precisa de postgresql://
     DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
 
-print(f"📊 Database: {'PostgreSQL Render' if DATABASE_URL else 'Local PostgreSQL'}")
-print("=" * 60)
+# DATABASE_URL=sqlite:///arquivo.db: banco embutido, sem servidor (um nó só / desenvolvimento)
+CAMINHO_SQLITE = caminho_da_url(DATABASE_URL)
+banco_local = BancoSQLite(CAMINHO_SQLITE) if CAMINHO_SQLITE else None
+
+if banco_local:
+    logger.info(f"📊 Database: SQLite ({CAMINHO_SQLITE})")
+else:
+    logger.info(f"📊 Database: {'PostgreSQL Render' if DATABASE_URL else 'Local PostgreSQL'}")
+
+def nova_conexao(dsn=None):
+    """Abre uma conexão nova com PostgreSQL (usada pelo pool); dsn de outro shard se informado"""
+    dsn = dsn or DATABASE_URL
+    if dsn:
+        return psycopg2.connect(dsn, connection_factory=ConexaoPool,
+                                cursor_factory=CursorMedido,
+                                options=limites_consulta.opcoes_conexao())
+    return psycopg2.connect(
+        host=os.getenv('DB_HOST', 'localhost'),
+        database=os.getenv('DB_NAME', 'gestao_financeira'),
+        user=os.getenv('DB_USER', 'postgres'),
+        password=os.getenv('DB_PASSWORD', ''),
+        connection_factory=ConexaoPool,
+        cursor_factory=CursorMedido,
+        options=limites_consulta.opcoes_conexao()
+    )
+
+# Conexões reaproveitadas entre requisições: conn.close() devolve ao pool
+pool_db = PoolConexoes(nova_conexao, disjuntor=disjuntor_db)
+
+# statement_timeout da rota (ao retirar e a cada transação nova) e cancelamento de consultas abandonadas
+pool_db.ao_retirar.append(limites_consulta.preparar_conexao)
+pool_db.ao_devolver.append(limites_consulta.vigia.esquecer)
+pool_db.apos_transacao.append(limites_consulta.refazer_timeout)
 
-def get_db_connection():
-    """Cria conexão com PostgreSQL"""
+def nova_conexao_replica(dsn):
+    """Conexão com uma réplica; só leitura mesmo se o DSN apontar para um banco gravável"""
+    return psycopg2.connect(dsn, connection_factory=ConexaoPool,
+                            cursor_factory=CursorMedido,
+                            options=f'{limites_consulta.opcoes_conexao()} -c default_transaction_read_only=on')
+
+# Rotas de leitura pesadas vão a uma réplica em dia (DATABASE_REPLICA_URLS), se houver
+roteador_leituras = RoteadorLeituras.do_ambiente(nova_conexao_replica)
+for replica in roteador_leituras.replicas:
+    replica.pool.ao_retirar.append(limites_consulta.preparar_conexao)
+    replica.pool.ao_devolver.append(limites_consulta.vigia.esquecer)
+    replica.pool.apos_transacao.append(limites_consulta.refazer_timeout)
+
+# Falhas seguidas abrem o disjuntor: get_db_connection() passa a falhar na hora
+disjuntor_db.ao_abrir.append(lambda: metricas.registro.incrementar('simplifica_disjuntor_aberturas_total'))
+
+# Shard 0 é DATABASE_URL (e guarda o diretório); DATABASE_SHARDS acrescenta os demais
+def novo_shard(numero, dsn):
+    """Shard com pool e disjuntor próprios: comando com erro num shard não derruba os outros"""
+    disjuntor = Disjuntor()
+    disjuntor.ao_abrir.append(lambda: metricas.registro.incrementar('simplifica_disjuntor_aberturas_total'))
+    pool_shard = PoolConexoes(lambda: nova_conexao(dsn), disjuntor=disjuntor)
+    pool_shard.ao_retirar.append(limites_consulta.preparar_conexao)
+    pool_shard.ao_devolver.append(limites_consulta.vigia.esquecer)
+    pool_shard.apos_transacao.append(limites_consulta.refazer_timeout)
+    return Shard(numero, pool_shard, disjuntor)
+
+shards_db = [Shard(0, pool_db, disjuntor_db)]
+for numero, dsn in enumerate(shards_config.dsns_configurados(), start=1):
+    shards_db.append(novo_shard(numero, dsn))
+
+def conexao_do_shard(numero):
+    """Empresta uma conexão do pool do shard (BancoIndisponivel com o disjuntor dele aberto)"""
+    shard = shards_db[numero]
+    shard.disjuntor.verificar()
     try:
-        if DATABASE_URL:
-            conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-        else:
-            conn = psycopg2.connect(
-                host=os.getenv('DB_HOST', 'localhost'),
-                database=os.getenv('DB_NAME', 'gestao_financeira'),
-                user=os.getenv('DB_USER', 'postgres'),
-                password=os.getenv('DB_PASSWORD', ''),
-                cursor_factory=RealDictCursor
-            )
+        inicio = time.perf_counter()
+        conn = shard.pool.obter()
+        metricas.registrar_consulta('conexao', time.perf_counter() - inicio)
+        shard.disjuntor.conexao_ok()
         return conn
     except Exception as e:
-        print(f"❌ Erro ao conectar ao PostgreSQL: {e}")
+        if isinstance(e, (psycopg2.OperationalError, PoolEsgotado)):
+            shard.disjuntor.falha()
+        logger.error(f"❌ Erro ao conectar ao PostgreSQL (shard {numero}): {e}")
         raise
 
+mapa_shards = MapaShards(lambda: conexao_do_shard(0), total=len(shards_db), diretorio=not banco_local)
+# Conta que mudou de shard: ids de categoria do cache eram do banco antigo
+mapa_shards.ao_mudar.append(cache_categorias.invalidar)
+mapa_shards.ao_mudar.append(motor_analitico.invalidar)
+
+def get_db_connection(shard=None):
+    """Empresta uma conexão do pool PostgreSQL (BancoIndisponivel com o disjuntor aberto)
+    
+    Sem shard, usa o do usuário logado (shard 0 fora de sessão). Nas rotas de leitura
+    de replicas.ROTAS_LEITURA a conexão do shard 0 pode vir de uma réplica.
+    Com SQLite, a conexão da thread (mesma interface de cursor e linhas).
+    """
+    if banco_local:
+        disjuntor_db.verificar()
+        conn = banco_local.obter()
+        disjuntor_db.conexao_ok()
+        return conn
+    movendo = False
+    if shard is None:
+        usuario_id = session.get('user_id') if has_request_context() else None
+        shard, movendo = mapa_shards.do_usuario(usuario_id)
+    if shard == 0:
+        conn = roteador_leituras.obter()
+        if conn is not None:
+            return conn
+    conn = conexao_do_shard(shard)
+    if movendo:
+        # Conta mudando de shard (mover_usuario_shard.py): só leitura até terminar
+        cursor = conn.cursor()
+        cursor.execute('/* consulta: shards_somente_leitura */ SET LOCAL transaction_read_only = on')
+        cursor.close()
+    return conn
+
+def listar_tabelas(cursor):
+    """Nomes das tabelas do banco atual (PostgreSQL ou SQLite)"""
+    if banco_local:
+        cursor.execute(SQL_TABELAS)
+    else:
+        cursor.execute('''
+            SELECT table_name AS nome FROM information_schema.tables
+            WHERE table_schema = current_schema()
+        ''')
+    return sorted(linha['nome'] for linha in cursor.fetchall())
+
 # ============== FUNÇÃO PARA CRIAR TABELAS ==============
-def criar_tabelas_se_necessario():
-    """Cria as tabelas se não existirem"""
+def criar_tabelas_se_necessario(shard=0):
+    """Cria as tabelas se não existirem (no shard informado; o 0 também guarda o diretório)"""
     conn = None
     cursor = None
     try:
-        conn = get_db_connection()
+        conn = get_db_connection(shard=shard)
         cursor = conn.cursor()
         
         # Tabela de usuários
@@ -70,20 +231,36 @@ def criar_tabelas_se_necessario():
             )
         ''')
         
-        # Tabela de transações
+        # Categorias de cada usuário (transacoes referencia pelo id)
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS transacoes (
+            CREATE TABLE IF NOT EXISTS categorias_personalizadas (
                 id SERIAL PRIMARY KEY,
                 usuario_id INTEGER NOT NULL,
+                nome VARCHAR(50) NOT NULL,
+                tipo VARCHAR(10) CHECK(tipo IN ('receita', 'despesa')),
+                cor VARCHAR(7) DEFAULT '#6366F1',
+                data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE,
+                UNIQUE (usuario_id, nome)
+            )
+        ''')
+        
+        # Tabela de transações, particionada por mês (ver particoes.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS transacoes (
+                id SERIAL,
+                usuario_id INTEGER NOT NULL,
                 tipo VARCHAR(10) CHECK(tipo IN ('receita', 'despesa')) NOT NULL,
-                valor DECIMAL(10, 2) NOT NULL,
+                valor_centavos BIGINT NOT NULL,
                 descricao VARCHAR(200) NOT NULL,
-                categoria VARCHAR(50) DEFAULT 'Outros',
+                categoria_id INTEGER NOT NULL REFERENCES categorias_personalizadas(id),
                 data DATE NOT NULL,
                 data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (id, data),
                 FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE
-            )
+            ) PARTITION BY RANGE (data)
         ''')
+        garantir_particoes(cursor)
         
         # Tabela de metas
         cursor.execute('''
@@ -92,8 +269,8 @@ def criar_tabelas_se_necessario():
                 usuario_id INTEGER NOT NULL,
                 titulo VARCHAR(100) NOT NULL,
                 descricao TEXT,
-                valor_alvo DECIMAL(10, 2) NOT NULL,
-                valor_atual DECIMAL(10, 2) DEFAULT 0.00,
+                valor_alvo_centavos BIGINT NOT NULL,
+                valor_atual_centavos BIGINT DEFAULT 0,
                 categoria VARCHAR(50) DEFAULT 'Outros',
                 data_inicio DATE NOT NULL,
                 data_limite DATE,
@@ -115,12 +292,29 @@ def criar_tabelas_se_necessario():
         cursor.execute('''
             CREATE INDEX IF NOT EXISTS idx_metas_usuario_id ON metas(usuario_id);
         ''')
+        criar_colunas_previsao(cursor)
+        
+        migrar_valores_para_centavos(cursor)
+        migrar_categorias_para_ids(cursor)
+        criar_tabelas_arquivo(cursor)
+        criar_tabelas_recorrencias(cursor)
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_transacoes_usuario_categoria ON transacoes(usuario_id, categoria_id);
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_transacoes_usuario_data ON transacoes(usuario_id, data);
+        ''')
+        criar_indices_busca(cursor)
+        
+        if shard == 0:
+            criar_diretorio(cursor)
         
         conn.commit()
-        print("✅ Tabelas criadas/verificadas com sucesso!")
+        logger.info(f"✅ Tabelas criadas/verificadas com sucesso! (shard {shard})")
         
     except Exception as e:
-        print(f"❌ Erro ao criar tabelas: {e}")
+        logger.error(f"❌ Erro ao criar tabelas: {e}")
         if conn:
             conn.rollback()
         raise
@@ -130,11 +324,91 @@ def criar_tabelas_se_necessario():
         if conn:
             conn.close()
 
+# Colunas DECIMAL(10, 2) de bancos antigos que passaram a BIGINT em centavos
+COLUNAS_EM_CENTAVOS = (('transacoes', 'valor'), ('metas', 'valor_alvo'), ('metas', 'valor_atual'))
+TRAVA_MIGRACAO_CENTAVOS = 'simplifica_migrar_centavos'
+
+def colunas_em_reais(cursor):
+    """Colunas de COLUNAS_EM_CENTAVOS ainda no formato antigo (reais em DECIMAL)"""
+    cursor.execute('''
+        SELECT table_name AS tabela, column_name AS coluna FROM information_schema.columns
+        WHERE table_schema = current_schema() AND (table_name, column_name) IN %s
+    ''', (COLUNAS_EM_CENTAVOS,))
+    return [(linha['tabela'], linha['coluna']) for linha in cursor.fetchall()]
+
+def migrar_valores_para_centavos(cursor):
+    """Renomeia valor -> valor_centavos (etc.) convertendo reais em centavos; idempotente
+
+    Banco já migrado: uma consulta e nenhum ALTER TABLE. Com colunas antigas, só um
+    worker faz a conversão (trava até o commit); os demais esperam e não acham
+    mais nada para converter.
+    """
+    if not colunas_em_reais(cursor):
+        return
+    cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', (TRAVA_MIGRACAO_CENTAVOS,))
+    for tabela, coluna in colunas_em_reais(cursor):
+        cursor.execute(f'ALTER TABLE {tabela} ALTER COLUMN {coluna} DROP DEFAULT')
+        cursor.execute(f'ALTER TABLE {tabela} RENAME COLUMN {coluna} TO {coluna}_centavos')
+        cursor.execute(f'''
+            ALTER TABLE {tabela} ALTER COLUMN {coluna}_centavos TYPE BIGINT
+                USING ROUND({coluna}_centavos * 100)::BIGINT
+        ''')
+        if (tabela, coluna) == ('metas', 'valor_atual'):
+            cursor.execute('ALTER TABLE metas ALTER COLUMN valor_atual_centavos SET DEFAULT 0')
+
+def migrar_categorias_para_ids(cursor):
+    """Troca transacoes.categoria (texto) por categoria_id em categorias_personalizadas; idempotente"""
+    cursor.execute('''
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_schema = current_schema()
+                       AND table_name = 'transacoes' AND column_name = 'categoria') THEN
+                ALTER TABLE transacoes ADD COLUMN IF NOT EXISTS categoria_id INTEGER
+                    REFERENCES categorias_personalizadas(id);
+                
+                INSERT INTO categorias_personalizadas (usuario_id, nome, tipo)
+                SELECT usuario_id, COALESCE(NULLIF(TRIM(categoria), ''), 'Outros'), MIN(tipo)
+                FROM transacoes
+                GROUP BY 1, 2
+                ON CONFLICT (usuario_id, nome) DO NOTHING;
+                
+                UPDATE transacoes t SET categoria_id = c.id
+                FROM categorias_personalizadas c
+                WHERE c.usuario_id = t.usuario_id
+                AND c.nome = COALESCE(NULLIF(TRIM(t.categoria), ''), 'Outros');
+                
+                ALTER TABLE transacoes ALTER COLUMN categoria_id SET NOT NULL;
+                ALTER TABLE transacoes DROP COLUMN categoria;
+            END IF;
+        END $$;
+    ''')
+
 # ============== EXECUTA A CRIAÇÃO DAS TABELAS ==============
-try:
-    criar_tabelas_se_necessario()
-except Exception as e:
-    print(f"⚠️  Atenção: Erro ao criar tabelas: {e}")
+# Situação das migrações, exposta no readiness (que tenta de novo se falhou)
+ESTADO_MIGRACOES = {'ok': False, 'erro': None}
+
+def aplicar_migracoes():
+    try:
+        if banco_local:
+            banco_local.criar_tabelas()
+        else:
+            for shard in shards_db:
+                criar_tabelas_se_necessario(shard.numero)
+        ESTADO_MIGRACOES.update(ok=True, erro=None)
+    except Exception as e:
+        ESTADO_MIGRACOES.update(ok=False, erro=str(e))
+        logger.warning(f"⚠️  Atenção: Erro ao criar tabelas: {e}")
+
+aplicar_migracoes()
+
+# Partições dos próximos meses para processos que ficam de pé por dias (uma thread por shard)
+# (SQLite não tem partições)
+manutencoes_particoes = [] if banco_local else [ManutencaoParticoes(nova_conexao)]
+manutencoes_particoes += [ManutencaoParticoes(lambda dsn=dsn: nova_conexao(dsn))
+                          for dsn in shards_config.dsns_configurados()]
+for manutencao in manutencoes_particoes:
+    manutencao.start()
 
 # ============== FUNÇÃO HELPER PARA CORES ==============
 def get_cor_clara(cor_hex, brilho=32):
@@ -164,9 +438,48 @@ def get_cor_clara(cor_hex, brilho=32):
     return "#{:02X}{:02X}{:02X}".format(r, g, b)
 
 # ============== CONFIGURAÇÃO JINJA2 ==============
+# Cache de bytecode em disco: os workers do gunicorn reaproveitam os
+# templates já compilados em vez de recompilar cada um no primeiro acesso.
+# O Jinja executa o bytecode que encontrar ali: sem JINJA_CACHE_DIR usa o
+# diretório padrão dele (por usuário, com dono e modo conferidos); um caminho
+# próprio também precisa ser nosso e fechado, senão o app não sobe
+JINJA_CACHE_DIR = os.getenv('JINJA_CACHE_DIR')
+if JINJA_CACHE_DIR:
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(preparar_diretorio(JINJA_CACHE_DIR))
+else:
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+
+# Em produção os templates não mudam: desliga a checagem de mtime a cada render
+app.config['TEMPLATES_AUTO_RELOAD'] = FLASK_DEBUG
+app.jinja_env.auto_reload = FLASK_DEBUG
+
 app.jinja_env.globals['get_cor_clara'] = get_cor_clara
 app.jinja_env.globals['now'] = datetime.now
 
+# ============== ASSETS ESTÁTICOS ==============
+# Gerados por construir_assets.py (static/dist). Sem o build, os assets de
+# terceiros continuam vindo do CDN e os próprios de /static.
+def carregar_manifesto_assets():
+    try:
+        with open(MANIFESTO, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+MANIFESTO_ASSETS = carregar_manifesto_assets()
+ASSET_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+def asset_url(nome):
+    """URL de um asset pelo nome lógico (ex.: 'css/base.css', 'vendor/bootstrap.min.css')"""
+    caminho = MANIFESTO_ASSETS.get(nome)
+    if caminho:
+        return url_for('servir_asset', caminho=caminho)
+    if nome in ASSETS_VENDOR:
+        return url_cdn(nome)
+    return url_for('static', filename=nome)
+
+app.jinja_env.globals['asset_url'] = asset_url
+
 @app.template_filter('cor_clara')
 def cor_clara_filter(cor_hex, brilho=32):
     return get_cor_clara(cor_hex, brilho)
@@ -178,6 +491,10 @@ def format_currency_filter(value):
     except (ValueError, TypeError):
         return f"R$ {value}"
 
+# Valores em centavos (int): {{ transacao.valor_centavos|moeda }}
+app.jinja_env.filters['moeda'] = formatar_moeda
+app.jinja_env.filters['valor_campo'] = valor_para_campo
+
 @app.context_processor
 def utility_processor():
     return dict(
@@ -200,6 +517,25 @@ def login_required(f):
 def before_request():
     session.permanent = True
 
+# X-Request-ID em cada requisição, presente em todas as linhas de log dela
+log_estruturado.registrar(app)
+
+# Tempo de cada requisição e do banco dentro dela (exposto em /metrics)
+app.before_request(metricas.iniciar_requisicao)
+app.after_request(metricas.finalizar_requisicao)
+
+# Depois de um commit, as leituras do usuário ficam no primário por alguns segundos
+app.after_request(roteador_leituras.marcar_escrita)
+
+# Vagas para rotas com banco; passado o prazo na fila, 503 com Retry-After
+controle_admissao.registrar(app)
+
+# Perfil por amostragem sob demanda (X-Perfilar, PERFILADOR_ROTAS ou 1 a cada N)
+perfilador.registrar(app)
+
+# Orçamento de idas ao banco por rota e aviso de N+1 (dev e testes)
+orcamento_consultas.registrar(app, sempre_ativo=os.getenv('ORCAMENTO_CONSULTAS', 'false').lower() == 'true')
+
 # ============== ROTAS DE AUTENTICAÇÃO ==============
 @app.route('/')
 def index():
@@ -212,6 +548,7 @@ def registro():
     if request.method == 'POST':
         conn = None
         cursor = None
+        usuario_id = None
         try:
             nome = request.form.get('nome', '').strip()
             email = request.form.get('email', '').strip().lower()
@@ -239,20 +576,17 @@ def registro():
             if modo not in ['simples', 'avancado']:
                 modo = 'simples'
             
-            conn = get_db_connection()
-            cursor = conn.cursor()
+            # Id e shard da conta saem do diretório (email repetido: IntegrityError)
+            usuario_id, shard = mapa_shards.reservar(email)
             
-            # Verifica se email já existe
-            cursor.execute('SELECT id FROM usuarios WHERE email = %s', (email,))
-            if cursor.fetchone():
-                flash('Email já cadastrado!', 'danger')
-                return redirect(url_for('registro'))
+            conn = get_db_connection(shard=shard)
+            cursor = conn.cursor()
             
             # Cria novo usuário
             senha_hash = generate_password_hash(senha)
             cursor.execute(
-                'INSERT INTO usuarios (nome, email, senha, modo_interface) VALUES (%s, %s, %s, %s)',
-                (nome, email, senha_hash, modo)
+                'INSERT INTO usuarios (id, nome, email, senha, modo_interface) VALUES (%s, %s, %s, %s, %s)',
+                (usuario_id, nome, email, senha_hash, modo)
             )
             conn.commit()
             
@@ -260,9 +594,13 @@ def registro():
             return redirect(url_for('login'))
             
         except psycopg2.IntegrityError:
+            if usuario_id is not None:
+                mapa_shards.cancelar(usuario_id)
             flash('Email já cadastrado!', 'danger')
             return redirect(url_for('registro'))
         except Exception as e:
+            if usuario_id is not None:
+                mapa_shards.cancelar(usuario_id)
             flash(f'Erro ao criar conta: {str(e)}', 'danger')
             return redirect(url_for('registro'))
         finally:
@@ -286,7 +624,7 @@ def login():
                 flash('Preencha email e senha!', 'danger')
                 return redirect(url_for('login'))
             
-            conn = get_db_connection()
+            conn = get_db_connection(shard=mapa_shards.do_email(email))
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM usuarios WHERE email = %s', (email,))
             usuario = cursor.fetchone()
@@ -317,73 +655,244 @@ def logout():
     flash('Você saiu do sistema.', 'info')
     return redirect(url_for('index'))
 
+# ============== CONSULTAS COMPARTILHADAS (PÁGINAS E FRAGMENTOS) ==============
+def pedido_fragmento():
+    """Indica se a requisição quer só o fragmento HTML (enviada pelo fetch do base.html)"""
+    return request.headers.get('X-Fragmento') == '1'
+
+def colunas_do_usuario(cursor, usuario_id):
+    """Transações do usuário em colunas (analitico.py): memória do worker ou uma consulta"""
+    return motor_analitico.do_usuario(usuario_id, lambda uid: consultar_colunas(cursor, uid))
+
+def consultar_resumo(cursor, usuario_id):
+    """Saldo total e receitas/despesas do mês atual (centavos)"""
+    # Ativas e arquivadas estão nas colunas do motor analítico: sem SUM no banco
+    colunas = colunas_do_usuario(cursor, usuario_id)
+    saldo = saldo_das_colunas(colunas)
+    mes_atual = totais_por_tipo(colunas, *intervalo_mes_atual())
+    
+    # Saldo do mês
+    mes_atual['saldo'] = mes_atual['receitas'] - mes_atual['despesas']
+    return saldo, mes_atual
+
+def filtros_transacoes(args):
+    """Filtros de /transacoes preenchidos na query string (sem os vazios)"""
+    return {campo: args.get(campo) for campo in ('tipo', 'categoria', 'mes', 'busca') if args.get(campo)}
+
+# Transações com o nome da categoria no campo 'categoria', como os templates esperam
+SQL_TRANSACOES_COM_CATEGORIA = '''
+    SELECT t.*, c.nome AS categoria
+    FROM transacoes t
+    JOIN categorias_personalizadas c ON c.id = t.categoria_id
+'''
+SQL_ARQUIVO_COM_CATEGORIA = SQL_TRANSACOES_COM_CATEGORIA.replace('FROM transacoes t', 'FROM transacoes_arquivo t')
+
+def consultar_pagina_transacoes(cursor, usuario_id, filtros, pagina, por_pagina=20):
+    """Uma página de transações filtradas e o total de registros do filtro
+    
+    As arquivadas (sempre mais antigas) vêm depois das ativas na ordenação, então
+    transacoes_arquivo só é lida quando a página passa do fim das ativas (ou para
+    contar o que a busca por descrição encontra lá).
+    """
+    condicoes = ' WHERE t.usuario_id = %s'
+    condicoes_resumo = ' WHERE r.usuario_id = %s'
+    params = [usuario_id]
+    
+    if filtros.get('tipo'):
+        condicoes += ' AND t.tipo = %s'
+        condicoes_resumo += ' AND r.tipo = %s'
+        params.append(filtros['tipo'])
+    if filtros.get('categoria'):
+        # Nome da query string -> id (do cache); categoria que não existe não traz nada
+        condicoes += ' AND t.categoria_id = %s'
+        condicoes_resumo += ' AND r.categoria_id = %s'
+        params.append(cache_categorias.id_por_nome(cursor, usuario_id, filtros['categoria']))
+    if filtros.get('mes'):
+        # Faixa de datas em vez de TO_CHAR: só a partição do mês é lida
+        try:
+            inicio, fim = intervalo_do_mes(filtros['mes'])
+            condicoes += ' AND t.data >= %s AND t.data < %s'
+            condicoes_resumo += ' AND r.mes >= %s AND r.mes < %s'
+            params.extend([inicio, fim])
+        except ValueError:
+            condicoes += ' AND FALSE'  # Mês mal formado não traz nada
+            condicoes_resumo += ' AND FALSE'
+    
+    # Arquivadas pelo resumo, sem tocar em transacoes_arquivo (que só a busca precisa ler)
+    contar_arquivadas = f'SELECT COALESCE(SUM(r.quantidade), 0) FROM resumo_arquivo r{condicoes_resumo}'
+    busca = condicao_busca(filtros.get('busca'), sqlite=banco_local is not None)
+    if busca:
+        # Palavras/começos pelo índice de texto, erros de digitação pelo de trigramas
+        condicoes += busca[0]
+        params.extend(busca[1])
+        contar_arquivadas = f'SELECT COUNT(*) FROM transacoes_arquivo t{condicoes}'
+    
+    cursor.execute(f'''
+        /* consulta: transacoes_contagem */
+        SELECT (SELECT COUNT(*) FROM transacoes t{condicoes}) as total,
+               ({contar_arquivadas})::BIGINT as arquivadas
+    ''', params * 2)
+    contagem = cursor.fetchone()
+    total, arquivadas = contagem['total'], contagem['arquivadas']
+    
+    # Paginação
+    offset = (pagina - 1) * por_pagina
+    transacoes = []
+    if offset < total:
+        query = f'{SQL_TRANSACOES_COM_CATEGORIA}{condicoes} ORDER BY t.data DESC, t.id DESC LIMIT %s OFFSET %s'
+        cursor.execute('/* consulta: transacoes_pagina */' + query, [*params, por_pagina, offset])
+        transacoes = cursor.fetchall()
+    
+    faltam = por_pagina - len(transacoes)
+    if faltam > 0 and arquivadas:
+        query = f'{SQL_ARQUIVO_COM_CATEGORIA}{condicoes} ORDER BY t.data DESC, t.id DESC LIMIT %s OFFSET %s'
+        cursor.execute('/* consulta: transacoes_pagina_arquivo */' + query,
+                       [*params, faltam, max(offset - total, 0)])
+        transacoes = [*transacoes, *cursor.fetchall()]
+    return transacoes, total + arquivadas
+
+def render_fragmento_transacoes(cursor, usuario_id, args, por_pagina=20):
+    """Tabela e paginação de /transacoes para os filtros e a página da query string
+    
+    Se a página pedida deixou de existir (ex.: a última linha dela foi excluída),
+    mostra a última que sobrou.
+    """
+    filtros = filtros_transacoes(args)
+    pagina = max(args.get('pagina', 1, type=int), 1)
+    transacoes, total = consultar_pagina_transacoes(cursor, usuario_id, filtros, pagina, por_pagina)
+    total_paginas = (total + por_pagina - 1) // por_pagina
+    if not transacoes and 0 < total_paginas < pagina:
+        pagina = total_paginas
+        transacoes, total = consultar_pagina_transacoes(cursor, usuario_id, filtros, pagina, por_pagina)
+    
+    return render_template('fragmentos/transacoes.html',
+                           transacoes=transacoes,
+                           filtros=filtros,
+                           pagina_atual=pagina,
+                           total_paginas=total_paginas,
+                           total_transacoes=total)
+
+SQL_COLUNAS_METAS = '''
+    id, titulo, descricao, categoria, valor_alvo_centavos, valor_atual_centavos,
+    (valor_alvo_centavos - valor_atual_centavos) AS valor_faltante_centavos,
+    CASE 
+        WHEN valor_alvo_centavos > 0 THEN 
+            LEAST(GREATEST(valor_atual_centavos * 100.0 / valor_alvo_centavos, 0), 100)::FLOAT
+        ELSE 0 
+    END AS progresso,
+    status, data_inicio, data_limite, data_conclusao, cor,
+    CASE
+        WHEN status = 'ativa' AND data_limite IS NOT NULL AND data_limite < CURRENT_DATE
+        THEN 1 ELSE 0
+    END AS atrasada,
+    CASE 
+        WHEN data_limite IS NOT NULL THEN data_limite - CURRENT_DATE
+        ELSE NULL
+    END AS dias_restantes,
+    previsao_conclusao, aporte_mensal_centavos, ritmo_mensal_centavos, previsao_em,
+    CASE
+        WHEN previsao_conclusao IS NULL OR data_limite IS NULL THEN NULL
+        WHEN previsao_conclusao <= data_limite THEN 1 ELSE 0
+    END AS previsao_no_prazo
+'''
+
+def atualizar_previsoes(cursor, usuario_id):
+    """Previsão das metas ativas do usuário (previsao_metas.py) com o saldo mensal das colunas"""
+    fluxo = fluxo_mensal_colunas(colunas_do_usuario(cursor, usuario_id))
+    prever_metas_usuario(cursor, usuario_id, fluxo, sqlite=bool(banco_local))
+
+def consultar_meta(cursor, usuario_id, meta_id):
+    """Uma meta do usuário com os mesmos campos calculados da listagem"""
+    cursor.execute(f'''
+        /* consulta: meta_card */
+        SELECT {SQL_COLUNAS_METAS}
+        FROM metas
+        WHERE id = %s AND usuario_id = %s
+    ''', (meta_id, usuario_id))
+    return cursor.fetchone()
+
 # ============== DASHBOARD ==============
+# Último dashboard bom de cada usuário, servido quando o banco está fora
+snapshots_dashboard = SnapshotsDashboard()
+
+def consultar_dashboard(cursor, usuario_id):
+    """Agregados do dashboard: resumo, últimas transações e metas ativas"""
+    saldo, mes_atual = consultar_resumo(cursor, usuario_id)
+    
+    # Últimas transações
+    cursor.execute(f'''
+        /* consulta: dashboard_ultimas_transacoes */
+        {SQL_TRANSACOES_COM_CATEGORIA}
+        WHERE t.usuario_id = %s 
+        ORDER BY t.data DESC, t.id DESC 
+        LIMIT 10
+    ''', (usuario_id,))
+    
+    ultimas_transacoes = cursor.fetchall()
+    
+    # Metas ativas
+    cursor.execute('''
+        /* consulta: dashboard_metas_ativas */
+        SELECT titulo, valor_atual_centavos, valor_alvo_centavos, cor,
+               CASE WHEN valor_alvo_centavos > 0
+                    THEN (valor_atual_centavos * 100.0 / valor_alvo_centavos)::FLOAT ELSE 0 END as progresso
+        FROM metas 
+        WHERE usuario_id = %s AND status = 'ativa'
+        ORDER BY data_limite NULLS FIRST
+        LIMIT 5
+    ''', (usuario_id,))
+    
+    metas_ativas = cursor.fetchall()
+    
+    return {'saldo': saldo, 'mes_atual': mes_atual,
+            'transacoes': ultimas_transacoes, 'metas_ativas': metas_ativas}
+
+def coletar_dashboard(usuario_id):
+    """consultar_dashboard com conexão própria (revalidação em segundo plano)
+    
+    Roda fora da requisição: sem sessão, get_db_connection cairia no shard 0,
+    então o shard do usuário vai explícito.
+    """
+    shard, _ = mapa_shards.do_usuario(usuario_id)
+    conn = get_db_connection(shard=shard)
+    try:
+        cursor = conn.cursor()
+        try:
+            return consultar_dashboard(cursor, usuario_id)
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+def renderizar_dashboard(dados, dados_de=None):
+    modo = session.get('user_modo', 'simples')
+    template = 'dashboard_simples.html' if modo == 'simples' else 'dashboard_avancado.html'
+    return render_template(template, dados_de=dados_de, **dados)
+
 @app.route('/dashboard')
 @login_required
 def dashboard():
+    usuario_id = session['user_id']
     conn = None
     cursor = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Saldo total
-        cursor.execute('''
-            SELECT COALESCE(SUM(CASE WHEN tipo = 'receita' THEN valor ELSE -valor END), 0) as saldo
-            FROM transacoes WHERE usuario_id = %s
-        ''', (session['user_id'],))
-        saldo = cursor.fetchone()['saldo'] or 0
+        dados = consultar_dashboard(cursor, usuario_id)
+        snapshots_dashboard.salvar(usuario_id, dados)
         
-        # Receitas e despesas do mês
-        cursor.execute('''
-            SELECT tipo, SUM(valor) as total
-            FROM transacoes 
-            WHERE usuario_id = %s 
-            AND EXTRACT(MONTH FROM data) = EXTRACT(MONTH FROM CURRENT_DATE)
-            AND EXTRACT(YEAR FROM data) = EXTRACT(YEAR FROM CURRENT_DATE)
-            GROUP BY tipo
-        ''', (session['user_id'],))
-        
-        mes_atual = {'receitas': 0, 'despesas': 0}
-        for row in cursor.fetchall():
-            if row['tipo'] == 'receita':
-                mes_atual['receitas'] = float(row['total'] or 0)
-            else:
-                mes_atual['despesas'] = float(row['total'] or 0)
+        return renderizar_dashboard(dados)
         
-        # Saldo do mês
-        mes_atual['saldo'] = mes_atual['receitas'] - mes_atual['despesas']
-        
-        # Últimas transações
-        cursor.execute('''
-            SELECT * FROM transacoes 
-            WHERE usuario_id = %s 
-            ORDER BY data DESC, id DESC 
-            LIMIT 10
-        ''', (session['user_id'],))
-        
-        ultimas_transacoes = cursor.fetchall()
-        
-        # Metas ativas
-        cursor.execute('''
-            SELECT titulo, valor_atual, valor_alvo, cor,
-                   CASE WHEN valor_alvo > 0 THEN (valor_atual / valor_alvo * 100) ELSE 0 END as progresso
-            FROM metas 
-            WHERE usuario_id = %s AND status = 'ativa'
-            ORDER BY data_limite NULLS FIRST
-            LIMIT 5
-        ''', (session['user_id'],))
-        
-        metas_ativas = cursor.fetchall()
-        
-        modo = session.get('user_modo', 'simples')
-        template = 'dashboard_simples.html' if modo == 'simples' else 'dashboard_avancado.html'
-        
-        return render_template(template, 
-                             saldo=saldo, 
-                             mes_atual=mes_atual,
-                             transacoes=ultimas_transacoes,
-                             metas_ativas=metas_ativas)
+    except psycopg2.OperationalError as e:
+        # Banco fora ou lento: mostra o último dashboard bom e revalida em segundo plano
+        dados, gerado_em = snapshots_dashboard.carregar(usuario_id)
+        if dados is None:
+            flash(f'Erro ao carregar dashboard: {str(e)}', 'danger')
+            return redirect(url_for('index'))
+        metricas.registro.incrementar('simplifica_snapshots_servidos_total')
+        snapshots_dashboard.revalidar_em_segundo_plano(usuario_id, lambda: coletar_dashboard(usuario_id))
+        return renderizar_dashboard(dados, dados_de=gerado_em.strftime('%H:%M'))
         
     except Exception as e:
         flash(f'Erro ao carregar dashboard: {str(e)}', 'danger')
@@ -408,15 +917,19 @@ def adicionar_transacao():
                 return redirect(url_for('adicionar_transacao'))
             
             try:
-                valor = float(request.form.get('valor', 0))
+                valor_centavos = para_centavos(request.form.get('valor', '0'))
             except ValueError:
                 flash('Valor inválido!', 'danger')
                 return redirect(url_for('adicionar_transacao'))
             
-            if valor <= 0:
+            if valor_centavos <= 0:
                 flash('Valor deve ser maior que zero!', 'danger')
                 return redirect(url_for('adicionar_transacao'))
             
+            if valor_centavos > VALOR_MAXIMO_CENTAVOS:
+                flash('Valor muito alto!', 'danger')
+                return redirect(url_for('adicionar_transacao'))
+            
             descricao = request.form.get('descricao', '').strip()
             if not descricao or len(descricao) < 3:
                 flash('Descrição deve ter pelo menos 3 caracteres!', 'danger')
@@ -426,9 +939,7 @@ def adicionar_transacao():
                 flash('Descrição muito longa (máximo 200 caracteres)!', 'danger')
                 return redirect(url_for('adicionar_transacao'))
             
-            categoria = request.form.get('categoria', 'Outros').strip()
-            if not categoria:
-                categoria = 'Outros'
+            categoria = request.form.get('categoria', '')
             
             data_str = request.form.get('data')
             if not data_str:
@@ -444,13 +955,54 @@ def adicionar_transacao():
                     flash('Data inválida!', 'danger')
                     return redirect(url_for('adicionar_transacao'))
             
+            # Repetição opcional: a regra gera esta e as próximas ocorrências
+            frequencia = request.form.get('frequencia') or None
+            if frequencia is not None and frequencia not in FREQUENCIAS:
+                flash('Repetição inválida!', 'danger')
+                return redirect(url_for('adicionar_transacao'))
+            
+            data_fim = None
+            if frequencia and request.form.get('data_fim'):
+                try:
+                    data_fim = datetime.strptime(request.form.get('data_fim'), '%Y-%m-%d').date()
+                except ValueError:
+                    flash('Data final inválida!', 'danger')
+                    return redirect(url_for('adicionar_transacao'))
+                if data_fim < data:
+                    flash('A repetição deve terminar depois da primeira data!', 'danger')
+                    return redirect(url_for('adicionar_transacao'))
+            
             conn = get_db_connection()
             cursor = conn.cursor()
+            categoria_id = cache_categorias.obter_ou_criar(cursor, session['user_id'], categoria, tipo)
+            if frequencia:
+                cursor.execute('''
+                    INSERT INTO recorrencias (usuario_id, tipo, valor_centavos, descricao, categoria_id,
+                                              frequencia, data_inicio, data_fim)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id
+                ''', (session['user_id'], tipo, valor_centavos, descricao, categoria_id, frequencia, data, data_fim))
+                # Data no passado: as ocorrências vencidas até hoje saem já
+                materializar(cursor, datetime.now().date(), usuario_id=session['user_id'],
+                             sqlite=banco_local is not None)
+                conn.commit()
+                motor_analitico.invalidar(session['user_id'])
+                indice_sugestoes.registrar(session['user_id'], descricao, normalizar_nome(categoria), tipo, data)
+                
+                mensagem = 'Receita' if tipo == 'receita' else 'Despesa'
+                flash(f'{mensagem} recorrente adicionada com sucesso!', 'success')
+                return redirect(url_for('recorrencias'))
+            
             cursor.execute('''
-                INSERT INTO transacoes (usuario_id, tipo, valor, descricao, categoria, data)
+                INSERT INTO transacoes (usuario_id, tipo, valor_centavos, descricao, categoria_id, data)
                 VALUES (%s, %s, %s, %s, %s, %s)
-            ''', (session['user_id'], tipo, valor, descricao, categoria, data))
+                RETURNING id
+            ''', (session['user_id'], tipo, valor_centavos, descricao, categoria_id, data))
+            transacao_id = cursor.fetchone()['id']
             conn.commit()
+            motor_analitico.adicionar(session['user_id'], transacao_id, tipo, valor_centavos, descricao,
+                                      categoria_id, data)
+            indice_sugestoes.registrar(session['user_id'], descricao, normalizar_nome(categoria), tipo, data)
             
             mensagem = 'Receita' if tipo == 'receita' else 'Despesa'
             flash(f'{mensagem} adicionada com sucesso!', 'success')
@@ -479,59 +1031,28 @@ def listar_transacoes():
     cursor = None
     try:
         # Parâmetros de filtro
-        tipo = request.args.get('tipo')
-        categoria = request.args.get('categoria')
-        mes = request.args.get('mes')
+        filtros = filtros_transacoes(request.args)
         pagina = request.args.get('pagina', 1, type=int)
         por_pagina = 20
         
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Query base
-        query = '''
-            SELECT * FROM transacoes 
-            WHERE usuario_id = %s
-        '''
-        params = [session['user_id']]
-        
-        if tipo:
-            query += ' AND tipo = %s'
-            params.append(tipo)
-        if categoria:
-            query += ' AND categoria = %s'
-            params.append(categoria)
-        if mes:
-            query += ' AND TO_CHAR(data, \'YYYY-MM\') = %s'
-            params.append(mes)
-        
-        # Contar total
-        count_query = query.replace('SELECT *', 'SELECT COUNT(*) as total')
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['total']
-        
-        # Paginação
-        query += ' ORDER BY data DESC, id DESC LIMIT %s OFFSET %s'
-        offset = (pagina - 1) * por_pagina
-        params.extend([por_pagina, offset])
-        
-        cursor.execute(query, params)
-        transacoes = cursor.fetchall()
+        transacoes, total = consultar_pagina_transacoes(cursor, session['user_id'], filtros, pagina, por_pagina)
         
-        # Buscar categorias únicas
-        cursor.execute('''
-            SELECT DISTINCT categoria FROM transacoes 
-            WHERE usuario_id = %s ORDER BY categoria
-        ''', (session['user_id'],))
-        categorias = [row['categoria'] for row in cursor.fetchall()]
+        # Categorias do usuário (cache; sem varrer as transações)
+        categorias = list(cache_categorias.do_usuario(cursor, session['user_id']).values())
         
         # Buscar meses disponíveis
         cursor.execute('''
-            SELECT DISTINCT TO_CHAR(data, 'YYYY-MM') as mes
+            /* consulta: transacoes_meses */
+            SELECT TO_CHAR(data, 'YYYY-MM') as mes
             FROM transacoes 
             WHERE usuario_id = %s 
+            UNION
+            SELECT TO_CHAR(mes, 'YYYY-MM') FROM resumo_arquivo WHERE usuario_id = %s
             ORDER BY mes DESC
-        ''', (session['user_id'],))
+        ''', (session['user_id'], session['user_id']))
         meses = [row['mes'] for row in cursor.fetchall()]
         
         total_paginas = (total + por_pagina - 1) // por_pagina
@@ -543,6 +1064,7 @@ def listar_transacoes():
                              transacoes=transacoes,
                              categorias=categorias,
                              meses=meses,
+                             filtros=filtros,
                              pagina_atual=pagina,
                              total_paginas=total_paginas,
                              total_transacoes=total)
@@ -565,16 +1087,25 @@ def excluir_transacao(id):
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute('SELECT id FROM transacoes WHERE id = %s AND usuario_id = %s', 
+        cursor.execute('DELETE FROM transacoes WHERE id = %s AND usuario_id = %s', 
                       (id, session['user_id']))
         
-        if not cursor.fetchone():
+        # Não estava entre as ativas: pode ter ido para o arquivo
+        if not cursor.rowcount and (banco_local or not excluir_arquivada(cursor, session['user_id'], id)):
+            conn.rollback()
             flash('Transação não encontrada!', 'danger')
             return redirect(request.referrer or url_for('dashboard'))
         
-        cursor.execute('DELETE FROM transacoes WHERE id = %s AND usuario_id = %s', 
-                      (id, session['user_id']))
         conn.commit()
+        motor_analitico.remover(session['user_id'], id)
+        
+        # Chamada pelo fetch: na lista de /transacoes (com a página na URL) devolve
+        # tabela e paginação refeitas, para o total e as páginas não ficarem velhos;
+        # nos dashboards a linha é removida e o resumo atualizado por data-atualizar
+        if pedido_fragmento():
+            if 'pagina' in request.args:
+                return render_fragmento_transacoes(cursor, session['user_id'], request.args)
+            return '', 204
         
         flash('Transação excluída com sucesso!', 'success')
         
@@ -588,6 +1119,67 @@ def excluir_transacao(id):
     
     return redirect(request.referrer or url_for('dashboard'))
 
+@app.route('/recorrencias')
+@login_required
+def recorrencias():
+    """Regras de repetição do usuário (as ocorrências aparecem como transações comuns)"""
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            /* consulta: recorrencias_lista */
+            SELECT r.id, r.tipo, r.valor_centavos, r.descricao, r.frequencia, r.data_inicio, r.data_fim,
+                   r.ativa, r.gerada_ate, c.nome AS categoria
+            FROM recorrencias r
+            JOIN categorias_personalizadas c ON c.id = r.categoria_id
+            WHERE r.usuario_id = %s
+            ORDER BY r.ativa DESC, r.data_inicio DESC, r.id DESC
+        ''', (session['user_id'],))
+        regras = cursor.fetchall()
+        return render_template('recorrencias.html', recorrencias=regras)
+        
+    except Exception as e:
+        flash(f'Erro ao carregar recorrências: {str(e)}', 'danger')
+        return redirect(url_for('dashboard'))
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+@app.route('/encerrar-recorrencia/<int:id>')
+@login_required
+def encerrar_recorrencia(id):
+    """Para de gerar ocorrências; as já lançadas continuam como transações"""
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('UPDATE recorrencias SET ativa = FALSE WHERE id = %s AND usuario_id = %s',
+                      (id, session['user_id']))
+        
+        if not cursor.rowcount:
+            conn.rollback()
+            flash('Recorrência não encontrada!', 'danger')
+            return redirect(url_for('recorrencias'))
+        
+        conn.commit()
+        flash('Recorrência encerrada!', 'success')
+        
+    except Exception as e:
+        flash(f'Erro ao encerrar recorrência: {str(e)}', 'danger')
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+    
+    return redirect(url_for('recorrencias'))
+
 # ============== CONFIGURAÇÕES ==============
 @app.route('/configuracoes', methods=['GET', 'POST'])
 @login_required
@@ -672,6 +1264,40 @@ def configuracoes():
     return render_template('configuracoes.html')
 
 # ============== RELATÓRIOS ==============
+# Período de /relatorios: meses até o atual (None: histórico inteiro; 'ano': desde janeiro)
+PERIODOS_RELATORIO = {'tudo': None, 'mes': 1, '3meses': 3, '6meses': 6, 'ano': None}
+
+def periodo_relatorio(args, hoje=None):
+    """(de, ate) do filtro de /relatorios: 'de'/'ate' (AAAA-MM) ou ?periodo= de PERIODOS_RELATORIO"""
+    hoje = hoje or datetime.now().date()
+    try:
+        de = intervalo_do_mes(args['de'])[0] if args.get('de') else None
+        ate = intervalo_do_mes(args['ate'])[1] if args.get('ate') else None
+    except ValueError:
+        de = ate = None
+    if de or ate:
+        return de, ate
+    periodo = args.get('periodo')
+    if periodo == 'ano':
+        return hoje.replace(month=1, day=1), None
+    meses = PERIODOS_RELATORIO.get(periodo)
+    return (somar_meses(inicio_do_mes(hoje), 1 - meses) if meses else None), None
+
+def totais_com_nome_da_categoria(somas, nomes):
+    """Troca categoria_id pelo nome nos totais por categoria (analitico.somas_por_categoria)"""
+    return [{'categoria': nomes.get(categoria_id, 'Outros'), 'total': total, 'quantidade': quantidade}
+            for categoria_id, total, quantidade in somas]
+
+def evolucao_mensal_colunas(colunas, de, ate, hoje=None):
+    """Até 12 meses do período (terminando no último), com média móvel de 3 meses das despesas"""
+    fim = numero_do_mes(ate - timedelta(days=1) if ate else (hoje or datetime.now().date()))
+    inicio = fim - 11 if de is None else max(fim - 11, numero_do_mes(de))
+    meses, receitas, despesas, quantidades = serie_mensal(colunas, inicio, fim)
+    media_despesas = media_movel(despesas, 3)
+    return [{'mes': mes_do_numero(int(meses[i])), 'receitas': int(receitas[i]), 'despesas': int(despesas[i]),
+             'saldo': int(receitas[i] - despesas[i]), 'media_despesas': int(round(media_despesas[i]))}
+            for i in reversed(range(len(meses))) if quantidades[i]]
+
 @app.route('/relatorios')
 @login_required
 def relatorios():
@@ -684,61 +1310,32 @@ def relatorios():
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
+        usuario_id = session['user_id']
+        de, ate = periodo_relatorio(request.args)
         
-        # Despesas por categoria
-        cursor.execute('''
-            SELECT categoria, SUM(valor) as total
-            FROM transacoes
-            WHERE usuario_id = %s AND tipo = 'despesa'
-            GROUP BY categoria
-            ORDER BY total DESC
-        ''', (session['user_id'],))
+        # Tudo sai das colunas em memória (analitico.py): no máximo uma consulta para carregá-las
+        colunas = colunas_do_usuario(cursor, usuario_id)
+        despesas = somas_por_categoria(colunas, 'despesa', de, ate)
+        receitas = somas_por_categoria(colunas, 'receita', de, ate)
+        top_despesas = [transacao(colunas, posicao) for posicao in maiores(colunas, 'despesa', 5, de, ate)]
         
-        despesas_categoria = cursor.fetchall()
+        ids_categorias = {soma[0] for soma in despesas + receitas} | {t['categoria_id'] for t in top_despesas}
+        nomes = cache_categorias.nomes(cursor, usuario_id, ids_categorias)
+        despesas_categoria = totais_com_nome_da_categoria(despesas, nomes)
+        receitas_categoria = totais_com_nome_da_categoria(receitas, nomes)
+        for linha in top_despesas:
+            linha['categoria'] = nomes.get(linha['categoria_id'], 'Outros')
         
-        # Receitas por categoria
-        cursor.execute('''
-            SELECT categoria, SUM(valor) as total
-            FROM transacoes
-            WHERE usuario_id = %s AND tipo = 'receita'
-            GROUP BY categoria
-            ORDER BY total DESC
-        ''', (session['user_id'],))
-        
-        receitas_categoria = cursor.fetchall()
-        
-        # Evolução mensal
-        cursor.execute('''
-            SELECT 
-                TO_CHAR(data, 'YYYY-MM') as mes,
-                SUM(CASE WHEN tipo = 'receita' THEN valor ELSE 0 END) as receitas,
-                SUM(CASE WHEN tipo = 'despesa' THEN valor ELSE 0 END) as despesas,
-                SUM(CASE WHEN tipo = 'receita' THEN valor ELSE -valor END) as saldo
-            FROM transacoes
-            WHERE usuario_id = %s
-            GROUP BY mes
-            ORDER BY mes DESC
-            LIMIT 12
-        ''', (session['user_id'],))
-        
-        evolucao_mensal = cursor.fetchall()
-        
-        # Top 5 despesas
-        cursor.execute('''
-            SELECT descricao, categoria, valor, data
-            FROM transacoes
-            WHERE usuario_id = %s AND tipo = 'despesa'
-            ORDER BY valor DESC
-            LIMIT 5
-        ''', (session['user_id'],))
-        
-        top_despesas = cursor.fetchall()
+        evolucao_mensal = evolucao_mensal_colunas(colunas, de, ate)
         
         return render_template('relatorios.html', 
                              despesas_categoria=despesas_categoria,
                              receitas_categoria=receitas_categoria,
                              evolucao_mensal=evolucao_mensal,
-                             top_despesas=top_despesas)
+                             top_despesas=top_despesas,
+                             periodo=request.args.get('periodo', 'tudo'),
+                             de=request.args.get('de', ''),
+                             ate=request.args.get('ate', ''))
         
     except Exception as e:
         flash(f'Erro ao carregar relatórios: {str(e)}', 'danger')
@@ -759,28 +1356,9 @@ def metas():
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT 
-                id, titulo, descricao, categoria, valor_alvo, valor_atual,
-                (valor_alvo - valor_atual) AS valor_faltante,
-                CASE 
-                    WHEN valor_alvo > 0 THEN 
-                        CASE 
-                            WHEN (valor_atual / valor_alvo * 100) > 100 THEN 100
-                            WHEN (valor_atual / valor_alvo * 100) < 0 THEN 0
-                            ELSE (valor_atual / valor_alvo * 100)
-                        END
-                    ELSE 0 
-                END AS progresso,
-                status, data_inicio, data_limite, data_conclusao, cor,
-                CASE
-                    WHEN status = 'ativa' AND data_limite IS NOT NULL AND data_limite < CURRENT_DATE
-                    THEN 1 ELSE 0
-                END AS atrasada,
-                CASE 
-                    WHEN data_limite IS NOT NULL THEN data_limite - CURRENT_DATE
-                    ELSE NULL
-                END AS dias_restantes
+        cursor.execute(f'''
+            /* consulta: metas_lista */
+            SELECT {SQL_COLUNAS_METAS}
             FROM metas
             WHERE usuario_id = %s
             ORDER BY
@@ -796,12 +1374,13 @@ def metas():
         
         # Estatísticas
         cursor.execute('''
+            /* consulta: metas_estatisticas */
             SELECT
                 COUNT(*) AS total_metas,
                 SUM(CASE WHEN status = 'ativa' THEN 1 ELSE 0 END) AS metas_ativas,
                 SUM(CASE WHEN status = 'concluida' THEN 1 ELSE 0 END) AS metas_concluidas,
-                COALESCE(SUM(valor_atual), 0) AS total_economizado,
-                COALESCE(SUM(CASE WHEN status = 'ativa' THEN valor_alvo ELSE 0 END), 0) AS total_objetivo
+                COALESCE(SUM(valor_atual_centavos), 0)::BIGINT AS total_economizado,
+                COALESCE(SUM(CASE WHEN status = 'ativa' THEN valor_alvo_centavos ELSE 0 END), 0)::BIGINT AS total_objetivo
             FROM metas WHERE usuario_id = %s
         ''', (session['user_id'],))
         
@@ -811,8 +1390,8 @@ def metas():
             'total_metas': int(stat['total_metas'] or 0),
             'metas_ativas': int(stat['metas_ativas'] or 0),
             'metas_concluidas': int(stat['metas_concluidas'] or 0),
-            'total_economizado': float(stat['total_economizado'] or 0),
-            'total_objetivo': float(stat['total_objetivo'] or 0),
+            'total_economizado': stat['total_economizado'] or 0,
+            'total_objetivo': stat['total_objetivo'] or 0,
         }
         
         if estatisticas['total_objetivo'] > 0:
@@ -824,6 +1403,7 @@ def metas():
         
         # Metas próximas
         cursor.execute('''
+            /* consulta: metas_proximas */
             SELECT id, titulo, data_limite, data_limite - CURRENT_DATE as dias_restantes
             FROM metas
             WHERE usuario_id = %s AND status = 'ativa' AND data_limite IS NOT NULL
@@ -862,7 +1442,7 @@ def adicionar_meta():
         descricao = request.form.get('descricao', '').strip()
         
         try:
-            valor_alvo = float(request.form.get('valor_alvo', 0))
+            valor_alvo_centavos = para_centavos(request.form.get('valor_alvo', '0'))
         except ValueError:
             flash('Valor alvo inválido!', 'danger')
             return redirect(url_for('metas'))
@@ -876,10 +1456,14 @@ def adicionar_meta():
             flash('Título deve ter pelo menos 3 caracteres!', 'danger')
             return redirect(url_for('metas'))
         
-        if valor_alvo <= 0:
+        if valor_alvo_centavos <= 0:
             flash('Valor alvo deve ser maior que zero!', 'danger')
             return redirect(url_for('metas'))
         
+        if valor_alvo_centavos > VALOR_MAXIMO_CENTAVOS:
+            flash('Valor alvo muito alto!', 'danger')
+            return redirect(url_for('metas'))
+        
         try:
             data_inicio = datetime.strptime(data_inicio_str, '%Y-%m-%d').date()
             if data_inicio > datetime.now().date():
@@ -903,9 +1487,10 @@ def adicionar_meta():
         conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute('''
-            INSERT INTO metas (usuario_id, titulo, descricao, valor_alvo, categoria, data_inicio, data_limite, cor)
+            INSERT INTO metas (usuario_id, titulo, descricao, valor_alvo_centavos, categoria, data_inicio, data_limite, cor)
             VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        ''', (session['user_id'], titulo, descricao, valor_alvo, categoria, data_inicio, data_limite, cor))
+        ''', (session['user_id'], titulo, descricao, valor_alvo_centavos, categoria, data_inicio, data_limite, cor))
+        atualizar_previsoes(cursor, session['user_id'])
         conn.commit()
         
         flash('Meta criada com sucesso!', 'success')
@@ -934,12 +1519,12 @@ def adicionar_valor_meta():
             return redirect(url_for('metas'))
         
         try:
-            valor = float(valor_str)
+            valor_centavos = para_centavos(valor_str)
         except ValueError:
             flash('Valor inválido!', 'danger')
             return redirect(url_for('metas'))
         
-        if valor <= 0:
+        if valor_centavos <= 0:
             flash('Valor deve ser maior que zero!', 'danger')
             return redirect(url_for('metas'))
         
@@ -947,7 +1532,7 @@ def adicionar_valor_meta():
         cursor = conn.cursor()
         
         cursor.execute('''
-            SELECT valor_atual, valor_alvo FROM metas 
+            SELECT valor_atual_centavos, valor_alvo_centavos FROM metas 
             WHERE id = %s AND usuario_id = %s AND status = 'ativa'
         ''', (meta_id, session['user_id']))
         
@@ -956,23 +1541,36 @@ def adicionar_valor_meta():
             flash('Meta não encontrada ou não está ativa!', 'danger')
             return redirect(url_for('metas'))
         
-        novo_valor = float(meta['valor_atual']) + valor
+        novo_valor_centavos = (meta['valor_atual_centavos'] or 0) + valor_centavos
+        if novo_valor_centavos > VALOR_MAXIMO_CENTAVOS:
+            flash('Valor muito alto!', 'danger')
+            return redirect(url_for('metas'))
         
         cursor.execute('''
-            UPDATE metas SET valor_atual = %s WHERE id = %s AND usuario_id = %s
-        ''', (novo_valor, meta_id, session['user_id']))
+            UPDATE metas SET valor_atual_centavos = %s WHERE id = %s AND usuario_id = %s
+        ''', (novo_valor_centavos, meta_id, session['user_id']))
         conn.commit()
         
-        if novo_valor >= float(meta['valor_alvo']):
+        if novo_valor_centavos >= meta['valor_alvo_centavos']:
             cursor.execute('''
                 UPDATE metas SET status = 'concluida', data_conclusao = CURRENT_TIMESTAMP 
                 WHERE id = %s AND usuario_id = %s
             ''', (meta_id, session['user_id']))
             conn.commit()
-            flash('Parabéns! Meta concluída! 🎉', 'success')
-        else:
+            if not pedido_fragmento():
+                flash('Parabéns! Meta concluída! 🎉', 'success')
+        elif not pedido_fragmento():
             flash('Valor adicionado à meta com sucesso!', 'success')
         
+        # Ritmo da meta mudou (e, se concluiu, a parte das outras no saldo mensal)
+        atualizar_previsoes(cursor, session['user_id'])
+        conn.commit()
+        
+        # Chamada pelo fetch: devolve só o card atualizado da meta
+        if pedido_fragmento():
+            return render_template('fragmentos/meta_card.html',
+                                   meta=consultar_meta(cursor, session['user_id'], meta_id))
+        
     except Exception as e:
         flash(f'Erro ao adicionar valor: {str(e)}', 'danger')
     finally:
@@ -1002,6 +1600,7 @@ def concluir_meta(id):
             UPDATE metas SET status = 'concluida', data_conclusao = CURRENT_TIMESTAMP 
             WHERE id = %s AND usuario_id = %s
         ''', (id, session['user_id']))
+        atualizar_previsoes(cursor, session['user_id'])
         conn.commit()
         
         flash('Meta marcada como concluída!', 'success')
@@ -1027,7 +1626,7 @@ def editar_meta():
         descricao = request.form.get('descricao', '').strip()
         
         try:
-            valor_alvo = float(request.form.get('valor_alvo', 0))
+            valor_alvo_centavos = para_centavos(request.form.get('valor_alvo', '0'))
         except ValueError:
             flash('Valor alvo inválido!', 'danger')
             return redirect(url_for('metas'))
@@ -1040,10 +1639,14 @@ def editar_meta():
             flash('Título deve ter pelo menos 3 caracteres!', 'danger')
             return redirect(url_for('metas'))
         
-        if valor_alvo <= 0:
+        if valor_alvo_centavos <= 0:
             flash('Valor alvo deve ser maior que zero!', 'danger')
             return redirect(url_for('metas'))
         
+        if valor_alvo_centavos > VALOR_MAXIMO_CENTAVOS:
+            flash('Valor alvo muito alto!', 'danger')
+            return redirect(url_for('metas'))
+        
         data_limite = None
         if data_limite_str:
             try:
@@ -1064,9 +1667,10 @@ def editar_meta():
         
         cursor.execute('''
             UPDATE metas 
-            SET titulo = %s, descricao = %s, valor_alvo = %s, categoria = %s, data_limite = %s, cor = %s
+            SET titulo = %s, descricao = %s, valor_alvo_centavos = %s, categoria = %s, data_limite = %s, cor = %s
             WHERE id = %s AND usuario_id = %s
-        ''', (titulo, descricao, valor_alvo, categoria, data_limite, cor, meta_id, session['user_id']))
+        ''', (titulo, descricao, valor_alvo_centavos, categoria, data_limite, cor, meta_id, session['user_id']))
+        atualizar_previsoes(cursor, session['user_id'])
         conn.commit()
         
         flash('Meta atualizada com sucesso!', 'success')
@@ -1099,6 +1703,7 @@ def excluir_meta(id):
         
         cursor.execute('DELETE FROM metas WHERE id = %s AND usuario_id = %s', 
                       (id, session['user_id']))
+        atualizar_previsoes(cursor, session['user_id'])
         conn.commit()
         
         flash('Meta excluída com sucesso!', 'success')
@@ -1113,26 +1718,146 @@ def excluir_meta(id):
     
     return redirect(url_for('metas'))
 
+# ============== FRAGMENTOS (ATUALIZAÇÃO PARCIAL) ==============
+@app.route('/fragmentos/resumo')
+@login_required
+def fragmento_resumo():
+    """Cards de resumo do dashboard: só as consultas de saldo e do mês"""
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        saldo, mes_atual = consultar_resumo(cursor, session['user_id'])
+        
+        modo = session.get('user_modo', 'simples')
+        template = 'fragmentos/resumo_simples.html' if modo == 'simples' else 'fragmentos/resumo_avancado.html'
+        return render_template(template, saldo=saldo, mes_atual=mes_atual)
+        
+    except Exception as e:
+        flash(f'Erro ao carregar resumo: {str(e)}', 'danger')
+        return redirect(url_for('dashboard'))
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+@app.route('/fragmentos/transacoes')
+@login_required
+def fragmento_transacoes():
+    """Corpo da tabela e paginação de /transacoes, sem recarregar os filtros"""
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        return render_fragmento_transacoes(cursor, session['user_id'], request.args)
+        
+    except Exception as e:
+        flash(f'Erro ao carregar transações: {str(e)}', 'danger')
+        return redirect(url_for('listar_transacoes'))
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+@app.route('/fragmentos/meta/<int:id>')
+@login_required
+def fragmento_meta(id):
+    """Card de uma única meta"""
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        meta = consultar_meta(cursor, session['user_id'], id)
+        if not meta:
+            abort(404)
+        return render_template('fragmentos/meta_card.html', meta=meta)
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+# ============== SUGESTÕES (AUTOCOMPLETAR) ==============
+def carregar_sugestoes(usuario_id):
+    """Usos de descrições e categorias, do banco (índice fora da memória e sem cópia em disco)"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        try:
+            return consultar_usos(cursor, usuario_id)
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+@app.route('/sugestoes')
+@login_required
+def sugestoes():
+    """Descrições ou categorias já usadas que combinam com ?q= (JSON, mais usadas e recentes primeiro)"""
+    campo = request.args.get('campo', 'descricao')
+    if campo not in CAMPOS_SUGESTAO:
+        abort(400)
+    tipo = request.args.get('tipo')
+    encontradas = indice_sugestoes.buscar(session['user_id'], campo, request.args.get('q', '')[:100],
+                                          carregar_sugestoes,
+                                          tipo=tipo if tipo in ('receita', 'despesa') else None)
+    return {'sugestoes': encontradas}, 200, {'Cache-Control': 'private, no-store'}
+
 # ============== EXPORTAÇÃO ==============
+def origem_exportacao(usuario_id, args):
+    """Transações a exportar ('desde=AAAA-MM' opcional) como subconsulta 't' e seus parâmetros
+    
+    transacoes_arquivo só entra quando o período começa antes do corte do arquivo
+    (sem 'desde' o extrato é o histórico inteiro).
+    """
+    try:
+        desde = intervalo_do_mes(args['desde'])[0] if args.get('desde') else None
+    except ValueError:
+        desde = None
+    periodo = ' AND data >= %s' if desde else ''
+    params = [usuario_id, desde] if desde else [usuario_id]
+    origem = f'SELECT {COLUNAS_TRANSACAO} FROM transacoes WHERE usuario_id = %s{periodo}'
+    if desde is None or desde < corte_do_arquivo():
+        origem += f' UNION ALL SELECT {COLUNAS_TRANSACAO} FROM transacoes_arquivo WHERE usuario_id = %s{periodo}'
+        params = params * 2
+    return f'({origem}) t', params, desde
+
 @app.route('/exportar/excel')
 @login_required
 def exportar_excel():
     conn = None
     try:
         conn = get_db_connection()
-        query = """
+        origem, params, _ = origem_exportacao(session['user_id'], request.args)
+        query = f"""
+            /* consulta: exportar_excel_transacoes */
             SELECT 
-                CASE tipo WHEN 'receita' THEN 'Receita' ELSE 'Despesa' END as "Tipo",
-                categoria as "Categoria",
-                descricao as "Descrição",
-                valor as "Valor",
-                TO_CHAR(data, 'DD/MM/YYYY') as "Data"
-            FROM transacoes 
-            WHERE usuario_id = %s 
-            ORDER BY data DESC
+                CASE t.tipo WHEN 'receita' THEN 'Receita' ELSE 'Despesa' END as "Tipo",
+                c.nome as "Categoria",
+                t.descricao as "Descrição",
+                t.valor_centavos as "Valor",
+                TO_CHAR(t.data, 'DD/MM/YYYY') as "Data"
+            FROM {origem}
+            JOIN categorias_personalizadas c ON c.id = t.categoria_id
+            ORDER BY t.data DESC
         """
         
-        df = pd.read_sql_query(query, conn, params=(session['user_id'],))
+        # Pelo cursor do app (psycopg2 ou SQLite): read_sql_query leria as Linhas como tuplas de chaves
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        df = pd.DataFrame.from_records(cursor.fetchall(), columns=[coluna[0] for coluna in cursor.description])
+        cursor.close()
+        
+        # Somas em int64 (centavos); reais só na hora de gravar a planilha
+        centavos = df['Valor'].astype('int64')
+        total_receitas = int(centavos[df['Tipo'] == 'Receita'].sum())
+        total_despesas = int(centavos[df['Tipo'] == 'Despesa'].sum())
+        df['Valor'] = centavos / 100  # Excel guarda número em ponto flutuante de qualquer jeito
         
         output = io.BytesIO()
         
@@ -1143,9 +1868,9 @@ def exportar_excel():
             resumo_data = {
                 'Métrica': ['Total Receitas', 'Total Despesas', 'Saldo'],
                 'Valor': [
-                    df[df['Tipo'] == 'Receita']['Valor'].sum(),
-                    df[df['Tipo'] == 'Despesa']['Valor'].sum(),
-                    df[df['Tipo'] == 'Receita']['Valor'].sum() - df[df['Tipo'] == 'Despesa']['Valor'].sum()
+                    para_reais(total_receitas),
+                    para_reais(total_despesas),
+                    para_reais(total_receitas - total_despesas)
                 ]
             }
             resumo_df = pd.DataFrame(resumo_data)
@@ -1161,7 +1886,7 @@ def exportar_excel():
         )
 
     except Exception as e:
-        print(f"Erro export Excel: {e}")
+        logger.exception(f"Erro export Excel: {e}")
         flash(f'Erro ao exportar Excel: {str(e)}', 'danger')
         return redirect(url_for('dashboard'))
     finally:
@@ -1176,27 +1901,46 @@ def exportar_pdf():
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
+        origem, params, desde = origem_exportacao(session['user_id'], request.args)
         
-        cursor.execute("""
+        # As 50 mais recentes: com o arquivo na origem, o Merge Append para nas 50
+        cursor.execute(f"""
+            /* consulta: exportar_pdf_transacoes */
             SELECT 
-                tipo, categoria, descricao, valor, data,
-                TO_CHAR(data, 'DD/MM/YYYY') as data_formatada
-            FROM transacoes 
-            WHERE usuario_id = %s 
-            ORDER BY data DESC
+                t.tipo, c.nome AS categoria, t.descricao, t.valor_centavos, t.data,
+                TO_CHAR(t.data, 'DD/MM/YYYY') as data_formatada
+            FROM {origem}
+            JOIN categorias_personalizadas c ON c.id = t.categoria_id
+            ORDER BY t.data DESC
             LIMIT 50
-        """, (session['user_id'],))
+        """, params)
         
         transacoes = cursor.fetchall()
         
-        cursor.execute("""
+        # Totais do arquivo pelo resumo mensal, sem ler transacoes_arquivo
+        periodo = ' AND data >= %s' if desde else ''
+        periodo_resumo = ' AND mes >= %s' if desde else ''
+        params_resumo = [session['user_id'], desde] if desde else [session['user_id']]
+        cursor.execute(f"""
+            /* consulta: exportar_pdf_resumo */
             SELECT 
-                SUM(CASE WHEN tipo = 'receita' THEN valor ELSE 0 END) as total_receitas,
-                SUM(CASE WHEN tipo = 'despesa' THEN valor ELSE 0 END) as total_despesas,
-                SUM(CASE WHEN tipo = 'receita' THEN valor ELSE -valor END) as saldo
-            FROM transacoes 
-            WHERE usuario_id = %s
-        """, (session['user_id'],))
+                SUM(receitas)::BIGINT as total_receitas,
+                SUM(despesas)::BIGINT as total_despesas,
+                SUM(receitas - despesas)::BIGINT as saldo
+            FROM (
+                SELECT
+                    SUM(CASE WHEN tipo = 'receita' THEN valor_centavos ELSE 0 END) as receitas,
+                    SUM(CASE WHEN tipo = 'despesa' THEN valor_centavos ELSE 0 END) as despesas
+                FROM transacoes 
+                WHERE usuario_id = %s{periodo}
+                UNION ALL
+                SELECT
+                    SUM(CASE WHEN tipo = 'receita' THEN total_centavos ELSE 0 END),
+                    SUM(CASE WHEN tipo = 'despesa' THEN total_centavos ELSE 0 END)
+                FROM resumo_arquivo
+                WHERE usuario_id = %s{periodo_resumo}
+            ) totais
+        """, params_resumo * 2)
         
         resumo = cursor.fetchone()
         
@@ -1222,9 +1966,9 @@ def exportar_pdf():
         pdf.set_font('Arial', 'B', 12)
         pdf.cell(0, 10, 'Resumo Financeiro', 0, 1)
         pdf.set_font('Arial', '', 10)
-        pdf.cell(0, 8, f'Total Receitas: R$ {resumo["total_receitas"] or 0:,.2f}'.replace(',', 'X').replace('.', ',').replace('X', '.'), 0, 1)
-        pdf.cell(0, 8, f'Total Despesas: R$ {resumo["total_despesas"] or 0:,.2f}'.replace(',', 'X').replace('.', ',').replace('X', '.'), 0, 1)
-        pdf.cell(0, 8, f'Saldo: R$ {resumo["saldo"] or 0:,.2f}'.replace(',', 'X').replace('.', ',').replace('X', '.'), 0, 1)
+        pdf.cell(0, 8, f'Total Receitas: {formatar_moeda(resumo["total_receitas"])}', 0, 1)
+        pdf.cell(0, 8, f'Total Despesas: {formatar_moeda(resumo["total_despesas"])}', 0, 1)
+        pdf.cell(0, 8, f'Saldo: {formatar_moeda(resumo["saldo"])}', 0, 1)
         pdf.ln(10)
         
         # Tabela de transações
@@ -1260,7 +2004,7 @@ def exportar_pdf():
             # Descrição
             pdf.cell(col_widths[3], 10, t['descricao'][:30], 1, 0, 'L')
             # Valor
-            valor_text = f"R$ {t['valor']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+            valor_text = formatar_moeda(t['valor_centavos'])
             pdf.cell(col_widths[4], 10, valor_text, 1, 1, 'R')
         
         return send_file(
@@ -1271,7 +2015,7 @@ def exportar_pdf():
         )
 
     except Exception as e:
-        print(f"Erro export PDF: {e}")
+        logger.exception(f"Erro export PDF: {e}")
         flash(f'Erro ao exportar PDF: {str(e)}', 'danger')
         return redirect(url_for('dashboard'))
     finally:
@@ -1280,25 +2024,101 @@ def exportar_pdf():
         if conn:
             conn.close()
 
+# ============== ASSETS COM FINGERPRINT ==============
+@app.route('/assets/<path:caminho>')
+def servir_asset(caminho):
+    """Serve static/dist com cache imutável, preferindo as versões pré-compactadas"""
+    mimetype = mimetypes.guess_type(caminho)[0] or 'application/octet-stream'
+    
+    for codificacao, extensao in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[codificacao] and (DIST_DIR / (caminho + extensao)).is_file():
+            resposta = send_from_directory(DIST_DIR, caminho + extensao, mimetype=mimetype)
+            resposta.headers['Content-Encoding'] = codificacao
+            break
+    else:
+        resposta = send_from_directory(DIST_DIR, caminho, mimetype=mimetype)
+    
+    resposta.headers['Cache-Control'] = ASSET_CACHE_CONTROL
+    resposta.headers['Vary'] = 'Accept-Encoding'
+    return resposta
+
 # ============== ROTAS DE DEBUG E SAÚDE ==============
+# Resultado do readiness reaproveitado por alguns segundos entre as sondas
+PRONTIDAO_TTL = float(os.getenv('PRONTIDAO_TTL', 5))
+PRONTIDAO_SATURACAO_MAX = float(os.getenv('PRONTIDAO_SATURACAO_MAX', 1.0))
+_prontidao = {'resultado': None, 'verificado_em': 0.0}
+
+def verificar_prontidao():
+    """Banco, migrações e pool; consulta o banco só se nenhuma consulta recente deu certo"""
+    idade = metricas.idade_ultima_consulta()
+    erro = None
+    if idade is None or idade > PRONTIDAO_TTL:
+        conn = None
+        try:
+            # A sonda não entra na fila de espera do pool
+            conn = banco_local.obter() if banco_local else pool_db.obter(espera=0)
+            cursor = conn.cursor()
+            cursor.execute('/* consulta: health */ SELECT 1')
+            cursor.close()
+            idade = 0.0
+        except Exception as e:
+            erro = str(e)
+        finally:
+            if conn:
+                conn.close()
+
+    if not ESTADO_MIGRACOES['ok'] and erro is None:
+        aplicar_migracoes()
+
+    pool = pool_db.estado()
+    pronto = erro is None and ESTADO_MIGRACOES['ok'] and pool['saturacao'] < PRONTIDAO_SATURACAO_MAX
+    return {
+        'status': 'ready' if pronto else 'not_ready',
+        'database': 'connected' if erro is None else 'unavailable',
+        'erro': erro or ESTADO_MIGRACOES['erro'],
+        'migracoes': 'ok' if ESTADO_MIGRACOES['ok'] else 'pendentes',
+        'idade_ultima_consulta_s': None if idade is None else round(idade, 3),
+        'pool': pool,
+        'replicas': roteador_leituras.estado(),
+    }
+
+@app.route('/health/live')
+def health_live():
+    """Liveness: o processo responde (não toca no banco)"""
+    return {'status': 'alive'}, 200
+
 @app.route('/health')
+@app.route('/health/ready')
 def health_check():
-    """Endpoint de saúde para o Render"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT 1')
-        conn.close()
-        return {'status': 'healthy', 'database': 'connected'}, 200
-    except Exception as e:
-        return {'status': 'unhealthy', 'error': str(e)}, 500
+    """Readiness para o Render: resultado em cache por PRONTIDAO_TTL segundos"""
+    agora = time.monotonic()
+    if _prontidao['resultado'] is None or agora - _prontidao['verificado_em'] > PRONTIDAO_TTL:
+        _prontidao.update(resultado=verificar_prontidao(), verificado_em=agora)
+    resultado = _prontidao['resultado']
+    return resultado, 200 if resultado['status'] == 'ready' else 503
+
+@app.route('/metrics')
+def metrics():
+    """Métricas de todos os workers no formato texto do Prometheus
+    
+    Exige METRICAS_TOKEN (Authorization: Bearer); sem token configurado a rota
+    fica fechada, a menos que METRICAS_PUBLICAS=true.
+    """
+    token = os.getenv('METRICAS_TOKEN')
+    if not token:
+        if os.getenv('METRICAS_PUBLICAS', 'false').lower() != 'true':
+            abort(403)
+    elif request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+    return (metricas.registro.exportar_prometheus(), 200,
+            {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
 
 @app.route('/debug')
 def debug_info():
     """Informações de debug"""
     info = {
         'app_name': 'SIMPLE Financeiro',
-        'database': 'PostgreSQL',
+        'database': 'SQLite' if banco_local else 'PostgreSQL',
         'database_url_defined': bool(DATABASE_URL),
         'session_user_id': session.get('user_id'),
         'flask_debug': app.debug,
@@ -1316,8 +2136,24 @@ def internal_error(e):
     flash('Ocorreu um erro interno. Tente novamente.', 'danger')
     return redirect(url_for('index'))
 
+# ============== PRÉ-COMPILAÇÃO DOS TEMPLATES ==============
+def aquecer_templates():
+    """Compila todos os templates de templates/ antes da primeira requisição"""
+    compilados = 0
+    for nome in app.jinja_env.list_templates():
+        try:
+            app.jinja_env.get_template(nome)
+            compilados += 1
+        except TemplateError as e:
+            logger.warning(f"⚠️  Template {nome} não compilou: {e}")
+    logger.info(f"✅ {compilados} templates pré-compilados")
+    return compilados
+
+# Roda depois de registrar todos os filtros, senão a compilação falha
+if os.getenv('JINJA_WARMUP', 'true').lower() == 'true':
+    aquecer_templates()
+
 # ============== INICIALIZAÇÃO ==============
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    debug = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
-    app.run(host='0.0.0.0', port=port, debug=debug)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port, debug=FLASK_DEBUG)
\ No newline at end of file
@@ -0,0 +1,216 @@
+"""
+Arquivo de Transações Antigas
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- Transações mais antigas que ARQUIVO_HORIZONTE_MESES saem de transacoes
+  para transacoes_arquivo (mesmas colunas, só o índice (usuario_id, data))
+- Com transacoes particionada, o mês inteiro muda de tabela com
+  DETACH/ATTACH PARTITION, sem reescrever linhas; sobras (tabela sem
+  partições ou partição padrão) são movidas em lotes
+- resumo_arquivo guarda os totais por usuário, mês, tipo e categoria do
+  que foi arquivado: saldo e relatórios somam o resumo em vez de ler o
+  arquivo
+- A listagem e as exportações só leem o arquivo quando a página ou o
+  filtro chegam lá
+
+Uso (agendar fora do horário de pico):
+    python arquivo_transacoes.py [--horizonte-meses 24] [--lote 10000]
+"""
+
+import argparse
+import logging
+import os
+import re
+from datetime import date
+
+from particoes import inicio_do_mes, somar_meses, tabela_particionada
+
+logger = logging.getLogger(__name__)
+
+# ============== CONFIGURAÇÕES ==============
+
+# O mês corrente e os anteriores próximos nunca são arquivados
+ARQUIVO_HORIZONTE_MINIMO = 3
+ARQUIVO_HORIZONTE_MESES = max(int(os.getenv('ARQUIVO_HORIZONTE_MESES', 24)), ARQUIVO_HORIZONTE_MINIMO)
+ARQUIVO_LOTE = int(os.getenv('ARQUIVO_LOTE', 10000))
+
+TRAVA_ARQUIVO = 'simplifica_arquivo_transacoes'
+
+# Lista explícita: o arquivo não depende da ordem das colunas de transacoes
+COLUNAS_TRANSACAO = 'id, usuario_id, tipo, valor_centavos, descricao, categoria_id, data, data_criacao'
+
+RE_PARTICAO_MES = re.compile(r'^transacoes_(\d{4})_(\d{2})$')
+
+SQL_SOMAR_NO_RESUMO = '''
+    INSERT INTO resumo_arquivo (usuario_id, mes, tipo, categoria_id, total_centavos, quantidade)
+    SELECT usuario_id, date_trunc('month', data)::date, tipo, categoria_id, SUM(valor_centavos), COUNT(*)
+    FROM {origem}
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (usuario_id, mes, tipo, categoria_id) DO UPDATE SET
+        total_centavos = resumo_arquivo.total_centavos + EXCLUDED.total_centavos,
+        quantidade = resumo_arquivo.quantidade + EXCLUDED.quantidade
+'''
+
+
+def corte_do_arquivo(hoje=None, horizonte_meses=ARQUIVO_HORIZONTE_MESES):
+    """Primeiro dia que ainda fica em transacoes (antes dele, arquivo)"""
+    return somar_meses(inicio_do_mes(hoje or date.today()), -horizonte_meses)
+
+
+def criar_tabelas_arquivo(cursor):
+    """transacoes_arquivo (particionada como transacoes) e resumo_arquivo"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transacoes_arquivo (
+            LIKE transacoes INCLUDING CONSTRAINTS,
+            PRIMARY KEY (id, data)
+        ) PARTITION BY RANGE (data)
+    ''')
+    cursor.execute('CREATE TABLE IF NOT EXISTS transacoes_arquivo_padrao PARTITION OF transacoes_arquivo DEFAULT')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transacoes_arquivo_usuario_data
+        ON transacoes_arquivo(usuario_id, data)
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS resumo_arquivo (
+            usuario_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+            mes DATE NOT NULL,
+            tipo VARCHAR(10) NOT NULL,
+            categoria_id INTEGER NOT NULL,
+            total_centavos BIGINT NOT NULL,
+            quantidade INTEGER NOT NULL,
+            PRIMARY KEY (usuario_id, mes, tipo, categoria_id)
+        )
+    ''')
+
+
+# ============== ARQUIVAMENTO ==============
+
+def particoes_antigas(cursor, corte):
+    """Partições mensais de transacoes que terminam até o corte"""
+    cursor.execute('''
+        SELECT c.relname AS nome
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'transacoes'::regclass
+    ''')
+    antigas = []
+    for linha in cursor.fetchall():
+        encontrado = RE_PARTICAO_MES.match(linha['nome'])
+        if encontrado:
+            inicio = date(int(encontrado.group(1)), int(encontrado.group(2)), 1)
+            if somar_meses(inicio, 1) <= corte:
+                antigas.append((inicio, linha['nome']))
+    return sorted(antigas)
+
+
+def mover_particao(cursor, nome, inicio):
+    """Soma o mês no resumo e troca a partição de tabela (sem reescrever linhas)"""
+    cursor.execute(SQL_SOMAR_NO_RESUMO.format(origem=nome))
+    cursor.execute(f'ALTER TABLE transacoes DETACH PARTITION {nome}')
+    cursor.execute(f'''
+        ALTER TABLE transacoes_arquivo ATTACH PARTITION {nome}
+        FOR VALUES FROM (%s) TO (%s)
+    ''', (inicio, somar_meses(inicio, 1)))
+    # Índices que transacoes_arquivo não tem ficaram soltos na partição
+    cursor.execute('''
+        SELECT i.indexrelid::regclass::text AS indice
+        FROM pg_index i
+        WHERE i.indrelid = %s::regclass
+        AND NOT EXISTS (SELECT 1 FROM pg_inherits h WHERE h.inhrelid = i.indexrelid)
+    ''', (nome,))
+    for linha in cursor.fetchall():
+        cursor.execute(f'DROP INDEX {linha["indice"]}')
+
+
+def mover_lote(cursor, corte, lote):
+    """Move até 'lote' linhas anteriores ao corte; devolve quantas moveu"""
+    cursor.execute(f'''
+        WITH movidas AS (
+            DELETE FROM transacoes
+            WHERE (id, data) IN (
+                SELECT id, data FROM transacoes
+                WHERE data < %s
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING {COLUNAS_TRANSACAO}
+        ), resumo AS (
+            {SQL_SOMAR_NO_RESUMO.format(origem='movidas')}
+        )
+        INSERT INTO transacoes_arquivo ({COLUNAS_TRANSACAO})
+        SELECT {COLUNAS_TRANSACAO} FROM movidas
+    ''', (corte, lote))
+    return cursor.rowcount
+
+
+def arquivar(conn, hoje=None, horizonte_meses=ARQUIVO_HORIZONTE_MESES, lote=ARQUIVO_LOTE):
+    """Arquiva tudo antes do corte; um commit por partição ou lote"""
+    corte = corte_do_arquivo(hoje, max(horizonte_meses, ARQUIVO_HORIZONTE_MINIMO))
+    cursor = conn.cursor()
+    cursor.execute("SET lock_timeout = '5s'")
+    cursor.execute('SELECT pg_try_advisory_lock(hashtext(%s)) AS livre', (TRAVA_ARQUIVO,))
+    if not cursor.fetchone()['livre']:
+        logger.warning("⚠️  Arquivamento já em andamento em outro processo")
+        conn.rollback()
+        return 0
+
+    movidas = 0
+    try:
+        if tabela_particionada(cursor, 'transacoes'):
+            for inicio, nome in particoes_antigas(cursor, corte):
+                mover_particao(cursor, nome, inicio)
+                conn.commit()
+                logger.info(f"🗄️  {nome} movida para transacoes_arquivo")
+
+        # Tabela sem partições, ou datas antigas que caíram na partição padrão
+        while True:
+            quantidade = mover_lote(cursor, corte, lote)
+            conn.commit()
+            if not quantidade:
+                break
+            movidas += quantidade
+            logger.info(f"🗄️  {movidas:,} transações anteriores a {corte} arquivadas")
+    finally:
+        cursor.execute('SELECT pg_advisory_unlock(hashtext(%s))', (TRAVA_ARQUIVO,))
+        conn.commit()
+        cursor.close()
+    return movidas
+
+
+def excluir_arquivada(cursor, usuario_id, transacao_id):
+    """Exclui uma transação do arquivo e desconta do resumo; False se não achou"""
+    cursor.execute('''
+        /* consulta: arquivo_excluir */
+        WITH removida AS (
+            DELETE FROM transacoes_arquivo
+            WHERE id = %s AND usuario_id = %s
+            RETURNING usuario_id, date_trunc('month', data)::date AS mes, tipo, categoria_id, valor_centavos
+        )
+        UPDATE resumo_arquivo r
+        SET total_centavos = r.total_centavos - removida.valor_centavos,
+            quantidade = r.quantidade - 1
+        FROM removida
+        WHERE r.usuario_id = removida.usuario_id AND r.mes = removida.mes
+        AND r.tipo = removida.tipo AND r.categoria_id = removida.categoria_id
+    ''', (transacao_id, usuario_id))
+    return cursor.rowcount > 0
+
+
+# ============== LINHA DE COMANDO ==============
+
+if __name__ == '__main__':
+    from particionar_transacoes import conectar
+
+    parser = argparse.ArgumentParser(description='Move transações antigas para o arquivo')
+    parser.add_argument('--horizonte-meses', type=int, default=ARQUIVO_HORIZONTE_MESES,
+                        help=f'Meses mantidos em transacoes (mínimo {ARQUIVO_HORIZONTE_MINIMO})')
+    parser.add_argument('--lote', type=int, default=ARQUIVO_LOTE)
+    args = parser.parse_args()
+
+    conn = conectar()
+    try:
+        total = arquivar(conn, horizonte_meses=args.horizonte_meses, lote=args.lote)
+        logger.info(f"✅ Arquivamento concluído ({total:,} linhas movidas em lotes)")
+    finally:
+        conn.close()
@@ -22,6 +22,8 @@ import zipfile
 import logging
 from dotenv import load_dotenv
 
+from log_estruturado import configurar_logging
+
 # Carrega variáveis de ambiente
 load_dotenv()
 
@@ -51,14 +53,8 @@ BACKUP_CONFIG = {
 LOG_DIR = 'logs'
 os.makedirs(LOG_DIR, exist_ok=True)
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(LOG_DIR, 'backup.log'), encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+# Arquivo + stdout escritos em segundo plano (LOG_FORMATO=texto para o terminal)
+configurar_logging(arquivo=os.path.join(LOG_DIR, 'backup.log'))
 
 logger = logging.getLogger(__name__)
 
@@ -0,0 +1,364 @@
+"""
+Banco SQLite Embutido (instalações de um servidor só e desenvolvimento)
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- DATABASE_URL=sqlite:///caminho/do/arquivo.db troca o PostgreSQL por um
+  arquivo SQLite local: sem servidor, sem rede, consultas em microssegundos
+- WAL e pragmas ajustados (leitores não esperam o escritor); uma conexão
+  por thread, reaproveitada entre requisições
+- Mesma interface que o app usa do psycopg2: cursor com execute/fetch*,
+  linhas compactas (Linha), commit/rollback/close e as mesmas exceções
+  (psycopg2.IntegrityError, OperationalError...)
+- O SQL do app (escrito para o Postgres) é traduzido na hora, com cache:
+  %s, casts ::TIPO, TO_CHAR, EXTRACT, CURRENT_DATE - data, INTERVAL,
+  LEAST/GREATEST, ILIKE e now()
+
+Partições, arquivo, réplicas e shards são recursos só do PostgreSQL; no
+SQLite as tabelas do arquivo existem (vazias) para as consultas de leitura.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+
+import psycopg2
+
+import metricas
+from disjuntor import disjuntor_db
+from linhas import classe_linha
+
+# ============== CONFIGURAÇÕES ==============
+
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',      # Com WAL, seguro contra queda do processo
+    'PRAGMA foreign_keys = ON',
+    'PRAGMA busy_timeout = 5000',       # Espera o escritor da vez em vez de falhar
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -16000',       # 16 MB de cache de páginas por conexão
+    'PRAGMA mmap_size = 134217728',
+)
+
+ESQUEMA = '''
+CREATE TABLE IF NOT EXISTS usuarios (
+    id INTEGER PRIMARY KEY,
+    nome VARCHAR(100) NOT NULL,
+    email VARCHAR(100) UNIQUE NOT NULL,
+    senha VARCHAR(255) NOT NULL,
+    modo_interface VARCHAR(20) DEFAULT 'simples',
+    data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS categorias_personalizadas (
+    id INTEGER PRIMARY KEY,
+    usuario_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    nome VARCHAR(50) NOT NULL,
+    tipo VARCHAR(10) CHECK(tipo IN ('receita', 'despesa')),
+    cor VARCHAR(7) DEFAULT '#6366F1',
+    data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (usuario_id, nome)
+);
+
+CREATE TABLE IF NOT EXISTS transacoes (
+    id INTEGER PRIMARY KEY,
+    usuario_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    tipo VARCHAR(10) CHECK(tipo IN ('receita', 'despesa')) NOT NULL,
+    valor_centavos BIGINT NOT NULL,
+    descricao VARCHAR(200) NOT NULL,
+    categoria_id INTEGER NOT NULL REFERENCES categorias_personalizadas(id),
+    data DATE NOT NULL,
+    data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    recorrencia_id INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS metas (
+    id INTEGER PRIMARY KEY,
+    usuario_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    titulo VARCHAR(100) NOT NULL,
+    descricao TEXT,
+    valor_alvo_centavos BIGINT NOT NULL,
+    valor_atual_centavos BIGINT DEFAULT 0,
+    categoria VARCHAR(50) DEFAULT 'Outros',
+    data_inicio DATE NOT NULL,
+    data_limite DATE,
+    data_conclusao TIMESTAMP NULL,
+    status VARCHAR(20) CHECK(status IN ('ativa', 'concluida', 'cancelada')) DEFAULT 'ativa',
+    cor VARCHAR(7) DEFAULT '#6366F1',
+    data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    previsao_conclusao DATE,
+    aporte_mensal_centavos BIGINT,
+    ritmo_mensal_centavos BIGINT,
+    previsao_em TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS transacoes_arquivo (
+    id INTEGER NOT NULL,
+    usuario_id INTEGER NOT NULL,
+    tipo VARCHAR(10) NOT NULL,
+    valor_centavos BIGINT NOT NULL,
+    descricao VARCHAR(200) NOT NULL,
+    categoria_id INTEGER NOT NULL,
+    data DATE NOT NULL,
+    data_criacao TIMESTAMP,
+    recorrencia_id INTEGER,
+    PRIMARY KEY (id, data)
+);
+
+CREATE TABLE IF NOT EXISTS recorrencias (
+    id INTEGER PRIMARY KEY,
+    usuario_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    tipo VARCHAR(10) CHECK(tipo IN ('receita', 'despesa')) NOT NULL,
+    valor_centavos BIGINT NOT NULL,
+    descricao VARCHAR(200) NOT NULL,
+    categoria_id INTEGER NOT NULL REFERENCES categorias_personalizadas(id),
+    frequencia VARCHAR(10) CHECK(frequencia IN ('semanal', 'mensal', 'anual')) NOT NULL,
+    data_inicio DATE NOT NULL,
+    data_fim DATE,
+    ativa BOOLEAN NOT NULL DEFAULT TRUE,
+    gerada_ate DATE,
+    data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS resumo_arquivo (
+    usuario_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    mes DATE NOT NULL,
+    tipo VARCHAR(10) NOT NULL,
+    categoria_id INTEGER NOT NULL,
+    total_centavos BIGINT NOT NULL,
+    quantidade INTEGER NOT NULL,
+    PRIMARY KEY (usuario_id, mes, tipo, categoria_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_transacoes_usuario_data ON transacoes(usuario_id, data);
+CREATE INDEX IF NOT EXISTS idx_transacoes_usuario_categoria ON transacoes(usuario_id, categoria_id);
+CREATE INDEX IF NOT EXISTS idx_metas_usuario_id ON metas(usuario_id);
+CREATE INDEX IF NOT EXISTS idx_transacoes_arquivo_usuario_data ON transacoes_arquivo(usuario_id, data);
+CREATE INDEX IF NOT EXISTS idx_recorrencias_usuario_id ON recorrencias(usuario_id);
+'''
+
+# Colunas que vieram depois da primeira versão do esquema: arquivos antigos ganham com ALTER TABLE
+COLUNAS_ACRESCENTADAS = (
+    ('metas', 'previsao_conclusao', 'DATE'),
+    ('metas', 'aporte_mensal_centavos', 'BIGINT'),
+    ('metas', 'ritmo_mensal_centavos', 'BIGINT'),
+    ('metas', 'previsao_em', 'TIMESTAMP'),
+    ('transacoes', 'recorrencia_id', 'INTEGER'),
+    ('transacoes_arquivo', 'recorrencia_id', 'INTEGER'),
+)
+
+# Depende de colunas acrescentadas: criado depois dos ALTER TABLE
+INDICES_ACRESCENTADOS = '''
+CREATE UNIQUE INDEX IF NOT EXISTS idx_transacoes_recorrencia ON transacoes(recorrencia_id, data);
+'''
+
+SQL_TABELAS = "SELECT name AS nome FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+
+# Datas como texto ISO na ida; DATE/TIMESTAMP declarados voltam como date/datetime
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda valor: valor.isoformat(' '))
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_converter('DATE', lambda valor: date.fromisoformat(valor.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda valor: datetime.fromisoformat(valor.decode()))
+
+
+def caminho_da_url(url):
+    """'sqlite:///dados/app.db' -> 'dados/app.db' (None se não for SQLite)"""
+    if not url or not url.startswith('sqlite://'):
+        return None
+    return url[len('sqlite:///'):] or ':memory:'
+
+
+# ============== TRADUÇÃO DO SQL ==============
+
+RE_PARAMETRO = re.compile(r'%([%s])')
+RE_CAST = re.compile(r'::\s*(?:BIGINT|INTEGER|INT|FLOAT|NUMERIC|TEXT|DATE)(?:\[\])?', re.IGNORECASE)
+RE_TO_CHAR = re.compile(r"\bTO_CHAR\(\s*([\w.]+)\s*,\s*'([^']*)'\s*\)", re.IGNORECASE)
+RE_EXTRACT = re.compile(r'\bEXTRACT\(\s*(YEAR|MONTH|DAY|DOW)\s+FROM\s+([^)]+)\)', re.IGNORECASE)
+RE_INTERVALO = re.compile(r"\bCURRENT_DATE\s*([+-])\s*INTERVAL\s*'(\d+)\s*(day|month|year)s?'", re.IGNORECASE)
+RE_DIAS_ATE = re.compile(r'\b([\w.]+)\s*-\s*CURRENT_DATE\b', re.IGNORECASE)
+RE_DIAS_DESDE = re.compile(r'\bCURRENT_DATE\s*-\s*([\w.]+)', re.IGNORECASE)
+
+FORMATOS_DATA = (('HH24', '%H'), ('MI', '%M'), ('SS', '%S'), ('YYYY', '%Y'), ('MM', '%m'), ('DD', '%d'))
+PARTES_DATA = {'YEAR': '%Y', 'MONTH': '%m', 'DAY': '%d', 'DOW': '%w'}
+FUNCOES = ((re.compile(r'\bLEAST\(', re.IGNORECASE), 'MIN('),
+           (re.compile(r'\bGREATEST\(', re.IGNORECASE), 'MAX('),
+           (re.compile(r'\bILIKE\b', re.IGNORECASE), 'LIKE'),
+           (re.compile(r'\bnow\(\)', re.IGNORECASE), 'CURRENT_TIMESTAMP'))
+
+
+def _formato_strftime(formato):
+    for postgres, strftime in FORMATOS_DATA:
+        formato = formato.replace(postgres, strftime)
+    return formato
+
+
+@lru_cache(maxsize=512)
+def traduzir_sql(sql):
+    """SQL do app (dialeto PostgreSQL, parâmetros %s) -> SQLite (parâmetros ?)"""
+    sql = RE_PARAMETRO.sub(lambda m: '%' if m.group(1) == '%' else '?', sql)
+    sql = RE_CAST.sub('', sql)
+    sql = RE_TO_CHAR.sub(lambda m: f"strftime('{_formato_strftime(m.group(2))}', {m.group(1)})", sql)
+    sql = RE_EXTRACT.sub(lambda m: f"CAST(strftime('{PARTES_DATA[m.group(1).upper()]}', {m.group(2)}) AS INTEGER)", sql)
+    sql = RE_INTERVALO.sub(lambda m: f"date(CURRENT_DATE, '{m.group(1)}{m.group(2)} {m.group(3).lower()}s')", sql)
+    sql = RE_DIAS_ATE.sub(r'CAST(julianday(\1) - julianday(CURRENT_DATE) AS INTEGER)', sql)
+    sql = RE_DIAS_DESDE.sub(r'CAST(julianday(CURRENT_DATE) - julianday(\1) AS INTEGER)', sql)
+    for padrao, troca in FUNCOES:
+        sql = padrao.sub(troca, sql)
+    return sql
+
+
+def _erro_psycopg2(erro):
+    """Mesma exceção que o psycopg2 levantaria: o app trata um tipo só"""
+    if isinstance(erro, sqlite3.IntegrityError):
+        return psycopg2.IntegrityError(str(erro))
+    if isinstance(erro, sqlite3.OperationalError):
+        return psycopg2.OperationalError(str(erro))
+    return psycopg2.DatabaseError(str(erro))
+
+
+# ============== CONEXÃO E CURSOR ==============
+
+class CursorSQLite:
+    """Cursor no formato do CursorMedido: traduz, cronometra e devolve Linha"""
+
+    arraysize = 100
+
+    def __init__(self, conexao):
+        self.connection = conexao
+        self._cursor = conexao._conn.cursor()
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def _executar(self, metodo, query, parametros):
+        inicio = time.perf_counter()
+        try:
+            metodo(traduzir_sql(query), parametros)
+            metricas.consulta_ok()
+            disjuntor_db.sucesso()
+        except sqlite3.Error as e:
+            if isinstance(e, sqlite3.OperationalError):
+                disjuntor_db.falha()  # Arquivo travado além do busy_timeout, disco cheio...
+            raise _erro_psycopg2(e) from e
+        finally:
+            metricas.registrar_consulta(metricas.nome_consulta(query), time.perf_counter() - inicio, query)
+
+    def execute(self, query, vars=None):
+        self._executar(self._cursor.execute, query, tuple(vars or ()))
+
+    def executemany(self, query, vars_list):
+        self._executar(self._cursor.executemany, query, [tuple(v) for v in vars_list])
+
+    def _classe(self):
+        return classe_linha(tuple(coluna[0] for coluna in self._cursor.description))
+
+    def fetchone(self):
+        valores = self._cursor.fetchone()
+        return None if valores is None else self._classe()(valores)
+
+    def fetchmany(self, size=None):
+        valores = self._cursor.fetchmany(self.arraysize if size is None else size)
+        classe = self._classe() if valores else None
+        return [classe(v) for v in valores]
+
+    def fetchall(self):
+        valores = self._cursor.fetchall()
+        classe = self._classe() if valores else None
+        return [classe(v) for v in valores]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        self._cursor.close()
+
+
+class ConexaoSQLite:
+    """Conexão da thread; close() só desfaz o que ficou aberto (como devolver ao pool)"""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.emprestimos = 0
+
+    @property
+    def closed(self):
+        return self._conn is None
+
+    def cursor(self):
+        return CursorSQLite(self)
+
+    def commit(self):
+        inicio = time.perf_counter()
+        try:
+            self._conn.commit()
+        finally:
+            metricas.registrar_consulta('commit', time.perf_counter() - inicio)
+
+    def rollback(self):
+        inicio = time.perf_counter()
+        try:
+            self._conn.rollback()
+        finally:
+            metricas.registrar_consulta('rollback', time.perf_counter() - inicio)
+
+    def close(self):
+        # get_db_connection() aninhado na mesma thread: só o último close() desfaz
+        self.emprestimos = max(self.emprestimos - 1, 0)
+        if not self.emprestimos and self._conn is not None and self._conn.in_transaction:
+            self.rollback()
+
+    def fechar(self):
+        """Fecha a conexão de verdade"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class BancoSQLite:
+    """Arquivo SQLite com uma conexão por thread (refeita depois de um fork)"""
+
+    def __init__(self, caminho, pragmas=PRAGMAS):
+        self.caminho = caminho
+        self.pragmas = pragmas
+        self._local = threading.local()
+
+    def _conectar(self):
+        pasta = os.path.dirname(self.caminho)
+        if pasta and self.caminho != ':memory:':
+            os.makedirs(pasta, exist_ok=True)
+        conn = sqlite3.connect(self.caminho, detect_types=sqlite3.PARSE_DECLTYPES)
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        return conn
+
+    def obter(self):
+        """Conexão da thread atual (como pool.obter(): o disjuntor é com quem chama)"""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid() or local.conexao.closed:
+            local.conexao = ConexaoSQLite(self._conectar())
+            local.pid = os.getpid()
+        local.conexao.emprestimos += 1
+        return local.conexao
+
+    def criar_tabelas(self):
+        conexao = self.obter()
+        try:
+            conexao._conn.executescript(ESQUEMA)
+            for tabela, coluna, tipo in COLUNAS_ACRESCENTADAS:
+                existentes = {linha[1] for linha in conexao._conn.execute(f'PRAGMA table_info({tabela})')}
+                if coluna not in existentes:
+                    conexao._conn.execute(f'ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}')
+            conexao._conn.executescript(INDICES_ACRESCENTADOS)
+        finally:
+            conexao.close()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark da Compressão de Respostas
+Mede custo de CPU x bytes economizados do CompressaoMiddleware nas páginas
+típicas (dashboard avançado e relatórios), renderizadas com dados sintéticos.
+
+Uso:
+    python benchmarks/benchmark_compressao.py [--repeticoes 200]
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('JINJA_WARMUP', 'false')
+
+from flask import render_template, session
+
+from app import app
+from compressao import CompressorBrotli, CompressorGzip, brotli
+
+CATEGORIAS = ['Alimentação', 'Moradia', 'Transporte', 'Saúde', 'Lazer', 'Educação',
+              'Serviços', 'Vendas', 'Salário', 'Estoque', 'Outros', 'Impostos']
+
+
+def dados_dashboard():
+    hoje = date.today()
+    transacoes = [
+        {'id': i, 'data': hoje - timedelta(days=i), 'descricao': f'Transação de teste {i}',
+         'categoria': CATEGORIAS[i % len(CATEGORIAS)], 'tipo': 'receita' if i % 3 == 0 else 'despesa',
+         'valor_centavos': 12345 * (i + 1)}
+        for i in range(10)
+    ]
+    return {'saldo': 1543210, 'mes_atual': {'receitas': 820000, 'despesas': 531190, 'saldo': 288810},
+            'transacoes': transacoes, 'metas_ativas': []}
+
+
+def dados_relatorios():
+    hoje = date.today()
+    despesas = [{'categoria': c, 'total': 15000 * (i + 1)} for i, c in enumerate(CATEGORIAS)]
+    receitas = [{'categoria': c, 'total': 90000 * (i + 1)} for i, c in enumerate(CATEGORIAS[:4])]
+    evolucao = [{'mes': f'{hoje.year - 1 + (hoje.month + i) // 12}-{(hoje.month + i) % 12 + 1:02d}',
+                 'receitas': 800000 + i * 10000, 'despesas': 600000 + i * 8000, 'saldo': 200000 + i * 2000}
+                for i in range(12)]
+    top = [{'descricao': f'Despesa grande {i}', 'categoria': CATEGORIAS[i], 'valor_centavos': 200000 - i * 10000,
+            'data': hoje} for i in range(5)]
+    return {'despesas_categoria': despesas, 'receitas_categoria': receitas,
+            'evolucao_mensal': evolucao, 'top_despesas': top}
+
+
+def renderizar_paginas():
+    with app.test_request_context('/'):
+        session['user_id'] = 1
+        session['user_nome'] = 'Benchmark'
+        session['user_modo'] = 'avancado'
+        return {
+            'dashboard_avancado.html': render_template('dashboard_avancado.html', **dados_dashboard()).encode(),
+            'relatorios.html': render_template('relatorios.html', **dados_relatorios()).encode(),
+        }
+
+
+def medir(fabrica, corpo, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        compressor = fabrica()
+        saida = compressor.comprimir(corpo) + compressor.finalizar()
+    duracao = (time.perf_counter() - inicio) / repeticoes
+    return len(saida), duracao * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do middleware de compressão")
+    parser.add_argument('--repeticoes', type=int, default=200)
+    args = parser.parse_args()
+
+    configuracoes = [(f'gzip {nivel}', lambda nivel=nivel: CompressorGzip(nivel)) for nivel in (1, 6, 9)]
+    if brotli is not None:
+        configuracoes += [(f'br {q}', lambda q=q: CompressorBrotli(q)) for q in (1, 4, 6, 11)]
+
+    for nome, corpo in renderizar_paginas().items():
+        print(f"\n📄 {nome}: {len(corpo):,} bytes sem compressão")
+        print(f"{'codificação':<12} {'bytes':>8} {'economia':>9} {'ms/resp':>8} {'KB salvos/ms CPU':>17}")
+        for rotulo, fabrica in configuracoes:
+            tamanho, ms = medir(fabrica, corpo, args.repeticoes)
+            economia = 1 - tamanho / len(corpo)
+            kb_por_ms = (len(corpo) - tamanho) / 1024 / ms if ms else float('inf')
+            print(f"{rotulo:<12} {tamanho:>8,} {economia:>8.1%} {ms:>8.3f} {kb_por_ms:>17.1f}")
+
+
+if __name__ == '__main__':
+    main()
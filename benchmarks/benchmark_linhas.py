@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark das Linhas Compactas
+Compara dict por linha (o que o RealDictCursor monta) com as Linha de
+linhas.py: tempo de montar as linhas, memória retida, renderização da
+página de transações e DataFrame da exportação, com 10 mil linhas.
+
+Uso:
+    python benchmarks/benchmark_linhas.py [--linhas 10000] [--repeticoes 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('JINJA_WARMUP', 'false')
+
+import pandas as pd
+from flask import render_template, session
+
+from app import app
+from linhas import classe_linha
+
+CAMPOS = ('id', 'usuario_id', 'tipo', 'valor_centavos', 'descricao', 'categoria', 'data', 'data_criacao')
+CATEGORIAS = ['Alimentação', 'Moradia', 'Transporte', 'Saúde', 'Lazer', 'Vendas', 'Salário']
+
+
+def tuplas_sinteticas(quantidade):
+    """O que o psycopg2 devolve por baixo: uma tupla por linha"""
+    hoje = date.today()
+    agora = datetime.now()
+    return [
+        (i, 1, 'receita' if i % 3 == 0 else 'despesa', ((i % 500) + 10) * 100 + 90,
+         f'Transação {i}', CATEGORIAS[i % len(CATEGORIAS)], hoje - timedelta(days=i % 365), agora)
+        for i in range(quantidade)
+    ]
+
+
+def como_dicts(tuplas):
+    return [dict(zip(CAMPOS, t)) for t in tuplas]
+
+
+def como_linhas(tuplas):
+    classe = classe_linha(CAMPOS)
+    return [classe(t) for t in tuplas]
+
+
+def medir(funcao, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        resultado = funcao()
+    return (time.perf_counter() - inicio) / repeticoes * 1000, resultado
+
+
+def memoria_retida(fabrica, tuplas):
+    tracemalloc.start()
+    antes = tracemalloc.take_snapshot()
+    linhas = fabrica(tuplas)
+    depois = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(s.size_diff for s in depois.compare_to(antes, 'filename'))
+    del linhas
+    return total
+
+
+def renderizar(linhas):
+    with app.test_request_context('/transacoes'):
+        session['user_id'] = 1
+        session['user_nome'] = 'Benchmark'
+        session['user_modo'] = 'avancado'
+        return render_template('transacoes_avancado.html', transacoes=linhas, categorias=CATEGORIAS,
+                               meses=[], filtros={}, pagina_atual=1, total_paginas=1, total_transacoes=len(linhas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de dict x Linha por linha de resultado")
+    parser.add_argument('--linhas', type=int, default=10000)
+    parser.add_argument('--repeticoes', type=int, default=5)
+    args = parser.parse_args()
+
+    tuplas = tuplas_sinteticas(args.linhas)
+    print(f"\n📊 {args.linhas:,} linhas, média de {args.repeticoes} repetições")
+    print(f"{'formato':<8} {'montar ms':>10} {'memória KB':>11} {'render ms':>10} {'DataFrame ms':>13}")
+
+    for nome, fabrica in (('dict', como_dicts), ('Linha', como_linhas)):
+        ms_montar, linhas = medir(lambda: fabrica(tuplas), args.repeticoes)
+        memoria = memoria_retida(fabrica, tuplas) / 1024
+        ms_render, _ = medir(lambda: renderizar(linhas), args.repeticoes)
+        ms_df, _ = medir(lambda: pd.DataFrame(linhas), args.repeticoes)
+        print(f"{nome:<8} {ms_montar:>10.2f} {memoria:>11,.0f} {ms_render:>10.2f} {ms_df:>13.2f}")
+
+
+if __name__ == '__main__':
+    main()
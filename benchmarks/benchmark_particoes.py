@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Benchmark do Particionamento de Transações
+Monta, num schema separado, a mesma massa de transações numa tabela comum
+(heap) e numa particionada por mês, e compara as consultas do app com
+EXPLAIN (ANALYZE, BUFFERS): filtro de mês da listagem, resumo do mês no
+dashboard, evolução de 12 meses dos relatórios e VACUUM do mês corrente.
+
+Precisa de um PostgreSQL (DATABASE_URL ou DB_*), com espaço para a massa:
+50 milhões de linhas ocupam por volta de 8 GB somando as duas tabelas.
+
+Uso:
+    python benchmarks/benchmark_particoes.py [--linhas 50000000] [--usuarios 20000] [--anos 5]
+    python benchmarks/benchmark_particoes.py --reaproveitar   # pula a carga
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('LOG_FORMATO', 'texto')
+
+from particionar_transacoes import conectar
+from particoes import criar_particao, criar_particao_padrao, inicio_do_mes, proximo_mes, somar_meses
+
+SCHEMA = 'benchmark_particoes'
+LOTE_CARGA = 5_000_000
+
+COLUNAS = '''
+    id BIGINT NOT NULL,
+    usuario_id INTEGER NOT NULL,
+    tipo VARCHAR(10) NOT NULL,
+    valor_centavos BIGINT NOT NULL,
+    descricao VARCHAR(200) NOT NULL,
+    categoria_id INTEGER NOT NULL,
+    data DATE NOT NULL,
+    data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+'''
+
+
+def carregar(conn, linhas, usuarios, anos):
+    cursor = conn.cursor()
+    cursor.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+    cursor.execute(f'CREATE SCHEMA {SCHEMA}')
+    cursor.execute(f'SET search_path = {SCHEMA}')
+    cursor.execute(f'CREATE TABLE heap ({COLUNAS}, PRIMARY KEY (id))')
+    cursor.execute(f'CREATE TABLE particionada ({COLUNAS}, PRIMARY KEY (id, data)) PARTITION BY RANGE (data)')
+
+    hoje = date.today()
+    inicio = somar_meses(inicio_do_mes(hoje), -12 * anos)
+    criar_particao_padrao(cursor, 'particionada')
+    mes = inicio
+    while mes <= inicio_do_mes(hoje):
+        criar_particao(cursor, 'particionada', mes)
+        mes = proximo_mes(mes)
+    conn.commit()
+
+    dias = (hoje - inicio).days
+    for tabela in ('heap', 'particionada'):
+        comeco = time.perf_counter()
+        for primeiro in range(1, linhas + 1, LOTE_CARGA):
+            ultimo = min(primeiro + LOTE_CARGA - 1, linhas)
+            # Datas crescem com o id, como numa base real (inserções em ordem)
+            cursor.execute(f'''
+                INSERT INTO {tabela}
+                SELECT g, 1 + (g * 7919) %% %s,
+                       CASE WHEN g %% 3 = 0 THEN 'receita' ELSE 'despesa' END,
+                       1000 + (g * 31) %% 500000, 'Transação ' || g, 1 + g %% 12,
+                       %s::date + (g * %s / %s)::int, now()
+                FROM generate_series(%s::bigint, %s::bigint) g
+            ''', (usuarios, inicio, dias, linhas, primeiro, ultimo))
+            conn.commit()
+        cursor.execute(f'CREATE INDEX ON {tabela} (usuario_id, data)')
+        cursor.execute(f'CREATE INDEX ON {tabela} (data)')
+        conn.commit()
+        conn.autocommit = True  # VACUUM não roda dentro de transação
+        cursor.execute(f'VACUUM ANALYZE {tabela}')
+        conn.autocommit = False
+        print(f"📥 {tabela}: {linhas:,} linhas em {time.perf_counter() - comeco:.0f}s")
+    cursor.close()
+
+
+def explicar(cursor, sql, params):
+    """(ms de execução, páginas lidas, partições visitadas) de uma consulta"""
+    cursor.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + sql, params)
+    plano = cursor.fetchone()['QUERY PLAN'][0]
+    relacoes = set()
+
+    def percorrer(no):
+        if 'Relation Name' in no:
+            relacoes.add(no['Relation Name'])
+        for filho in no.get('Plans', []):
+            percorrer(filho)
+
+    raiz = plano['Plan']
+    paginas = raiz.get('Shared Hit Blocks', 0) + raiz.get('Shared Read Blocks', 0)
+    percorrer(raiz)
+    return plano['Execution Time'], paginas, len(relacoes)
+
+
+def consultas(usuario, hoje):
+    mes_passado = somar_meses(inicio_do_mes(hoje), -1)
+    inicio_mes, fim_mes = inicio_do_mes(hoje), proximo_mes(inicio_do_mes(hoje))
+    doze_meses = somar_meses(inicio_do_mes(hoje), -11)
+    return [
+        ('listagem mês (TO_CHAR, antes)',
+         "SELECT * FROM {t} WHERE usuario_id = %s AND TO_CHAR(data, 'YYYY-MM') = %s "
+         "ORDER BY data DESC, id DESC LIMIT 20",
+         (usuario, mes_passado.strftime('%Y-%m'))),
+        ('listagem mês (faixa, depois)',
+         'SELECT * FROM {t} WHERE usuario_id = %s AND data >= %s AND data < %s '
+         'ORDER BY data DESC, id DESC LIMIT 20',
+         (usuario, mes_passado, proximo_mes(mes_passado))),
+        ('resumo do mês (EXTRACT, antes)',
+         'SELECT tipo, SUM(valor_centavos) FROM {t} WHERE usuario_id = %s '
+         'AND EXTRACT(MONTH FROM data) = EXTRACT(MONTH FROM CURRENT_DATE) '
+         'AND EXTRACT(YEAR FROM data) = EXTRACT(YEAR FROM CURRENT_DATE) GROUP BY tipo',
+         (usuario,)),
+        ('resumo do mês (faixa, depois)',
+         'SELECT tipo, SUM(valor_centavos) FROM {t} WHERE usuario_id = %s '
+         'AND data >= %s AND data < %s GROUP BY tipo',
+         (usuario, inicio_mes, fim_mes)),
+        ('evolução 12 meses (antes)',
+         "SELECT TO_CHAR(data, 'YYYY-MM') AS mes, SUM(valor_centavos) FROM {t} "
+         'WHERE usuario_id = %s GROUP BY mes ORDER BY mes DESC LIMIT 12',
+         (usuario,)),
+        ('evolução 12 meses (depois)',
+         "SELECT TO_CHAR(data, 'YYYY-MM') AS mes, SUM(valor_centavos) FROM {t} "
+         'WHERE usuario_id = %s AND data >= %s GROUP BY mes ORDER BY mes DESC LIMIT 12',
+         (usuario, doze_meses)),
+        ('total do mês, todos os usuários',
+         'SELECT COUNT(*), SUM(valor_centavos) FROM {t} WHERE data >= %s AND data < %s',
+         (mes_passado, proximo_mes(mes_passado))),
+    ]
+
+
+def medir_vacuum(conn):
+    """VACUUM da tabela inteira (heap) x só da partição do mês corrente"""
+    conn.autocommit = True
+    cursor = conn.cursor()
+    atual = inicio_do_mes(date.today())
+    resultados = []
+    for rotulo, alvo in (('heap inteira', 'heap'),
+                         ('partição do mês', f'particionada_{atual.year:04d}_{atual.month:02d}')):
+        comeco = time.perf_counter()
+        cursor.execute(f'VACUUM {alvo}')
+        resultados.append((rotulo, (time.perf_counter() - comeco) * 1000))
+    cursor.close()
+    conn.autocommit = False
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de transacoes comum x particionada por mês')
+    parser.add_argument('--linhas', type=int, default=50_000_000)
+    parser.add_argument('--usuarios', type=int, default=20_000)
+    parser.add_argument('--anos', type=int, default=5)
+    parser.add_argument('--repeticoes', type=int, default=5)
+    parser.add_argument('--reaproveitar', action='store_true', help='Usa a massa já carregada')
+    args = parser.parse_args()
+
+    conn = conectar()
+    if not args.reaproveitar:
+        carregar(conn, args.linhas, args.usuarios, args.anos)
+
+    cursor = conn.cursor()
+    cursor.execute(f'SET search_path = {SCHEMA}')
+    hoje = date.today()
+
+    print(f"\n📊 {args.linhas:,} linhas, mediana de {args.repeticoes} execuções (cache quente)")
+    print(f"{'consulta':<34} {'tabela':<13} {'ms':>9} {'páginas':>9} {'partições':>10}")
+    for rotulo, sql, params in consultas(42, hoje):
+        for tabela in ('heap', 'particionada'):
+            medidas = sorted(explicar(cursor, sql.format(t=tabela), params) for _ in range(args.repeticoes))
+            ms, paginas, relacoes = medidas[len(medidas) // 2]
+            print(f"{rotulo:<34} {tabela:<13} {ms:>9.2f} {paginas:>9,} {relacoes:>10}")
+    conn.commit()
+    cursor.close()
+
+    print()
+    for rotulo, ms in medir_vacuum(conn):
+        print(f"VACUUM {rotulo:<27} {ms:>9.0f} ms")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Busca nas Descrições das Transações
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- ?busca= em /transacoes filtra pela descrição junto com tipo, categoria e
+  mês, na mesma paginação
+- Palavras e começos de palavra ("farm" acha "Farmácia") pelo índice GIN de
+  to_tsvector na configuração simplifica_pt (português, sem acentos)
+- Erros de digitação ("farmasia") pelo índice de trigramas (pg_trgm) sobre a
+  descrição sem acentos
+- usuario_id entra nos dois índices (btree_gin): a busca só percorre as
+  entradas do próprio usuário, não as de todas as contas
+- transacoes_arquivo tem os mesmos índices (partições arquivadas levam os
+  seus); com busca, as arquivadas são contadas no arquivo, não no resumo
+- No SQLite (ou sem as extensões no PostgreSQL), ILIKE com as palavras na
+  ordem digitada e os curingas (% e _) do texto escapados
+
+As extensões (unaccent, pg_trgm, btree_gin) exigem privilégio que o papel do
+app nem sempre tem num Postgres gerenciado: são instaladas uma vez por este
+script, com um usuário administrador. Na subida o app só confere se estão lá.
+
+Uso (uma vez por banco, com DATABASE_URL de um administrador):
+    python busca_transacoes.py
+"""
+
+import logging
+import re
+
+# ============== CONFIGURAÇÕES ==============
+
+CONFIG_BUSCA = 'simplifica_pt'
+BUSCA_MAX_PALAVRAS = 8
+EXTENSOES_BUSCA = ('unaccent', 'pg_trgm', 'btree_gin')
+
+RE_PALAVRA = re.compile(r'\w+')
+
+logger = logging.getLogger(__name__)
+
+# Falso se algum banco está sem as extensões: a busca cai no ILIKE (sem índice)
+extensoes_instaladas = True
+
+# %%> é o operador %> do pg_trgm: a descrição tem um trecho parecido com o texto buscado
+SQL_CONDICAO_BUSCA = f'''
+    AND (to_tsvector('{CONFIG_BUSCA}', t.descricao) @@ to_tsquery('{CONFIG_BUSCA}', %s)
+         OR simplifica_sem_acento(t.descricao) %%> simplifica_sem_acento(%s))'''
+
+
+def instalar_extensoes(cursor):
+    """CREATE EXTENSION das extensões da busca (exige privilégio de administrador)"""
+    for extensao in EXTENSOES_BUSCA:
+        cursor.execute(f'CREATE EXTENSION IF NOT EXISTS {extensao}')
+
+
+def extensoes_faltando(cursor):
+    """Extensões da busca que não estão instaladas no banco"""
+    cursor.execute('''
+        /* consulta: busca_extensoes */
+        SELECT extname FROM pg_extension WHERE extname = ANY(%s)
+    ''', (list(EXTENSOES_BUSCA),))
+    instaladas = {linha['extname'] for linha in cursor.fetchall()}
+    return [extensao for extensao in EXTENSOES_BUSCA if extensao not in instaladas]
+
+
+def criar_indices_busca(cursor):
+    """Configuração de texto e índices de busca (transacoes e arquivo); idempotente
+
+    Sem as extensões não cria nada, só avisa: a migração segue e a busca usa ILIKE.
+    """
+    global extensoes_instaladas
+    faltando = extensoes_faltando(cursor)
+    if faltando:
+        extensoes_instaladas = False
+        logger.warning(f"⚠️  Extensões da busca ausentes ({', '.join(faltando)}): busca sem índice. "
+                       f"Rode python busca_transacoes.py com um usuário administrador")
+        return False
+    # unaccent() é STABLE; índice de expressão exige IMMUTABLE (o dicionário não muda)
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION simplifica_sem_acento(texto TEXT) RETURNS TEXT
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+        AS $$ SELECT unaccent('unaccent'::regdictionary, texto) $$
+    ''')
+    cursor.execute(f'''
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = '{CONFIG_BUSCA}') THEN
+                CREATE TEXT SEARCH CONFIGURATION {CONFIG_BUSCA} (COPY = portuguese);
+                ALTER TEXT SEARCH CONFIGURATION {CONFIG_BUSCA}
+                    ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem;
+            END IF;
+        END $$;
+    ''')
+    for tabela in ('transacoes', 'transacoes_arquivo'):
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_{tabela}_busca
+            ON {tabela} USING GIN (usuario_id, to_tsvector('{CONFIG_BUSCA}', descricao))
+        ''')
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_{tabela}_trigramas
+            ON {tabela} USING GIN (usuario_id, simplifica_sem_acento(descricao) gin_trgm_ops)
+        ''')
+    return True
+
+
+# ============== CONSULTA ==============
+
+def palavras_busca(texto):
+    """Palavras do texto digitado, em minúsculas (pontuação e operadores caem fora)"""
+    return RE_PALAVRA.findall((texto or '').lower())[:BUSCA_MAX_PALAVRAS]
+
+
+def consulta_prefixos(palavras):
+    """tsquery em que cada palavra vale como começo: 'farm & cent' -> 'farm:* & cent:*'"""
+    return ' & '.join(f'{palavra}:*' for palavra in palavras)
+
+
+def escapar_like(palavra):
+    """Curingas do LIKE (% e _) como texto comum; a barra é o ESCAPE da condição"""
+    return palavra.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def condicao_busca(texto, sqlite=False):
+    """(trecho do WHERE sobre t.descricao, parâmetros); None se não há o que buscar"""
+    palavras = palavras_busca(texto)
+    if not palavras:
+        return None
+    if sqlite or not extensoes_instaladas:
+        padrao = '%' + '%'.join(escapar_like(palavra) for palavra in palavras) + '%'
+        return " AND t.descricao ILIKE %s ESCAPE '\\'", [padrao]
+    return SQL_CONDICAO_BUSCA, [consulta_prefixos(palavras), ' '.join(palavras)]
+
+
+# ============== LINHA DE COMANDO ==============
+
+if __name__ == '__main__':
+    from particionar_transacoes import conectar
+    from shards import dsns_configurados
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    for numero, dsn in enumerate([None, *dsns_configurados()]):
+        conn = conectar(dsn)
+        try:
+            cursor = conn.cursor()
+            instalar_extensoes(cursor)
+            conn.commit()
+            logger.info(f"✅ Extensões da busca instaladas (shard {numero})")
+        finally:
+            conn.close()
@@ -0,0 +1,144 @@
+"""
+Categorias por Usuário (Dicionário de Categorias)
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- Cada usuário tem suas categorias em categorias_personalizadas, com id
+  inteiro; transacoes guarda só o categoria_id (linhas e índices menores,
+  GROUP BY em inteiros)
+- Cache em memória por usuário (id -> nome): o filtro de categorias da
+  listagem e os nomes dos relatórios não custam consulta
+- Categoria nova é criada na hora (upsert) ao lançar a transação
+
+Cada worker tem o seu cache. Criar categoria troca a marca do usuário em
+disco (como no motor analítico) e os outros workers recarregam na próxima
+leitura; um id ou nome que o cache ainda não conhece também força a recarga.
+As marcas ficam num diretório 0700 do usuário do app (arquivos 0600).
+"""
+
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from diretorio_privado import abrir_privado, preparar_diretorio
+
+# ============== CONFIGURAÇÕES ==============
+
+CATEGORIAS_DIR = os.getenv('CATEGORIAS_DIR', os.path.join(tempfile.gettempdir(), 'simplifica_categorias'))
+CATEGORIAS_CACHE_TTL = float(os.getenv('CATEGORIAS_CACHE_TTL', 300))
+CATEGORIAS_CACHE_MAX = int(os.getenv('CATEGORIAS_CACHE_MAX', 5000))
+
+CATEGORIA_PADRAO = 'Outros'
+TAMANHO_NOME = 50
+
+
+def normalizar_nome(nome):
+    """Nome sem espaços sobrando e dentro do VARCHAR(50); vazio vira 'Outros'"""
+    nome = ' '.join((nome or '').split())[:TAMANHO_NOME]
+    return nome or CATEGORIA_PADRAO
+
+
+class CacheCategorias:
+    """LRU de usuários -> {id: nome} das suas categorias, com TTL e marca de escrita em disco"""
+
+    def __init__(self, ttl=CATEGORIAS_CACHE_TTL, maximo=CATEGORIAS_CACHE_MAX, diretorio=CATEGORIAS_DIR):
+        self.ttl = ttl
+        self.maximo = maximo
+        self.diretorio = diretorio
+        self._usuarios = OrderedDict()  # usuario_id -> (carregado_em, marca, categorias)
+        self._lock = threading.Lock()
+        preparar_diretorio(self.diretorio)
+
+    def _caminho(self, usuario_id):
+        return os.path.join(self.diretorio, f'{int(usuario_id)}.marca')
+
+    def _marca(self, usuario_id):
+        """Identidade do arquivo de marca: muda a cada categoria criada em qualquer worker"""
+        try:
+            estado = os.stat(self._caminho(usuario_id))
+        except OSError:
+            return None
+        return estado.st_ino, estado.st_mtime_ns
+
+    def _marcar(self, usuario_id):
+        """Troca o arquivo de marca (arquivo novo, inode novo)"""
+        caminho = self._caminho(usuario_id)
+        temporario = f'{caminho}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with abrir_privado(temporario):
+            pass
+        os.replace(temporario, caminho)
+
+    def _carregar(self, cursor, usuario_id):
+        # Marca lida antes da carga: categoria criada durante a carga faz a próxima leitura recarregar
+        marca = self._marca(usuario_id)
+        cursor.execute('''
+            /* consulta: categorias_usuario */
+            SELECT id, nome FROM categorias_personalizadas
+            WHERE usuario_id = %s ORDER BY nome
+        ''', (usuario_id,))
+        categorias = {linha['id']: linha['nome'] for linha in cursor.fetchall()}
+        with self._lock:
+            self._usuarios[usuario_id] = (time.monotonic(), marca, categorias)
+            self._usuarios.move_to_end(usuario_id)
+            while len(self._usuarios) > self.maximo:
+                self._usuarios.popitem(last=False)
+        return categorias
+
+    def do_usuario(self, cursor, usuario_id):
+        """{id: nome} das categorias do usuário, em ordem alfabética"""
+        marca = self._marca(usuario_id)
+        with self._lock:
+            item = self._usuarios.get(usuario_id)
+            if item is not None and item[1] == marca and time.monotonic() - item[0] < self.ttl:
+                self._usuarios.move_to_end(usuario_id)
+                return item[2]
+        return self._carregar(cursor, usuario_id)
+
+    def nomes(self, cursor, usuario_id, ids):
+        """{id: nome} garantindo todos os ids pedidos (recarrega se faltar algum)"""
+        categorias = self.do_usuario(cursor, usuario_id)
+        if any(categoria_id not in categorias for categoria_id in ids):
+            categorias = self._carregar(cursor, usuario_id)
+        return categorias
+
+    def id_por_nome(self, cursor, usuario_id, nome, recarregar=True):
+        """Id da categoria pelo nome; nome desconhecido recarrega uma vez (criada em outro worker)"""
+        categorias = self.do_usuario(cursor, usuario_id)
+        for tentativa in range(2 if recarregar else 1):
+            if tentativa:
+                categorias = self._carregar(cursor, usuario_id)
+            for categoria_id, nome_categoria in categorias.items():
+                if nome_categoria == nome:
+                    return categoria_id
+        return None
+
+    def obter_ou_criar(self, cursor, usuario_id, nome, tipo=None):
+        """Id da categoria pelo nome, criando se o usuário ainda não tiver"""
+        nome = normalizar_nome(nome)
+        # Sem recarga: o upsert abaixo já resolve categoria criada em outro worker
+        categoria_id = self.id_por_nome(cursor, usuario_id, nome, recarregar=False)
+        if categoria_id is not None:
+            return categoria_id
+
+        # ON CONFLICT cobre outro worker criando a mesma categoria ao mesmo tempo
+        cursor.execute('''
+            /* consulta: categoria_criar */
+            INSERT INTO categorias_personalizadas (usuario_id, nome, tipo)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (usuario_id, nome) DO UPDATE SET nome = EXCLUDED.nome
+            RETURNING id
+        ''', (usuario_id, nome, tipo))
+        categoria_id = cursor.fetchone()['id']
+        self.invalidar(usuario_id)
+        return categoria_id
+
+    def invalidar(self, usuario_id):
+        """Descarta as categorias do usuário em todos os workers"""
+        with self._lock:
+            self._marcar(usuario_id)
+            self._usuarios.pop(usuario_id, None)
+
+
+cache_categorias = CacheCategorias()
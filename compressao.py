@@ -0,0 +1,190 @@
+"""
+Middleware WSGI de Compressão de Respostas
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- Negocia brotli ou gzip pelo cabeçalho Accept-Encoding (maior q vence;
+  empate fica com brotli)
+- ETag da resposta comprimida ganha o sufixo da codificação ("...-br",
+  "...-gz"); o If-None-Match chega ao app sem ele, então o 304 continua
+  funcionando
+- Só comprime tipos de conteúdo textuais (HTML, CSS, JS, JSON...)
+- Ignora respostas pequenas, já codificadas ou downloads binários (.xlsx, .pdf)
+- Funciona com respostas em streaming (geradores), comprimindo bloco a bloco
+"""
+
+import re
+import zlib
+
+try:
+    import brotli
+except ImportError:  # Sem o pacote brotli o middleware usa só gzip
+    brotli = None
+
+# Tipos que compensam comprimir; .xlsx, .pdf e imagens já são comprimidos
+TIPOS_COMPRIMIVEIS = {
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/csv',
+    'text/javascript',
+    'application/javascript',
+    'application/json',
+    'image/svg+xml',
+}
+
+SUFIXOS_ETAG = {'br': '-br', 'gzip': '-gz'}
+RE_SUFIXO_ETAG = re.compile(r'-(br|gz)"')
+
+
+class CompressorGzip:
+    """Compressor gzip incremental (um flush por bloco para não segurar o stream)"""
+
+    def __init__(self, nivel):
+        self._zlib = zlib.compressobj(nivel, zlib.DEFLATED, 31)
+
+    def comprimir(self, dados):
+        return self._zlib.compress(dados) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finalizar(self):
+        return self._zlib.flush(zlib.Z_FINISH)
+
+
+class CompressorBrotli:
+    """Compressor brotli incremental"""
+
+    def __init__(self, qualidade):
+        self._brotli = brotli.Compressor(quality=qualidade)
+
+    def comprimir(self, dados):
+        return self._brotli.process(dados) + self._brotli.flush()
+
+    def finalizar(self):
+        return self._brotli.finish()
+
+
+class CompressaoMiddleware:
+    """Envolve um app WSGI e comprime as respostas elegíveis"""
+
+    def __init__(self, app, tamanho_minimo=500, nivel_gzip=6, qualidade_brotli=4,
+                 tipos=TIPOS_COMPRIMIVEIS):
+        self.app = app
+        self.tamanho_minimo = tamanho_minimo
+        self.nivel_gzip = nivel_gzip
+        self.qualidade_brotli = qualidade_brotli
+        self.tipos = set(tipos)
+
+    def escolher_codificacao(self, accept_encoding):
+        """Escolhe 'br', 'gzip' ou None a partir do Accept-Encoding do cliente"""
+        aceitas = {}
+        for parte in accept_encoding.lower().split(','):
+            nome, _, parametros = parte.strip().partition(';')
+            qualidade = 1.0
+            if parametros.strip().startswith('q='):
+                try:
+                    qualidade = float(parametros.strip()[2:])
+                except ValueError:
+                    qualidade = 0.0
+            if nome:
+                aceitas[nome] = qualidade
+
+        qualquer = aceitas.get('*', 0)
+        q_br = aceitas.get('br', qualquer) if brotli is not None else 0
+        q_gzip = aceitas.get('gzip', qualquer)
+        if max(q_br, q_gzip) <= 0:
+            return None
+        return 'br' if q_br >= q_gzip else 'gzip'
+
+    def deve_comprimir(self, status, headers):
+        """Decide pela resposta (status e cabeçalhos) se vale comprimir"""
+        codigo = int(status.split(' ', 1)[0])
+        if codigo < 200 or codigo in (204, 206, 304):
+            return False
+
+        cabecalhos = {nome.lower(): valor for nome, valor in headers}
+        if 'content-encoding' in cabecalhos:
+            return False
+        if 'no-transform' in cabecalhos.get('cache-control', ''):
+            return False
+
+        tipo = cabecalhos.get('content-type', '').split(';', 1)[0].strip().lower()
+        if tipo not in self.tipos:
+            return False
+
+        # Sem Content-Length é streaming: comprime sempre
+        tamanho = cabecalhos.get('content-length')
+        if tamanho is not None and int(tamanho) < self.tamanho_minimo:
+            return False
+        return True
+
+    @staticmethod
+    def etag_com_sufixo(etag, sufixo):
+        """'"abc"' -> '"abc-br"' (W/ de ETag fraca é mantido)"""
+        if not etag.endswith('"'):
+            return etag
+        return f'{etag[:-1]}{sufixo}"'
+
+    def novo_compressor(self, codificacao):
+        if codificacao == 'br':
+            return CompressorBrotli(self.qualidade_brotli)
+        return CompressorGzip(self.nivel_gzip)
+
+    def __call__(self, environ, start_response):
+        codificacao = self.escolher_codificacao(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if codificacao is None:
+            return self.app(environ, start_response)
+
+        estado = {}
+
+        # ETags que o cliente guardou com sufixo: o app compara com as dele, sem sufixo
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and RE_SUFIXO_ETAG.search(if_none_match):
+            environ['HTTP_IF_NONE_MATCH'] = RE_SUFIXO_ETAG.sub('"', if_none_match)
+            estado['sufixo_pedido'] = SUFIXOS_ETAG[codificacao]
+
+        def start_response_comprimido(status, headers, exc_info=None):
+            estado['decidido'] = True
+            sufixo = None
+            if self.deve_comprimir(status, headers):
+                estado['compressor'] = self.novo_compressor(codificacao)
+                sufixo = SUFIXOS_ETAG[codificacao]
+                vary = [valor for nome, valor in headers if nome.lower() == 'vary']
+                headers = [(nome, valor) for nome, valor in headers
+                           if nome.lower() not in ('content-length', 'vary')]
+                headers.append(('Vary', ', '.join(vary + ['Accept-Encoding'])))
+                headers.append(('Content-Encoding', codificacao))
+            elif status.startswith('304'):
+                sufixo = estado.get('sufixo_pedido')  # 304 repete a ETag que o cliente tem
+            if sufixo:
+                headers = [(nome, self.etag_com_sufixo(valor, sufixo) if nome.lower() == 'etag' else valor)
+                           for nome, valor in headers]
+            return start_response(status, headers, exc_info)
+
+        corpo = self.app(environ, start_response_comprimido)
+
+        # O Werkzeug chama start_response antes de devolver o corpo; se já
+        # sabemos que não vai comprimir, devolve o iterável original (mantém
+        # o wsgi.file_wrapper do send_file)
+        if estado.get('decidido') and 'compressor' not in estado:
+            return corpo
+        return self._iterar_comprimido(corpo, estado)
+
+    def _iterar_comprimido(self, corpo, estado):
+        try:
+            for bloco in corpo:
+                compressor = estado.get('compressor')
+                if compressor is None:
+                    yield bloco
+                    continue
+                dados = compressor.comprimir(bloco)
+                if dados:
+                    yield dados
+
+            compressor = estado.get('compressor')
+            if compressor is not None:
+                final = compressor.finalizar()
+                if final:
+                    yield final
+        finally:
+            if hasattr(corpo, 'close'):
+                corpo.close()
@@ -0,0 +1,184 @@
+"""
+Build de Assets Estáticos
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- Vendoriza Bootstrap, Bootstrap Icons, Font Awesome e Chart.js (sem CDN)
+- Gera nomes com hash de conteúdo para o CSS próprio (static/css)
+- Pré-compacta os arquivos com gzip e brotli
+- Gera o manifesto lido pelo app (static/dist/manifest.json)
+
+Uso:
+    python construir_assets.py
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import shutil
+import sys
+import urllib.request
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # Sem o pacote brotli só os .gz são gerados
+    brotli = None
+
+# ============== CONFIGURAÇÕES ==============
+
+BASE_DIR = Path(__file__).resolve().parent
+STATIC_DIR = BASE_DIR / 'static'
+DIST_DIR = STATIC_DIR / 'dist'
+MANIFESTO = DIST_DIR / 'manifest.json'
+
+# Pastas de static/ com arquivos próprios que recebem hash no nome
+PASTAS_PROPRIAS = ['css', 'js']
+
+# Extensões que compensam pré-compactar (woff/woff2 já são comprimidos)
+EXTENSOES_COMPACTAVEIS = {'.css', '.js', '.svg', '.ttf', '.json'}
+
+# Pacotes de terceiros. A versão faz parte do caminho em dist/vendor, então o
+# próprio diretório já serve de fingerprint; os caminhos relativos são
+# mantidos para que as URLs das fontes dentro do CSS continuem funcionando.
+PACOTES_VENDOR = {
+    'bootstrap@5.3.0': {
+        'url': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/',
+        'arquivos': [
+            'dist/css/bootstrap.min.css',
+            'dist/js/bootstrap.bundle.min.js',
+        ],
+    },
+    'bootstrap-icons@1.10.0': {
+        'url': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.0/',
+        'arquivos': [
+            'font/bootstrap-icons.css',
+            'font/fonts/bootstrap-icons.woff2',
+            'font/fonts/bootstrap-icons.woff',
+        ],
+    },
+    'font-awesome@6.4.0': {
+        'url': 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/',
+        'arquivos': ['css/all.min.css'] + [
+            f'webfonts/{fonte}.{extensao}'
+            for fonte in ('fa-brands-400', 'fa-regular-400', 'fa-solid-900', 'fa-v4compatibility')
+            for extensao in ('woff2', 'ttf')
+        ],
+    },
+    'chart.js@4.4.0': {
+        'url': 'https://cdn.jsdelivr.net/npm/chart.js@4.4.0/',
+        'arquivos': ['dist/chart.umd.min.js'],
+    },
+}
+
+# Nome lógico usado nos templates (asset_url) -> (pacote, arquivo)
+ASSETS_VENDOR = {
+    'vendor/bootstrap.min.css': ('bootstrap@5.3.0', 'dist/css/bootstrap.min.css'),
+    'vendor/bootstrap.bundle.min.js': ('bootstrap@5.3.0', 'dist/js/bootstrap.bundle.min.js'),
+    'vendor/bootstrap-icons.css': ('bootstrap-icons@1.10.0', 'font/bootstrap-icons.css'),
+    'vendor/fontawesome.min.css': ('font-awesome@6.4.0', 'css/all.min.css'),
+    'vendor/chart.umd.min.js': ('chart.js@4.4.0', 'dist/chart.umd.min.js'),
+}
+
+logger = logging.getLogger(__name__)
+
+
+def url_cdn(nome):
+    """URL original no CDN de um asset de terceiros (usada quando o build não rodou)"""
+    pacote, arquivo = ASSETS_VENDOR[nome]
+    return PACOTES_VENDOR[pacote]['url'] + arquivo
+
+
+# ============== FUNÇÕES DE BUILD ==============
+
+def precomprimir(caminho):
+    """Gera as versões .gz e .br ao lado do arquivo original"""
+    if caminho.suffix not in EXTENSOES_COMPACTAVEIS:
+        return
+
+    dados = caminho.read_bytes()
+    # mtime=0 deixa o .gz determinístico entre builds
+    caminho.with_name(caminho.name + '.gz').write_bytes(gzip.compress(dados, compresslevel=9, mtime=0))
+    if brotli is not None:
+        caminho.with_name(caminho.name + '.br').write_bytes(brotli.compress(dados, quality=11))
+
+
+def baixar_vendor(manifesto):
+    """Baixa os arquivos de terceiros para dist/vendor/<pacote>/"""
+    for pacote, config in PACOTES_VENDOR.items():
+        for arquivo in config['arquivos']:
+            destino = DIST_DIR / 'vendor' / pacote / arquivo
+            destino.parent.mkdir(parents=True, exist_ok=True)
+            url = config['url'] + arquivo
+            try:
+                with urllib.request.urlopen(url, timeout=30) as resposta:
+                    destino.write_bytes(resposta.read())
+            except OSError as e:
+                # O app volta a usar o CDN para o que não foi baixado
+                logger.error(f"❌ Erro ao baixar {url}: {e}")
+                continue
+            precomprimir(destino)
+            logger.info(f"✓ {pacote}/{arquivo}")
+
+    for nome, (pacote, arquivo) in ASSETS_VENDOR.items():
+        if (DIST_DIR / 'vendor' / pacote / arquivo).is_file():
+            manifesto[nome] = f'vendor/{pacote}/{arquivo}'
+
+
+def gerar_fingerprints(manifesto):
+    """Copia os arquivos próprios para dist/ com o hash do conteúdo no nome"""
+    for pasta in PASTAS_PROPRIAS:
+        origem_dir = STATIC_DIR / pasta
+        if not origem_dir.is_dir():
+            continue
+
+        for origem in sorted(origem_dir.rglob('*')):
+            if not origem.is_file():
+                continue
+
+            dados = origem.read_bytes()
+            hash_conteudo = hashlib.sha256(dados).hexdigest()[:10]
+            relativo = origem.relative_to(STATIC_DIR)
+            nome_final = relativo.with_name(f'{origem.stem}.{hash_conteudo}{origem.suffix}')
+
+            destino = DIST_DIR / nome_final
+            destino.parent.mkdir(parents=True, exist_ok=True)
+            destino.write_bytes(dados)
+            precomprimir(destino)
+
+            manifesto[relativo.as_posix()] = nome_final.as_posix()
+            logger.info(f"✓ {relativo.as_posix()} -> {nome_final.as_posix()}")
+
+
+def construir():
+    """Executa o build completo e grava o manifesto"""
+    logger.info("=" * 60)
+    logger.info("📦 CONSTRUINDO ASSETS ESTÁTICOS")
+    logger.info("=" * 60)
+
+    if DIST_DIR.exists():
+        shutil.rmtree(DIST_DIR)
+    DIST_DIR.mkdir(parents=True)
+
+    if brotli is None:
+        logger.warning("⚠️  Pacote brotli não instalado: gerando apenas .gz")
+
+    manifesto = {}
+    baixar_vendor(manifesto)
+    gerar_fingerprints(manifesto)
+
+    MANIFESTO.write_text(json.dumps(manifesto, indent=2, sort_keys=True), encoding='utf-8')
+    logger.info(f"✅ Manifesto gerado com {len(manifesto)} assets: {MANIFESTO}")
+    return manifesto
+
+
+# ============== EXECUÇÃO ==============
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    construir()
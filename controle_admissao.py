@@ -0,0 +1,188 @@
+"""
+Controle de Admissão (Load Shedding)
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- Limita as requisições que usam o banco em andamento neste processo
+- Fila curta com prazo; passado o prazo responde 503 com Retry-After
+- Prioridades: rotas leves (/, GET /login, estáticos, health) nunca esperam;
+  rotas pesadas (relatórios, exportações) têm cota própria e cedem a vez
+  às normais que estiverem na fila
+- Descarta requisições que já esperaram demais na fila do proxy
+  (cabeçalho X-Request-Start), útil com workers sync do gunicorn
+- Rejeições contadas em simplifica_requisicoes_rejeitadas_total
+"""
+
+import os
+import re
+import threading
+import time
+
+from flask import g, request
+
+import metricas
+
+# ============== CONFIGURAÇÕES ==============
+
+# Requisições com banco em andamento por processo (acompanha o pool)
+ADMISSAO_LIMITE = int(os.getenv('ADMISSAO_LIMITE', os.getenv('DB_POOL_TAMANHO', 5)))
+ADMISSAO_LIMITE_PESADAS = int(os.getenv('ADMISSAO_LIMITE_PESADAS', 2))
+
+# Quantas podem esperar na fila e por quanto tempo (s), por prioridade
+ADMISSAO_FILA_MAX = int(os.getenv('ADMISSAO_FILA_MAX', 20))
+ESPERA_MAXIMA = {
+    'normal': float(os.getenv('ADMISSAO_ESPERA_NORMAL', 1.0)),
+    'pesada': float(os.getenv('ADMISSAO_ESPERA_PESADA', 0.25)),
+}
+
+# Retry-After (s) devolvido no 503
+RETRY_AFTER = {'normal': 2, 'pesada': 10}
+
+# Idade máxima (s) de uma requisição vinda da fila do proxy (X-Request-Start)
+ADMISSAO_IDADE_MAXIMA = float(os.getenv('ADMISSAO_IDADE_MAXIMA', 10.0))
+
+# endpoint -> métodos leves (None = todos)
+ROTAS_LEVES = {
+    'index': None,
+    'static': None,
+    'servir_asset': None,
+    'health_live': None,
+    'health_check': None,
+    'metrics': None,
+    'logout': None,
+    'login': {'GET', 'HEAD'},
+    'registro': {'GET', 'HEAD'},
+}
+
+ROTAS_PESADAS = {'relatorios', 'exportar_excel', 'exportar_pdf'}
+
+RE_REQUEST_START = re.compile(r'(\d+(?:\.\d+)?)')
+
+
+def prioridade_da_rota(endpoint, metodo):
+    if endpoint is None:
+        return 'leve'  # 404: nem chega a usar o banco
+    if endpoint in ROTAS_LEVES:
+        metodos = ROTAS_LEVES[endpoint]
+        if metodos is None or metodo in metodos:
+            return 'leve'
+    if endpoint in ROTAS_PESADAS:
+        return 'pesada'
+    return 'normal'
+
+
+def idade_na_fila(cabecalho, agora=None):
+    """Segundos desde X-Request-Start (aceita s, ms ou µs, com ou sem 't=')"""
+    encontrado = RE_REQUEST_START.search(cabecalho or '')
+    if not encontrado:
+        return None
+    valor = float(encontrado.group(1))
+    if valor > 1e14:
+        valor /= 1e6
+    elif valor > 1e11:
+        valor /= 1e3
+    return max((agora or time.time()) - valor, 0.0)
+
+
+# ============== SEMÁFORO COM PRIORIDADE ==============
+
+class ControleAdmissao:
+    """Vagas de execução com fila limitada, prazo e cota de rotas pesadas"""
+
+    def __init__(self, limite=ADMISSAO_LIMITE, limite_pesadas=ADMISSAO_LIMITE_PESADAS,
+                 fila_max=ADMISSAO_FILA_MAX):
+        self.limite = limite
+        self.limite_pesadas = limite_pesadas
+        self.fila_max = fila_max
+        self.em_andamento = 0
+        self.pesadas = 0
+        self.esperando = {'normal': 0, 'pesada': 0}
+        self._cond = threading.Condition()
+
+    def _cabe(self, prioridade):
+        if self.em_andamento >= self.limite:
+            return False
+        if prioridade == 'pesada':
+            # Pesada só entra se houver cota e nenhuma normal esperando
+            return self.pesadas < self.limite_pesadas and self.esperando['normal'] == 0
+        return True
+
+    def _ocupar(self, prioridade):
+        self.em_andamento += 1
+        if prioridade == 'pesada':
+            self.pesadas += 1
+
+    def admitir(self, prioridade, espera):
+        """Ocupa uma vaga; devolve None ou o motivo da rejeição"""
+        prazo = time.monotonic() + espera
+        with self._cond:
+            if self._cabe(prioridade):
+                self._ocupar(prioridade)
+                return None
+            if sum(self.esperando.values()) >= self.fila_max:
+                return 'fila_cheia'
+
+            self.esperando[prioridade] += 1
+            try:
+                while not self._cabe(prioridade):
+                    restante = prazo - time.monotonic()
+                    if restante <= 0:
+                        return 'prazo'
+                    self._cond.wait(restante)
+                self._ocupar(prioridade)
+                return None
+            finally:
+                self.esperando[prioridade] -= 1
+                self._cond.notify_all()  # pesadas podem ter ganho a vez
+
+    def liberar(self, prioridade):
+        with self._cond:
+            self.em_andamento -= 1
+            if prioridade == 'pesada':
+                self.pesadas -= 1
+            self._cond.notify_all()
+
+
+controle = ControleAdmissao()
+
+
+# ============== GANCHOS DA REQUISIÇÃO ==============
+
+def rejeitar(prioridade, motivo):
+    metricas.registro.incrementar('simplifica_requisicoes_rejeitadas_total',
+                                  rota=request.endpoint or 'desconhecida',
+                                  prioridade=prioridade, motivo=motivo)
+    return ('Servidor ocupado no momento. Tente novamente em instantes.', 503,
+            {'Retry-After': str(RETRY_AFTER.get(prioridade, 2)),
+             'Content-Type': 'text/plain; charset=utf-8'})
+
+
+def admitir_requisicao():
+    prioridade = prioridade_da_rota(request.endpoint, request.method)
+    if prioridade == 'leve':
+        return None
+
+    idade = idade_na_fila(request.headers.get('X-Request-Start'))
+    if idade is not None and idade > ADMISSAO_IDADE_MAXIMA:
+        return rejeitar(prioridade, 'fila_do_proxy')
+
+    inicio = time.perf_counter()
+    motivo = controle.admitir(prioridade, ESPERA_MAXIMA[prioridade])
+    metricas.registro.observar('simplifica_admissao_espera_segundos', time.perf_counter() - inicio,
+                               buckets=metricas.BUCKETS_CONSULTA, prioridade=prioridade)
+    if motivo is not None:
+        return rejeitar(prioridade, motivo)
+    g.admissao = prioridade
+    return None
+
+
+def liberar_requisicao(exc=None):
+    prioridade = g.pop('admissao', None)
+    if prioridade is not None:
+        controle.liberar(prioridade)
+
+
+def registrar(app):
+    """Liga o controle de admissão (registrar depois das métricas)"""
+    app.before_request(admitir_requisicao)
+    app.teardown_request(liberar_requisicao)
@@ -0,0 +1,76 @@
+"""
+Dinheiro em Centavos
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- Valores monetários circulam como int em centavos (BIGINT no banco):
+  somas e agregações são inteiras, sem Decimal por linha nem float
+- Conversão do texto do formulário para centavos sem passar por float
+  (aceita "1234.56", "1234,56", "1.234,56" e "R$ 10")
+- Formatação pt-BR (R$ 1.234,56) para templates, PDF e avisos
+- Reais em Decimal só na borda das exportações (planilha Excel)
+"""
+
+from decimal import Decimal, InvalidOperation
+
+# Mesmo teto do antigo DECIMAL(10, 2): R$ 99.999.999,99
+VALOR_MAXIMO_CENTAVOS = 99_999_999_99
+
+
+class ValorInvalido(ValueError):
+    """Texto que não é um valor em reais com até 2 casas decimais"""
+
+
+def para_centavos(valor):
+    """Centavos (int) de um texto de formulário ou Decimal em reais"""
+    if isinstance(valor, str):
+        texto = valor.strip().replace('R$', '').replace(' ', '')
+        if ',' in texto:
+            # Formato brasileiro: ponto de milhar, vírgula decimal
+            texto = texto.replace('.', '').replace(',', '.')
+        try:
+            valor = Decimal(texto)
+        except InvalidOperation:
+            raise ValorInvalido(f'Valor inválido: {texto!r}') from None
+    elif isinstance(valor, int) and not isinstance(valor, bool):
+        valor = Decimal(valor)
+    elif not isinstance(valor, Decimal):
+        # float já chegou arredondado em binário: melhor recusar que adivinhar
+        raise ValorInvalido(f'Tipo não suportado para dinheiro: {type(valor).__name__}')
+
+    if not valor.is_finite():
+        raise ValorInvalido('Valor inválido')
+    # Ordem de grandeza absurda (ex.: "1e999999"): nem monta o inteiro
+    if valor and valor.adjusted() > 30:
+        raise ValorInvalido('Valor fora do intervalo')
+    try:
+        if valor.as_tuple().exponent < -2 and valor != valor.quantize(Decimal('0.01')):
+            raise ValorInvalido('Valor com mais de 2 casas decimais')
+    except InvalidOperation:
+        # quantize além da precisão do contexto (texto com dígitos demais)
+        raise ValorInvalido('Valor com dígitos demais') from None
+    return int(valor.scaleb(2))
+
+
+def para_reais(centavos):
+    """Decimal exato em reais (para planilhas e APIs que esperam reais)"""
+    return Decimal(int(centavos or 0)).scaleb(-2)
+
+
+def formatar_moeda(centavos, inteiro=False):
+    """R$ 1.234,56 a partir de centavos; inteiro=True arredonda para reais"""
+    centavos = int(centavos or 0)
+    sinal = '-' if centavos < 0 else ''
+    reais, resto = divmod(abs(centavos), 100)
+    if inteiro:
+        return f'{sinal}R$ {reais + (resto >= 50):,}'.replace(',', '.')
+    return f'{sinal}R$ {reais:,}'.replace(',', '.') + f',{resto:02d}'
+
+
+def valor_para_campo(centavos):
+    """Valor em reais para <input type="number"> ("1234.56")"""
+    centavos = int(centavos or 0)
+    sinal = '-' if centavos < 0 else ''
+    reais, resto = divmod(abs(centavos), 100)
+    return f'{sinal}{reais}.{resto:02d}'
+
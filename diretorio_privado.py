@@ -0,0 +1,45 @@
+"""
+Diretórios Privados em Disco
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- Diretórios de cache, snapshots e perfis (por padrão no tmp compartilhado do
+  sistema) criados com 0700 para o usuário do app
+- Recusa o diretório que já existe e é de outro usuário, ou em que outros podem
+  gravar: quem o criou antes poderia plantar arquivos que o app leria como seus
+- Arquivos novos abertos para escrita com permissão 0600
+"""
+
+import os
+import stat
+
+
+class DiretorioInseguro(RuntimeError):
+    """Diretório de outro usuário, com escrita para outros ou que não é diretório"""
+
+
+def preparar_diretorio(caminho):
+    """Cria o diretório com 0700 ou confere o que já existe (tipo, dono e permissões)"""
+    os.makedirs(caminho, mode=0o700, exist_ok=True)
+    info = os.lstat(caminho)
+    if not stat.S_ISDIR(info.st_mode):
+        raise DiretorioInseguro(f'{caminho} não é um diretório (link simbólico?)')
+
+    # Sem dono/permissões POSIX (Windows) só dá para conferir o tipo
+    if not hasattr(os, 'getuid'):
+        return caminho
+
+    modo = stat.S_IMODE(info.st_mode)
+    if info.st_uid != os.getuid():
+        raise DiretorioInseguro(f'{caminho} pertence a outro usuário (uid {info.st_uid})')
+    if modo & 0o022:
+        raise DiretorioInseguro(f'{caminho} aceita gravação de outros usuários ({oct(modo)})')
+    if modo != 0o700:
+        os.chmod(caminho, 0o700)  # Nosso, criado com umask antiga: fecha a leitura
+    return caminho
+
+
+def abrir_privado(caminho, modo='w', encoding='utf-8'):
+    """Abre para escrita (truncando) um arquivo só legível pelo usuário do app"""
+    descritor = os.open(caminho, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    return os.fdopen(descritor, modo, encoding=None if 'b' in modo else encoding)
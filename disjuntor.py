@@ -0,0 +1,88 @@
+"""
+Disjuntor (Circuit Breaker) do Banco de Dados
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- Conta falhas seguidas de acesso ao Postgres (conexão, pool esgotado, timeout)
+- Aberto: get_db_connection() falha na hora com BancoIndisponivel, sem
+  martelar um banco que já está com problemas
+- Passado DISJUNTOR_TEMPO_ABERTO, libera uma única tentativa (meio aberto);
+  se der certo o disjuntor fecha, se falhar abre de novo. Conseguir a
+  conexão já conta como tentativa bem-sucedida
+"""
+
+import os
+import threading
+import time
+
+import psycopg2
+
+# ============== CONFIGURAÇÕES ==============
+
+DISJUNTOR_FALHAS = int(os.getenv('DISJUNTOR_FALHAS', 5))
+DISJUNTOR_TEMPO_ABERTO = float(os.getenv('DISJUNTOR_TEMPO_ABERTO', 15.0))
+
+FECHADO, ABERTO, MEIO_ABERTO = 'fechado', 'aberto', 'meio_aberto'
+
+
+class BancoIndisponivel(psycopg2.OperationalError):
+    """Disjuntor aberto: nem tentamos falar com o banco"""
+
+
+class Disjuntor:
+    """Fechado -> aberto após N falhas seguidas -> meio aberto após o tempo de espera"""
+
+    def __init__(self, falhas_para_abrir=DISJUNTOR_FALHAS, tempo_aberto=DISJUNTOR_TEMPO_ABERTO):
+        self.falhas_para_abrir = falhas_para_abrir
+        self.tempo_aberto = tempo_aberto
+        self.estado = FECHADO
+        self.falhas = 0
+        self._desde = 0.0
+        self.ao_abrir = []
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        """Pode acessar o banco agora? No meio aberto só uma tentativa por vez"""
+        if self.estado == FECHADO:
+            return True  # Caminho comum sem lock
+        with self._lock:
+            if self.estado == FECHADO:
+                return True
+            if time.monotonic() - self._desde < self.tempo_aberto:
+                return False
+            # Aberto há tempo suficiente, ou tentativa anterior que nunca voltou
+            self.estado = MEIO_ABERTO
+            self._desde = time.monotonic()
+            return True
+
+    def sucesso(self):
+        if self.estado == FECHADO and self.falhas == 0:
+            return  # Caminho comum sem lock
+        with self._lock:
+            self.estado = FECHADO
+            self.falhas = 0
+
+    def conexao_ok(self):
+        """Conexão obtida do pool: no meio aberto já fecha (nem todo comando passa pelo CursorMedido)"""
+        if self.estado == MEIO_ABERTO:
+            self.sucesso()
+
+    def falha(self):
+        abriu = False
+        with self._lock:
+            self.falhas += 1
+            if self.estado == MEIO_ABERTO or self.falhas >= self.falhas_para_abrir:
+                abriu = self.estado != ABERTO
+                self.estado = ABERTO
+                self._desde = time.monotonic()
+        if abriu:
+            for gancho in self.ao_abrir:
+                gancho()
+
+    def verificar(self):
+        """Levanta BancoIndisponivel se o disjuntor não deixar passar"""
+        if not self.permitir():
+            raise BancoIndisponivel('Banco de dados indisponível no momento (disjuntor aberto)')
+
+
+disjuntor_db = Disjuntor()
@@ -0,0 +1,166 @@
+"""
+Timeouts por Rota e Cancelamento de Consultas Abandonadas
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- statement_timeout padrão (apertado) em toda conexão nova do pool
+- Rotas pesadas (relatórios, exportações) ganham mais tempo com SET LOCAL
+  na retirada da conexão, refeito a cada transação nova (depois de commit ou
+  rollback); as demais não pagam ida extra ao banco
+- Vigia em segundo plano que cancela no servidor a consulta de um cliente
+  que desconectou (socket do gunicorn/werkzeug fechado)
+
+Se o gunicorn matar o worker no meio de uma consulta, o backend do Postgres
+só para no statement_timeout da rota, que por isso nunca passa do timeout
+do próprio gunicorn. Timeouts e cancelamentos aparecem em
+simplifica_consultas_interrompidas_total.
+"""
+
+import itertools
+import os
+import select
+import socket
+import threading
+import time
+
+from flask import has_request_context, request
+
+# ============== CONFIGURAÇÕES ==============
+
+# Vale para toda conexão (dashboard, fragmentos, formulários)
+TIMEOUT_PADRAO_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 2000))
+
+# Rotas que podem demorar mais que o padrão (abaixo dos 30 s do gunicorn)
+TIMEOUTS_ROTA_MS = {
+    'listar_transacoes': 5000,
+    'relatorios': 15000,
+    'exportar_excel': 25000,
+    'exportar_pdf': 25000,
+}
+
+# De quanto em quanto tempo o vigia confere os clientes
+INTERVALO_VIGIA = float(os.getenv('DB_VIGIA_INTERVALO', 0.5))
+
+
+def opcoes_conexao():
+    """Parâmetro options do psycopg2.connect com o timeout padrão"""
+    return f'-c statement_timeout={TIMEOUT_PADRAO_MS}'
+
+
+def timeout_da_rota(endpoint):
+    return TIMEOUTS_ROTA_MS.get(endpoint, TIMEOUT_PADRAO_MS)
+
+
+def aplicar_timeout(conn):
+    """Ajusta o statement_timeout da transação para a rota atual (só se diferir do padrão)"""
+    conn.timeout_rota = None
+    if not has_request_context():
+        return
+    timeout = timeout_da_rota(request.endpoint)
+    if timeout == TIMEOUT_PADRAO_MS:
+        return
+    conn.timeout_rota = timeout
+    definir_timeout(conn, timeout)
+
+
+def refazer_timeout(conn):
+    """Depois de commit/rollback: o SET LOCAL acabou junto com a transação"""
+    timeout = getattr(conn, 'timeout_rota', None)
+    if timeout is not None:
+        definir_timeout(conn, timeout)
+
+
+def definir_timeout(conn, timeout):
+    cursor = conn.cursor()
+    try:
+        # SET LOCAL vale até o fim da transação e não vaza para o próximo uso
+        cursor.execute('/* consulta: statement_timeout */ SET LOCAL statement_timeout = %s', (timeout,))
+    finally:
+        cursor.close()
+
+
+# ============== CLIENTE DESCONECTADO ==============
+
+def socket_da_requisicao():
+    """Socket do cliente exposto pelo servidor WSGI (gunicorn ou werkzeug)"""
+    if not has_request_context():
+        return None
+    return request.environ.get('gunicorn.socket') or request.environ.get('werkzeug.socket')
+
+
+def cliente_desconectou(sock):
+    """True se o cliente fechou a conexão (legível e sem dados = EOF)"""
+    try:
+        legivel, _, _ = select.select([sock], [], [], 0)
+        if not legivel:
+            return False
+        return sock.recv(1, socket.MSG_PEEK) == b''
+    except (OSError, ValueError):
+        return True
+
+
+class VigiaDesconexao:
+    """Thread única por processo que cancela consultas de clientes que foram embora
+
+    Cada retirada da conexão ganha um número: entre a leitura dos sockets e o
+    cancelamento a conexão pode ter voltado ao pool e ido para outra
+    requisição, e aí o cancel() mataria a consulta de um cliente que está lá.
+    """
+
+    def __init__(self, intervalo=INTERVALO_VIGIA):
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._vigiadas = {}  # conn -> (socket, número da retirada)
+        self._retiradas = itertools.count(1)
+        self._thread = None
+
+    def observar(self, conn, sock):
+        if sock is None:
+            return
+        with self._lock:
+            self._vigiadas[conn] = (sock, next(self._retiradas))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._rodar, name='vigia-desconexao', daemon=True)
+                self._thread.start()
+
+    def esquecer(self, conn):
+        with self._lock:
+            self._vigiadas.pop(conn, None)
+
+    def _rodar(self):
+        while True:
+            time.sleep(self.intervalo)
+            self.conferir()
+
+    def conferir(self):
+        """Uma passada: cancela as consultas cujo cliente desconectou"""
+        with self._lock:
+            vigiadas = list(self._vigiadas.items())
+        for conn, (sock, retirada) in vigiadas:
+            if conn.closed or not cliente_desconectou(sock):
+                continue
+            # Com o lock, devolver ao pool (esquecer) espera o cancel terminar
+            with self._lock:
+                atual = self._vigiadas.get(conn)
+                if atual is None or atual[1] != retirada:
+                    continue  # Já devolvida (e talvez de outra requisição)
+                del self._vigiadas[conn]
+                # O CursorMedido usa o motivo ao contar a interrupção
+                conn.motivo_cancelamento = 'cliente_desconectou'
+                try:
+                    conn.cancel()
+                except Exception:
+                    pass
+
+
+vigia = VigiaDesconexao()
+
+
+# ============== INTEGRAÇÃO COM O POOL ==============
+
+def preparar_conexao(conn):
+    """Chamado ao retirar a conexão do pool: timeout da rota + vigia do cliente"""
+    aplicar_timeout(conn)
+    conn.motivo_cancelamento = None
+    vigia.observar(conn, socket_da_requisicao())
+
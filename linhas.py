@@ -0,0 +1,112 @@
+"""
+Linhas Compactas de Resultado SQL
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- Cada linha guarda só a tupla que o psycopg2 já devolve (__slots__), em vez
+  de um dict por linha como o RealDictCursor
+- Acesso por atributo (linha.valor) e por chave (linha['valor']), então os
+  templates e o código que usava RealDictRow continuam funcionando
+- Uma classe por conjunto de colunas, criada uma vez e reaproveitada
+- Comporta-se como Mapping: dict(linha), pandas e JSON continuam funcionando
+"""
+
+from collections.abc import Mapping
+from functools import lru_cache
+
+from psycopg2.extensions import cursor
+
+
+class Linha(Mapping):
+    """Base das linhas: os nomes das colunas ficam na classe, os valores na tupla"""
+
+    __slots__ = ('_valores',)
+    _campos = ()
+    _indices = {}
+
+    def __init__(self, valores):
+        self._valores = valores
+
+    def __getitem__(self, chave):
+        return self._valores[self._indices[chave]]
+
+    def get(self, chave, padrao=None):
+        indice = self._indices.get(chave)
+        return padrao if indice is None else self._valores[indice]
+
+    def __contains__(self, chave):
+        return chave in self._indices
+
+    def __iter__(self):
+        return iter(self._campos)
+
+    def __len__(self):
+        return len(self._campos)
+
+    def __repr__(self):
+        return f'Linha({dict(zip(self._campos, self._valores))!r})'
+
+    def __reduce__(self):
+        return criar_linha, (self._campos, self._valores)
+
+    def _asdict(self):
+        return dict(zip(self._campos, self._valores))
+
+
+def _propriedade(indice):
+    return property(lambda self: self._valores[indice])
+
+
+@lru_cache(maxsize=256)
+def classe_linha(campos):
+    """Classe de linha para uma tupla de nomes de colunas (cacheada)"""
+    atributos = {
+        '__slots__': (),
+        '_campos': campos,
+        '_indices': {nome: i for i, nome in enumerate(campos)},
+    }
+    for indice, nome in enumerate(campos):
+        # Coluna com nome de método (get, keys...) fica só no acesso por chave
+        if nome.isidentifier() and not hasattr(Linha, nome):
+            atributos[nome] = _propriedade(indice)
+    return type('Linha', (Linha,), atributos)
+
+
+def criar_linha(campos, valores):
+    return classe_linha(tuple(campos))(tuple(valores))
+
+
+class CursorLinhas(cursor):
+    """Cursor que devolve Linha em vez de tupla ou dict"""
+
+    def _classe(self):
+        return classe_linha(tuple(coluna.name for coluna in self.description))
+
+    def fetchone(self):
+        valores = super().fetchone()
+        return None if valores is None else self._classe()(valores)
+
+    def fetchmany(self, size=None):
+        valores = super().fetchmany(self.arraysize if size is None else size)
+        if not valores:
+            return []
+        classe = self._classe()
+        return [classe(v) for v in valores]
+
+    def fetchall(self):
+        valores = super().fetchall()
+        if not valores:
+            return []
+        classe = self._classe()
+        return [classe(v) for v in valores]
+
+    def __iter__(self):
+        iterador = super().__iter__()
+        try:
+            primeira = next(iterador)
+        except StopIteration:
+            return
+        classe = self._classe()
+        yield classe(primeira)
+        for valores in iterador:
+            yield classe(valores)
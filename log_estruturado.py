@@ -0,0 +1,219 @@
+"""
+Logging Estruturado e Não Bloqueante
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- Uma linha JSON por evento (horário, nível, logger, mensagem, request_id...)
+- Quem loga só enfileira: a escrita em stdout/arquivo roda numa thread à parte,
+  ligada no primeiro log de cada processo (worker criado por fork depois do
+  import, como no gunicorn --preload, ganha a sua) e parada no atexit
+- request_id em todas as linhas da requisição (aceita X-Request-ID do proxy)
+- Amostragem de logs DEBUG/INFO de caminhos quentes; WARNING+ sempre passa
+
+Uso:
+    from log_estruturado import configurar_logging
+    configurar_logging(arquivo='logs/app.log')
+    logger = logging.getLogger(__name__)
+    logger.info("mensagem", extra={'usuario_id': 1})
+    logger.info("caminho quente", extra={'amostra': 0.01})  # registra ~1%
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+
+# ============== CONFIGURAÇÕES ==============
+
+LOG_NIVEL = os.getenv('LOG_NIVEL', 'INFO').upper()
+
+# 'json' (padrão) ou 'texto' para leitura no terminal
+LOG_FORMATO = os.getenv('LOG_FORMATO', 'json').lower()
+
+# Taxa de amostragem por logger para DEBUG/INFO: "metricas=0.1,app=0.5"
+LOG_AMOSTRAGEM = {
+    nome.strip(): float(taxa)
+    for nome, _, taxa in (item.partition('=') for item in os.getenv('LOG_AMOSTRAGEM', '').split(','))
+    if nome.strip() and taxa
+}
+
+# Atributos padrão do LogRecord; o que sobrar veio do extra= e vai para o JSON
+CAMPOS_PADRAO = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'amostra'}
+
+_listener = None
+_listener_pid = None
+_destinos = None  # (fila, handlers): o listener é recriado em cada processo
+_lock_listener = threading.Lock()
+
+
+# ============== FILTROS E FORMATADORES ==============
+
+class FiltroRequestId(logging.Filter):
+    """Anota o request_id da requisição atual (roda na thread de quem loga)"""
+
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = g.get('request_id', '-') if has_request_context() else '-'
+        return True
+
+
+class FiltroAmostragem(logging.Filter):
+    """Deixa passar só uma fração dos DEBUG/INFO de loggers ou chamadas marcadas"""
+
+    def __init__(self, taxas=None):
+        super().__init__()
+        self.taxas = LOG_AMOSTRAGEM if taxas is None else taxas
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        taxa = getattr(record, 'amostra', None)
+        if taxa is None:
+            taxa = self.taxas.get(record.name)
+        return taxa is None or random.random() < taxa
+
+
+class FormatadorJSON(logging.Formatter):
+    """Uma linha JSON por registro, com os campos do extra="""
+
+    def format(self, record):
+        evento = {
+            'horario': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensagem': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-'),
+            'pid': record.process,
+        }
+        for chave, valor in vars(record).items():
+            if chave not in CAMPOS_PADRAO and chave not in evento:
+                evento[chave] = valor
+        if record.exc_text:
+            evento['excecao'] = record.exc_text
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+
+class HandlerFila(logging.handlers.QueueHandler):
+    """QueueHandler que preserva a mensagem e o traceback já formatados"""
+
+    def enqueue(self, record):
+        iniciar_listener()
+        super().enqueue(record)
+
+    def prepare(self, record):
+        # Formata aqui porque args e exc_info podem não sobreviver à fila
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+# ============== CONFIGURAÇÃO ==============
+
+def configurar_logging(arquivo=None, nivel=LOG_NIVEL, formato=LOG_FORMATO):
+    """Troca os handlers do logger raiz por uma fila escrita em segundo plano
+
+    A thread que escreve só começa no primeiro log (iniciar_listener).
+    """
+    global _destinos
+    encerrar_logging()
+
+    if formato == 'json':
+        formatador = FormatadorJSON()
+    else:
+        formatador = logging.Formatter('%(asctime)s - %(levelname)s - [%(request_id)s] %(message)s')
+
+    destinos = [logging.StreamHandler(sys.stdout)]
+    if arquivo:
+        os.makedirs(os.path.dirname(arquivo) or '.', exist_ok=True)
+        destinos.append(logging.FileHandler(arquivo, encoding='utf-8'))
+    for destino in destinos:
+        destino.setFormatter(formatador)
+
+    # Fila sem limite: logar nunca espera pelo disco ou pelo stdout
+    fila = queue.SimpleQueue()
+    handler = HandlerFila(fila)
+    handler.addFilter(FiltroAmostragem())
+    handler.addFilter(FiltroRequestId())
+
+    raiz = logging.getLogger()
+    for antigo in raiz.handlers[:]:
+        raiz.removeHandler(antigo)
+    raiz.addHandler(handler)
+    raiz.setLevel(nivel)
+
+    _destinos = (fila, destinos)
+
+
+def iniciar_listener():
+    """Liga a thread de escrita neste processo, se ainda não ligou
+
+    Threads não sobrevivem ao fork: o worker vê o pid diferente do listener
+    herdado e liga o seu, com a mesma fila e os mesmos destinos.
+    """
+    global _listener, _listener_pid
+    if _destinos is None or _listener_pid == os.getpid():
+        return
+    with _lock_listener:
+        if _listener_pid == os.getpid():
+            return
+        fila, destinos = _destinos
+        _listener = logging.handlers.QueueListener(fila, *destinos, respect_handler_level=True)
+        _listener.start()
+        _listener_pid = os.getpid()
+
+
+def _apos_fork():
+    """No worker: trava e fila novas (a herdada traz o que o pai ainda vai escrever)"""
+    global _lock_listener, _destinos
+    _lock_listener = threading.Lock()  # Podia estar preso por outra thread do pai
+    if _destinos is not None:
+        fila = queue.SimpleQueue()
+        for handler in logging.getLogger().handlers:
+            if isinstance(handler, HandlerFila):
+                handler.queue = fila
+        _destinos = (fila, _destinos[1])
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_apos_fork)
+
+
+@atexit.register
+def encerrar_logging():
+    """Esvazia a fila antes de o processo terminar (só o listener deste processo)"""
+    global _listener, _listener_pid
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+    _listener = None
+    _listener_pid = None
+
+
+# ============== REQUEST ID ==============
+
+def atribuir_request_id():
+    # Aproveita o id do proxy (Render/nginx), limitado para não poluir o log
+    g.request_id = request.headers.get('X-Request-ID', '')[:64] or uuid.uuid4().hex[:16]
+
+
+def devolver_request_id(response):
+    response.headers['X-Request-ID'] = g.get('request_id', '-')
+    return response
+
+
+def registrar(app):
+    """Gera/propaga o X-Request-ID em cada requisição"""
+    app.before_request(atribuir_request_id)
+    app.after_request(devolver_request_id)
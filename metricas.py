@@ -0,0 +1,381 @@
+"""
+Métricas de Desempenho (formato Prometheus)
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- Registro de contadores e histogramas por processo (thread-safe)
+- Snapshot periódico em disco para agregar os workers do gunicorn
+  (<pid>-<início do processo>.json; de processo que já morreu é apagado),
+  em diretório 0700 do usuário do app e arquivos 0600
+- Cursor e conexão psycopg2 que cronometram cada comando SQL e commit
+- Exportação no formato texto do Prometheus (/metrics)
+
+As consultas são identificadas pelo comentário /* consulta: nome */ no SQL;
+sem ele, o nome vira <comando>_<tabela> (ex.: select_transacoes).
+"""
+
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+from flask import g, has_request_context, request
+from psycopg2 import OperationalError
+from psycopg2.extensions import QueryCanceledError, connection
+
+from diretorio_privado import abrir_privado, preparar_diretorio
+from linhas import CursorLinhas
+
+# ============== CONFIGURAÇÕES ==============
+
+METRICAS_DIR = os.getenv('METRICAS_DIR', os.path.join(tempfile.gettempdir(), 'simplifica_metricas'))
+
+# Intervalo mínimo (s) entre gravações do snapshot deste worker
+INTERVALO_SNAPSHOT = float(os.getenv('METRICAS_INTERVALO', 1.0))
+
+# Limites dos histogramas em segundos
+BUCKETS_REQUISICAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+DESCRICOES = {
+    'simplifica_requisicoes_total': ('counter', 'Requisições HTTP atendidas, por rota, método e status'),
+    'simplifica_requisicao_segundos': ('histogram', 'Latência das requisições HTTP'),
+    'simplifica_requisicao_db_segundos': ('histogram', 'Tempo gasto no banco por requisição'),
+    'simplifica_consulta_segundos': ('histogram', 'Duração de cada comando SQL, por rota e consulta'),
+    'simplifica_consultas_total': ('counter', 'Comandos SQL executados, por rota e consulta'),
+    'simplifica_consultas_interrompidas_total': ('counter', 'Comandos SQL interrompidos por timeout ou cancelamento'),
+    'simplifica_requisicoes_rejeitadas_total': ('counter', 'Requisições recusadas com 503 pelo controle de admissão'),
+    'simplifica_admissao_espera_segundos': ('histogram', 'Espera na fila do controle de admissão'),
+    'simplifica_disjuntor_aberturas_total': ('counter', 'Vezes que o disjuntor do banco abriu'),
+    'simplifica_snapshots_servidos_total': ('counter', 'Dashboards servidos do último snapshot bom'),
+    'simplifica_leituras_roteadas_total': ('counter', 'Conexões de rotas de leitura, por destino (réplica ou primário) e motivo'),
+}
+
+RE_NOME_CONSULTA = re.compile(r'/\*\s*consulta:\s*([\w.-]+)\s*\*/')
+RE_COMANDO_TABELA = re.compile(
+    r'^\s*(select|insert|update|delete|create|alter)\b(?:.*?\b(?:from|into|table)\b)?\s+(?:if\s+not\s+exists\s+)?(\w+)',
+    re.IGNORECASE | re.DOTALL
+)
+
+
+# ============== REGISTRO ==============
+
+def inicio_processo(pid):
+    """Início do processo em ticks desde o boot (/proc/<pid>/stat), ou None sem /proc ou sem o processo"""
+    try:
+        with open(f'/proc/{pid}/stat', encoding='utf-8') as f:
+            dados = f.read()
+    except OSError:
+        return None
+    # Campo 22; o nome do programa (campo 2, entre parênteses) pode ter espaços
+    return dados.rsplit(')', 1)[1].split()[19]
+
+
+def processo_vivo(pid, inicio):
+    """O processo pid ainda é o mesmo que gravou o snapshot (pid reaproveitado não conta)?"""
+    atual = inicio_processo(pid)
+    if atual is not None:
+        return atual == inicio
+    try:
+        os.kill(pid, 0)  # Sem /proc: só dá para saber se o pid existe
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class RegistroMetricas:
+    """Contadores e histogramas deste processo, com snapshot em disco"""
+
+    def __init__(self, diretorio=METRICAS_DIR, intervalo=INTERVALO_SNAPSHOT):
+        self.diretorio = diretorio
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._contadores = {}
+        self._histogramas = {}
+        self._buckets = {}
+        self._ultimo_snapshot = 0.0
+        self._identidade = None  # (pid, nome do arquivo) do processo atual; refeita após fork
+        preparar_diretorio(self.diretorio)  # Outro usuário não planta snapshots no /metrics
+
+    def _arquivo_proprio(self):
+        """<pid>-<início>.json: pid reaproveitado grava em outro arquivo em vez de zerar o antigo"""
+        pid = os.getpid()
+        if self._identidade is None or self._identidade[0] != pid:
+            inicio = inicio_processo(pid) or str(time.time_ns())
+            self._identidade = (pid, f'{pid}-{inicio}.json')
+        return self._identidade[1]
+
+    @staticmethod
+    def _chave(nome, labels):
+        return (nome, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+    def incrementar(self, nome, valor=1, **labels):
+        chave = self._chave(nome, labels)
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def observar(self, nome, valor, buckets=BUCKETS_REQUISICAO, **labels):
+        chave = self._chave(nome, labels)
+        with self._lock:
+            self._buckets.setdefault(nome, buckets)
+            hist = self._histogramas.get(chave)
+            if hist is None:
+                hist = self._histogramas[chave] = [0] * len(buckets) + [0.0, 0]
+            for i, limite in enumerate(buckets):
+                if valor <= limite:
+                    hist[i] += 1
+            hist[-2] += valor
+            hist[-1] += 1
+
+    # ---------- snapshot / agregação entre workers ----------
+
+    def _estado(self):
+        with self._lock:
+            return {
+                'contadores': [[n, list(map(list, l)), v] for (n, l), v in self._contadores.items()],
+                'histogramas': [[n, list(map(list, l)), list(h)] for (n, l), h in self._histogramas.items()],
+                'buckets': {n: list(b) for n, b in self._buckets.items()},
+            }
+
+    def gravar_snapshot(self, forcar=False):
+        """Grava o estado deste worker em <dir>/<pid>-<início>.json (no máximo 1x por intervalo)"""
+        agora = time.monotonic()
+        if not forcar and agora - self._ultimo_snapshot < self.intervalo:
+            return
+        self._ultimo_snapshot = agora
+
+        destino = os.path.join(self.diretorio, self._arquivo_proprio())
+        temporario = f'{destino}.tmp'
+        with abrir_privado(temporario) as f:
+            json.dump(self._estado(), f)
+        os.replace(temporario, destino)  # troca atômica: quem lê nunca vê arquivo pela metade
+
+    def agregar(self):
+        """Soma os snapshots dos workers vivos (o deste processo vem da memória)
+
+        Snapshot de processo que já terminou é apagado: o contador some do
+        total e o Prometheus trata a queda como reinício do contador.
+        """
+        estados = [self._estado()]
+        proprio = self._arquivo_proprio()
+        for arquivo in os.listdir(self.diretorio):
+            if not arquivo.endswith('.json') or arquivo == proprio:
+                continue
+            pid, _, inicio = arquivo[:-len('.json')].partition('-')
+            if not pid.isdigit() or not processo_vivo(int(pid), inicio):
+                try:
+                    os.remove(os.path.join(self.diretorio, arquivo))
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(os.path.join(self.diretorio, arquivo), encoding='utf-8') as f:
+                    estados.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+
+        contadores, histogramas, buckets = {}, {}, {}
+        for estado in estados:
+            buckets.update({n: tuple(b) for n, b in estado['buckets'].items()})
+            for nome, labels, valor in estado['contadores']:
+                chave = (nome, tuple(map(tuple, labels)))
+                contadores[chave] = contadores.get(chave, 0) + valor
+            for nome, labels, hist in estado['histogramas']:
+                chave = (nome, tuple(map(tuple, labels)))
+                atual = histogramas.get(chave)
+                histogramas[chave] = hist if atual is None else [a + b for a, b in zip(atual, hist)]
+        return contadores, histogramas, buckets
+
+    def exportar_prometheus(self):
+        """Texto no formato de exposição do Prometheus (version 0.0.4)"""
+        contadores, histogramas, buckets = self.agregar()
+
+        def formatar_labels(labels, extra=()):
+            pares = list(labels) + list(extra)
+            if not pares:
+                return ''
+            texto = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pares)
+            return '{' + texto + '}'
+
+        linhas = []
+        nomes = sorted({n for n, _ in contadores} | {n for n, _ in histogramas})
+        for nome in nomes:
+            tipo, descricao = DESCRICOES.get(nome, ('untyped', nome))
+            linhas.append(f'# HELP {nome} {descricao}')
+            linhas.append(f'# TYPE {nome} {tipo}')
+            for (n, labels), valor in sorted(contadores.items()):
+                if n == nome:
+                    linhas.append(f'{nome}{formatar_labels(labels)} {valor}')
+            for (n, labels), hist in sorted(histogramas.items()):
+                if n != nome:
+                    continue
+                for limite, quantidade in zip(buckets[nome], hist):
+                    linhas.append(f'{nome}_bucket{formatar_labels(labels, [("le", limite)])} {quantidade}')
+                linhas.append(f'{nome}_bucket{formatar_labels(labels, [("le", "+Inf")])} {hist[-1]}')
+                linhas.append(f'{nome}_sum{formatar_labels(labels)} {hist[-2]}')
+                linhas.append(f'{nome}_count{formatar_labels(labels)} {hist[-1]}')
+        return '\n'.join(linhas) + '\n'
+
+
+registro = RegistroMetricas()
+
+
+# ============== INSTRUMENTAÇÃO SQL ==============
+
+def nome_consulta(sql):
+    """Nome da consulta pelo comentário /* consulta: x */ ou por comando + tabela"""
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    sql = str(sql)
+    marcado = RE_NOME_CONSULTA.search(sql)
+    if marcado:
+        return marcado.group(1)
+    comando = RE_COMANDO_TABELA.search(sql)
+    if comando:
+        return f'{comando.group(1).lower()}_{comando.group(2).lower()}'
+    return 'outra'
+
+
+def rota_atual():
+    if has_request_context():
+        return request.endpoint or 'desconhecida'
+    return 'fora_de_requisicao'
+
+
+def registrar_consulta(consulta, duracao, sql=None):
+    """Contabiliza uma ida ao banco no registro e na lista da requisição atual
+
+    sql fica None para idas que não são comandos (conexão, commit, rollback).
+    """
+    rota = rota_atual()
+    registro.observar('simplifica_consulta_segundos', duracao, buckets=BUCKETS_CONSULTA,
+                      rota=rota, consulta=consulta)
+    registro.incrementar('simplifica_consultas_total', rota=rota, consulta=consulta)
+    if has_request_context():
+        g.tempo_db = g.get('tempo_db', 0.0) + duracao
+        if 'consultas' not in g:
+            g.consultas = []
+        g.consultas.append((consulta, sql, duracao))
+
+
+# Momento (monotonic) do último comando SQL que deu certo neste processo
+_ultima_consulta_ok = None
+
+
+def consulta_ok():
+    """Marca um comando SQL bem-sucedido (para a prontidão)"""
+    global _ultima_consulta_ok
+    _ultima_consulta_ok = time.monotonic()
+
+
+def idade_ultima_consulta():
+    """Segundos desde o último comando SQL bem-sucedido (None se nunca houve)"""
+    if _ultima_consulta_ok is None:
+        return None
+    return time.monotonic() - _ultima_consulta_ok
+
+
+def registrar_interrupcao(consulta, erro, motivo=None):
+    """Conta um comando cancelado por statement_timeout, pelo vigia ou por pg_cancel"""
+    if motivo is None:
+        motivo = 'timeout' if 'statement timeout' in str(erro) else 'cancelada'
+    registro.incrementar('simplifica_consultas_interrompidas_total', rota=rota_atual(),
+                         consulta=consulta, motivo=motivo)
+    return motivo
+
+
+def registrar_erro_banco(consulta, erro, conn):
+    """Falhas de conexão e timeouts contam para o disjuntor da conexão; cancelamentos pedidos não"""
+    if isinstance(erro, QueryCanceledError):
+        motivo = registrar_interrupcao(consulta, erro, getattr(conn, 'motivo_cancelamento', None))
+        if motivo != 'timeout':
+            return
+    disjuntor = getattr(conn, 'disjuntor', None)
+    if disjuntor is not None:
+        disjuntor.falha()
+
+
+def registrar_sucesso_banco(conn):
+    consulta_ok()
+    disjuntor = getattr(conn, 'disjuntor', None)
+    if disjuntor is not None:
+        disjuntor.sucesso()
+
+
+class CursorMedido(CursorLinhas):
+    """Cursor de linhas compactas que cronometra cada execute/executemany"""
+
+    def execute(self, query, vars=None):
+        inicio = time.perf_counter()
+        try:
+            resultado = super().execute(query, vars)
+            registrar_sucesso_banco(self.connection)
+            return resultado
+        except OperationalError as e:
+            registrar_erro_banco(nome_consulta(query), e, self.connection)
+            raise
+        finally:
+            registrar_consulta(nome_consulta(query), time.perf_counter() - inicio, query)
+
+    def executemany(self, query, vars_list):
+        inicio = time.perf_counter()
+        try:
+            resultado = super().executemany(query, vars_list)
+            registrar_sucesso_banco(self.connection)
+            return resultado
+        except OperationalError as e:
+            registrar_erro_banco(nome_consulta(query), e, self.connection)
+            raise
+        finally:
+            registrar_consulta(nome_consulta(query), time.perf_counter() - inicio, query)
+
+
+class ConexaoMedida(connection):
+    """Conexão que também conta commit e rollback como idas ao banco
+
+    disjuntor: o do banco de onde a conexão veio (primário, réplica ou shard),
+    definido pelo pool; sem ele (scripts), erros não abrem disjuntor nenhum.
+    """
+
+    disjuntor = None
+
+    def commit(self):
+        inicio = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            registrar_consulta('commit', time.perf_counter() - inicio)
+
+    def rollback(self):
+        inicio = time.perf_counter()
+        try:
+            return super().rollback()
+        finally:
+            registrar_consulta('rollback', time.perf_counter() - inicio)
+
+
+# ============== INSTRUMENTAÇÃO HTTP ==============
+
+def iniciar_requisicao():
+    g.inicio_requisicao = time.perf_counter()
+    g.tempo_db = 0.0
+    g.consultas = []
+
+
+def finalizar_requisicao(response):
+    inicio = g.get('inicio_requisicao')
+    if inicio is None:
+        return response
+
+    rota = request.endpoint or 'desconhecida'
+    registro.observar('simplifica_requisicao_segundos', time.perf_counter() - inicio,
+                      rota=rota, metodo=request.method)
+    registro.observar('simplifica_requisicao_db_segundos', g.get('tempo_db', 0.0), rota=rota)
+    registro.incrementar('simplifica_requisicoes_total', rota=rota, metodo=request.method,
+                         status=response.status_code)
+    registro.gravar_snapshot()
+    return response
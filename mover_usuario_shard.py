@@ -0,0 +1,212 @@
+"""
+Rebalanceamento de Contas entre Shards
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- Move uma conta (usuário, categorias, transações ativas e arquivadas,
+  metas) de um shard para outro com o app no ar
+- A conta fica só leitura enquanto é copiada (mapa_usuarios.movendo); as
+  demais contas do shard não são afetadas
+- Ids de categoria, transação e meta são gerados de novo no destino (cada
+  shard tem as suas sequências); o usuario_id não muda
+- Transações arquivadas chegam como ativas no destino e voltam ao arquivo
+  na próxima execução de arquivo_transacoes.py
+- Regras de recorrência vão com gerada_ate (nada é gerado de novo); as
+  ocorrências copiadas chegam sem recorrencia_id
+- Confere quantidade e soma antes de trocar o diretório; a origem só é
+  apagada depois que todos os workers já leem do destino
+
+Uso:
+    python mover_usuario_shard.py mover <usuario_id> <shard_destino> [--espera 30]
+    python mover_usuario_shard.py contagem
+"""
+
+import argparse
+import logging
+import time
+
+from psycopg2.extras import execute_values
+
+from arquivo_transacoes import COLUNAS_TRANSACAO
+from limites_consulta import TIMEOUTS_ROTA_MS
+from particionar_transacoes import conectar
+from shards import SHARDS_CACHE_TTL, dsns_configurados
+
+logger = logging.getLogger(__name__)
+
+# ============== CONFIGURAÇÕES ==============
+
+# Workers notarem a conta em mudança + transações de escrita que já tinham começado
+ESPERA_PADRAO = SHARDS_CACHE_TTL + max(TIMEOUTS_ROTA_MS.values()) / 1000
+
+COLUNAS_SEM_ID = ', '.join(c.strip() for c in COLUNAS_TRANSACAO.split(',') if c.strip() != 'id')
+
+
+def conectar_shard(numero):
+    """Shard 0 é DATABASE_URL; os demais vêm de DATABASE_SHARDS"""
+    if numero == 0:
+        return conectar()
+    dsns = dsns_configurados()
+    if not 1 <= numero <= len(dsns):
+        raise SystemExit(f'Shard {numero} não configurado em DATABASE_SHARDS')
+    return conectar(dsns[numero - 1])
+
+
+def copiar_linhas(origem, destino, tabela, usuario_id, colunas, mapear=None):
+    """Copia as linhas do usuário (sem o id) e devolve quantas copiou"""
+    origem.execute(f'SELECT {colunas} FROM {tabela} WHERE usuario_id = %s', (usuario_id,))
+    linhas = [tuple(linha.values()) for linha in origem.fetchall()]
+    if mapear:
+        linhas = [mapear(linha) for linha in linhas]
+    execute_values(destino, f'INSERT INTO {tabela} ({colunas}) VALUES %s', linhas, page_size=1000)
+    return len(linhas)
+
+
+def copiar_usuario(origem, destino, usuario_id):
+    """Copia a conta inteira para o destino (sem commit)"""
+    # FOR UPDATE: inserções da conta (que travam o usuário pela FK) esperam ou já terminaram
+    origem.execute('SELECT * FROM usuarios WHERE id = %s FOR UPDATE', (usuario_id,))
+    usuario = origem.fetchone()
+    if usuario is None:
+        raise SystemExit(f'Usuário {usuario_id} não está no shard de origem')
+    colunas = ', '.join(usuario.keys())
+    destino.execute(f'INSERT INTO usuarios ({colunas}) VALUES %s', (tuple(usuario.values()),))
+
+    # Categorias ganham ids novos; transações passam a apontar para eles
+    origem.execute('''
+        SELECT id, nome, tipo, cor, data_criacao FROM categorias_personalizadas WHERE usuario_id = %s
+    ''', (usuario_id,))
+    novas_categorias = {}
+    for categoria in origem.fetchall():
+        destino.execute('''
+            INSERT INTO categorias_personalizadas (usuario_id, nome, tipo, cor, data_criacao)
+            VALUES (%s, %s, %s, %s, %s) RETURNING id
+        ''', (usuario_id, categoria['nome'], categoria['tipo'], categoria['cor'], categoria['data_criacao']))
+        novas_categorias[categoria['id']] = destino.fetchone()['id']
+
+    posicao = COLUNAS_SEM_ID.split(', ').index('categoria_id')
+
+    def trocar_categoria(linha):
+        return linha[:posicao] + (novas_categorias[linha[posicao]],) + linha[posicao + 1:]
+
+    transacoes = 0
+    for tabela in ('transacoes', 'transacoes_arquivo'):
+        transacoes += copiar_linhas(origem, destino, tabela, usuario_id, COLUNAS_SEM_ID, trocar_categoria)
+    # Arquivadas entram em transacoes do destino; o resumo delas volta ao ser rearquivadas
+
+    origem.execute('SELECT * FROM metas WHERE usuario_id = %s LIMIT 0')
+    colunas_metas = ', '.join(c.name for c in origem.description if c.name != 'id')
+    metas = copiar_linhas(origem, destino, 'metas', usuario_id, colunas_metas)
+
+    origem.execute('SELECT * FROM recorrencias WHERE usuario_id = %s LIMIT 0')
+    colunas_recorrencias = [c.name for c in origem.description if c.name != 'id']
+    posicao_regra = colunas_recorrencias.index('categoria_id')
+
+    def trocar_categoria_regra(linha):
+        return linha[:posicao_regra] + (novas_categorias[linha[posicao_regra]],) + linha[posicao_regra + 1:]
+
+    copiar_linhas(origem, destino, 'recorrencias', usuario_id, ', '.join(colunas_recorrencias),
+                  trocar_categoria_regra)
+    return transacoes, metas
+
+
+def totais(cursor, usuario_id, tabelas):
+    """(quantidade, soma) das transações do usuário nas tabelas informadas"""
+    partes = ' UNION ALL '.join(
+        f'SELECT valor_centavos FROM {tabela} WHERE usuario_id = %s' for tabela in tabelas)
+    cursor.execute(f'SELECT COUNT(*) AS n, COALESCE(SUM(valor_centavos), 0) AS soma FROM ({partes}) t',
+                   (usuario_id,) * len(tabelas))
+    linha = cursor.fetchone()
+    return linha['n'], linha['soma']
+
+
+def marcar(diretorio, usuario_id, **campos):
+    sets = ', '.join(f'{campo} = %s' for campo in campos)
+    diretorio.cursor().execute(f'UPDATE mapa_usuarios SET {sets} WHERE usuario_id = %s',
+                               (*campos.values(), usuario_id))
+    diretorio.commit()
+
+
+def mover(usuario_id, destino_numero, espera=ESPERA_PADRAO):
+    diretorio = conectar_shard(0)
+    cursor = diretorio.cursor()
+    cursor.execute('SELECT shard, movendo FROM mapa_usuarios WHERE usuario_id = %s', (usuario_id,))
+    entrada = cursor.fetchone()
+    diretorio.commit()
+    if entrada is None:
+        raise SystemExit(f'Usuário {usuario_id} não está em mapa_usuarios')
+    if entrada['movendo']:
+        raise SystemExit(f'Usuário {usuario_id} já está sendo movido')
+    origem_numero = entrada['shard']
+    if origem_numero == destino_numero:
+        logger.info(f"Usuário {usuario_id} já está no shard {destino_numero}")
+        return
+
+    origem_conn = conectar_shard(origem_numero)
+    destino_conn = conectar_shard(destino_numero)
+    marcar(diretorio, usuario_id, movendo=True)
+    trocado = False
+    try:
+        logger.info(f"⏳ Conta {usuario_id} só leitura; aguardando {espera:.0f}s pelos workers")
+        time.sleep(espera)
+
+        origem, destino = origem_conn.cursor(), destino_conn.cursor()
+        inicio = time.perf_counter()
+        transacoes, metas = copiar_usuario(origem, destino, usuario_id)
+        antes = totais(origem, usuario_id, ('transacoes', 'transacoes_arquivo'))
+        depois = totais(destino, usuario_id, ('transacoes',))
+        if antes != depois:
+            raise RuntimeError(f'Conferência falhou: origem {antes} x destino {depois}')
+        destino_conn.commit()
+        marcar(diretorio, usuario_id, shard=destino_numero, movendo=False)
+        trocado = True
+        origem_conn.rollback()  # Solta o FOR UPDATE; a origem ainda serve quem tem cache velho
+        logger.info(f"🔀 Conta {usuario_id}: shard {origem_numero} -> {destino_numero} "
+                    f"({transacoes:,} transações, {metas} metas, {time.perf_counter() - inicio:.1f}s)")
+    finally:
+        if not trocado:
+            destino_conn.rollback()
+            origem_conn.rollback()
+            marcar(diretorio, usuario_id, movendo=False)
+
+    # Workers com o diretório antigo em cache ainda leem da origem por até um TTL
+    time.sleep(SHARDS_CACHE_TTL)
+    origem = origem_conn.cursor()
+    origem.execute('DELETE FROM transacoes_arquivo WHERE usuario_id = %s', (usuario_id,))
+    origem.execute('DELETE FROM usuarios WHERE id = %s', (usuario_id,))  # CASCADE no resto
+    origem_conn.commit()
+    logger.info(f"🧹 Conta {usuario_id} removida do shard {origem_numero}")
+
+    for conn in (diretorio, origem_conn, destino_conn):
+        conn.close()
+
+
+def contagem():
+    diretorio = conectar_shard(0)
+    cursor = diretorio.cursor()
+    cursor.execute('''
+        SELECT shard, COUNT(*) AS contas, COUNT(*) FILTER (WHERE movendo) AS movendo
+        FROM mapa_usuarios GROUP BY shard ORDER BY shard
+    ''')
+    for linha in cursor.fetchall():
+        logger.info(f"Shard {linha['shard']}: {linha['contas']:,} contas ({linha['movendo']} em mudança)")
+    diretorio.close()
+
+
+# ============== LINHA DE COMANDO ==============
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move contas entre shards')
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+    mover_cmd = subcomandos.add_parser('mover', help='Move uma conta para outro shard')
+    mover_cmd.add_argument('usuario_id', type=int)
+    mover_cmd.add_argument('destino', type=int, help='Número do shard de destino')
+    mover_cmd.add_argument('--espera', type=float, default=ESPERA_PADRAO,
+                           help='Segundos entre marcar a conta e copiar')
+    subcomandos.add_parser('contagem', help='Contas por shard')
+    args = parser.parse_args()
+
+    if args.comando == 'mover':
+        mover(args.usuario_id, args.destino, args.espera)
+    else:
+        contagem()
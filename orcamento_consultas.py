@@ -0,0 +1,147 @@
+"""
+Orçamento de Consultas e Detector de N+1
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- Conta comandos SQL e idas ao banco (conexão, commit) de cada requisição
+- Avisa no log sobre comandos repetidos ou quase iguais (padrão N+1)
+- Orçamento máximo de idas ao banco por rota, verificado em dev e nos testes
+- capturar_consultas() para os testes declararem e conferirem o orçamento
+
+Usa a lista g.consultas preenchida pela instrumentação de metricas.py.
+"""
+
+import logging
+import re
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# Idas ao banco permitidas por rota (conexão + comandos + commit/rollback;
+# rotas só de leitura pagam um rollback ao devolver a conexão ao pool)
+ORCAMENTOS_PADRAO = {
+    'dashboard': 6,
+    'listar_transacoes': 6,
+    'fragmento_resumo': 4,
+    'fragmento_transacoes': 4,
+    'fragmento_meta': 3,
+    'sugestoes': 4,
+    'recorrencias': 3,
+}
+
+# A partir de quantas repetições do mesmo comando normalizado avisamos
+LIMITE_REPETICOES = 3
+
+RE_COMENTARIO = re.compile(r'/\*.*?\*/|--[^\n]*', re.DOTALL)
+RE_TEXTO = re.compile(r"'(?:[^']|'')*'")
+RE_NUMERO = re.compile(r'\b\d+(?:\.\d+)?\b')
+RE_LISTA = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+RE_ESPACOS = re.compile(r'\s+')
+
+_coletores = []
+
+
+class OrcamentoExcedido(AssertionError):
+    """Uma rota fez mais idas ao banco do que o orçamento permite"""
+
+
+@dataclass
+class RelatorioConsultas:
+    """Resumo das idas ao banco de uma requisição"""
+    rota: str
+    comandos: int = 0
+    idas_ao_banco: int = 0
+    tempo_db: float = 0.0
+    repetidos: dict = field(default_factory=dict)
+
+    def excede(self, orcamento):
+        return orcamento is not None and self.idas_ao_banco > orcamento
+
+
+def normalizar_sql(sql):
+    """Forma canônica do comando: sem comentários, literais nem espaços extras"""
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    sql = RE_COMENTARIO.sub(' ', str(sql))
+    sql = RE_TEXTO.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = RE_NUMERO.sub('?', sql)
+    sql = RE_LISTA.sub('(?)', sql)
+    return RE_ESPACOS.sub(' ', sql).strip().lower()
+
+
+def montar_relatorio(rota, consultas):
+    """Monta o relatório a partir da lista (consulta, sql, duracao) da requisição"""
+    relatorio = RelatorioConsultas(rota=rota)
+    contagem = {}
+    for _, sql, duracao in consultas:
+        relatorio.idas_ao_banco += 1
+        relatorio.tempo_db += duracao
+        if sql is None:
+            continue
+        relatorio.comandos += 1
+        normalizado = normalizar_sql(sql)
+        contagem[normalizado] = contagem.get(normalizado, 0) + 1
+
+    relatorio.repetidos = {sql: n for sql, n in contagem.items() if n >= LIMITE_REPETICOES}
+    return relatorio
+
+
+@contextmanager
+def capturar_consultas():
+    """Coleta o RelatorioConsultas de cada requisição feita dentro do bloco"""
+    relatorios = []
+    _coletores.append(relatorios)
+    try:
+        yield relatorios
+    finally:
+        _coletores.remove(relatorios)
+
+
+def verificar_orcamento(relatorios, orcamentos=None):
+    """Levanta OrcamentoExcedido se alguma requisição passou do orçamento da rota"""
+    orcamentos = ORCAMENTOS_PADRAO if orcamentos is None else orcamentos
+    excessos = [
+        f"{r.rota}: {r.idas_ao_banco} idas ao banco (orçamento {orcamentos[r.rota]})"
+        for r in relatorios if r.excede(orcamentos.get(r.rota))
+    ]
+    if excessos:
+        raise OrcamentoExcedido('; '.join(excessos))
+
+
+def registrar(app, orcamentos=None, sempre_ativo=False):
+    """Liga a verificação ao app: loga repetições e estouros de orçamento
+
+    Roda em debug e em TESTING (ou sempre, com sempre_ativo). Em debug o
+    estouro vira exceção, para ninguém deixar passar.
+    """
+    orcamentos = ORCAMENTOS_PADRAO if orcamentos is None else orcamentos
+
+    @app.after_request
+    def verificar_consultas(response):
+        if not (sempre_ativo or app.debug or app.testing):
+            return response
+        consultas = g.get('consultas')
+        if not consultas:
+            return response
+
+        relatorio = montar_relatorio(request.endpoint or 'desconhecida', consultas)
+        response.headers['X-Consultas'] = f'{relatorio.comandos}/{relatorio.idas_ao_banco}'
+
+        for sql, vezes in relatorio.repetidos.items():
+            logger.warning(f"⚠️  Possível N+1 em {relatorio.rota}: {vezes}x {sql[:120]}")
+
+        orcamento = orcamentos.get(relatorio.rota)
+        if relatorio.excede(orcamento):
+            mensagem = (f"{relatorio.rota} fez {relatorio.idas_ao_banco} idas ao banco "
+                        f"(orçamento {orcamento})")
+            if app.debug:
+                raise OrcamentoExcedido(mensagem)
+            logger.warning(f"⚠️  {mensagem}")
+
+        for coletor in _coletores:
+            coletor.append(relatorio)
+        return response
@@ -0,0 +1,222 @@
+"""
+Migração de transacoes para Tabela Particionada
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- Cria transacoes_nova particionada por mês (mesmas colunas, PK (id, data))
+  com as partições desde a transação mais antiga até alguns meses à frente
+- Gatilho na tabela antiga espelha INSERT/UPDATE/DELETE na nova enquanto
+  a cópia roda, então o app segue no ar durante a migração
+- Copia em lotes por faixa de id, um commit por lote (FOR SHARE segura as
+  linhas do lote contra UPDATE concorrente até o lote terminar)
+- Troca final curta: renomeia as tabelas sob ACCESS EXCLUSIVE e mantém a
+  antiga como transacoes_legado para rollback
+
+Uso:
+    python particionar_transacoes.py tudo [--lote 50000] [--pausa 0.05]
+    python particionar_transacoes.py preparar | copiar [--desde-id N] | verificar | trocar
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+import psycopg2
+from dotenv import load_dotenv
+
+from linhas import CursorLinhas
+from log_estruturado import configurar_logging
+from particoes import PARTICOES_MESES_A_FRENTE, garantir_particoes, tabela_particionada
+
+load_dotenv()
+configurar_logging()
+logger = logging.getLogger(__name__)
+
+# ============== CONFIGURAÇÕES ==============
+
+LOTE_PADRAO = int(os.getenv('PARTICIONAR_LOTE', 50000))
+PAUSA_PADRAO = float(os.getenv('PARTICIONAR_PAUSA', 0.05))
+
+# Mesmos índices de criar_tabelas_se_necessario() em app.py
+INDICES = {
+    'idx_transacoes_usuario_id': '(usuario_id)',
+    'idx_transacoes_data': '(data)',
+    'idx_transacoes_usuario_categoria': '(usuario_id, categoria_id)',
+    'idx_transacoes_usuario_data': '(usuario_id, data)',
+}
+
+
+def conectar(dsn=None):
+    """Conexão própria, sem o statement_timeout curto do app (dsn de outro shard se informado)"""
+    url = dsn or os.getenv('DATABASE_URL')
+    opcoes = '-c statement_timeout=0'
+    if url:
+        url = url.replace('postgres://', 'postgresql://', 1)
+        return psycopg2.connect(url, cursor_factory=CursorLinhas, options=opcoes)
+    return psycopg2.connect(
+        host=os.getenv('DB_HOST', 'localhost'),
+        database=os.getenv('DB_NAME', 'gestao_financeira'),
+        user=os.getenv('DB_USER', 'postgres'),
+        password=os.getenv('DB_PASSWORD', ''),
+        cursor_factory=CursorLinhas,
+        options=opcoes,
+    )
+
+
+# ============== ETAPAS ==============
+
+def preparar(conn, meses_a_frente=PARTICOES_MESES_A_FRENTE):
+    """Tabela nova, partições, índices e gatilho de espelhamento; devolve o último id a copiar"""
+    cursor = conn.cursor()
+    if tabela_particionada(cursor, 'transacoes'):
+        raise SystemExit('transacoes já é particionada; nada a fazer')
+
+    cursor.execute("SELECT to_regclass('transacoes_nova') IS NULL AS nova")
+    if cursor.fetchone()['nova']:
+        cursor.execute('''
+            CREATE TABLE transacoes_nova (
+                LIKE transacoes INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+                PRIMARY KEY (id, data)
+            ) PARTITION BY RANGE (data)
+        ''')
+        cursor.execute('''
+            ALTER TABLE transacoes_nova
+                ADD FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE,
+                ADD FOREIGN KEY (categoria_id) REFERENCES categorias_personalizadas(id)
+        ''')
+
+    cursor.execute('SELECT MIN(data) AS inicio FROM transacoes')
+    inicio = cursor.fetchone()['inicio']
+    particoes = garantir_particoes(cursor, 'transacoes_nova', desde=inicio,
+                                   meses_a_frente=meses_a_frente, prefixo='transacoes')
+    logger.info(f"📦 {len(particoes)} partições mensais + transacoes_padrao")
+
+    for nome, colunas in INDICES.items():
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {nome}_nova ON transacoes_nova {colunas}')
+
+    # A partir daqui toda escrita na tabela antiga chega também na nova
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION transacoes_espelhar() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM transacoes_nova WHERE id = OLD.id AND data = OLD.data;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO transacoes_nova SELECT NEW.* ON CONFLICT DO NOTHING;
+            END IF;
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql
+    ''')
+    cursor.execute('DROP TRIGGER IF EXISTS transacoes_espelhar ON transacoes')
+    cursor.execute('''
+        CREATE TRIGGER transacoes_espelhar
+        AFTER INSERT OR UPDATE OR DELETE ON transacoes
+        FOR EACH ROW EXECUTE FUNCTION transacoes_espelhar()
+    ''')
+    conn.commit()
+
+    # CREATE TRIGGER espera as escritas em andamento: ids acima daqui vêm pelo gatilho
+    cursor.execute('SELECT COALESCE(MAX(id), 0) AS ultimo FROM transacoes')
+    ultimo = cursor.fetchone()['ultimo']
+    conn.commit()
+    cursor.close()
+    logger.info(f"🪞 Gatilho de espelhamento ativo; copiar ids até {ultimo:,}")
+    return ultimo
+
+
+def copiar(conn, ate_id, desde_id=0, lote=LOTE_PADRAO, pausa=PAUSA_PADRAO):
+    """Copia (desde_id, ate_id] em lotes; pode ser retomado com --desde-id"""
+    cursor = conn.cursor()
+    atual = desde_id
+    inicio = time.perf_counter()
+    while atual < ate_id:
+        fim = min(atual + lote, ate_id)
+        cursor.execute('''
+            INSERT INTO transacoes_nova
+            SELECT * FROM transacoes WHERE id > %s AND id <= %s
+            FOR SHARE
+            ON CONFLICT DO NOTHING
+        ''', (atual, fim))
+        conn.commit()
+        atual = fim
+        decorrido = time.perf_counter() - inicio
+        logger.info(f"➡️  Copiado até id {atual:,} de {ate_id:,} ({decorrido:.0f}s)")
+        if pausa:
+            time.sleep(pausa)  # Folga para o autovacuum e para as réplicas
+    cursor.close()
+
+
+def verificar(conn):
+    """Compara quantidade e soma das duas tabelas; True se baterem"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT
+            (SELECT COUNT(*) FROM transacoes) AS linhas_antiga,
+            (SELECT COUNT(*) FROM transacoes_nova) AS linhas_nova,
+            (SELECT COALESCE(SUM(valor_centavos), 0) FROM transacoes) AS soma_antiga,
+            (SELECT COALESCE(SUM(valor_centavos), 0) FROM transacoes_nova) AS soma_nova
+    ''')
+    r = cursor.fetchone()
+    conn.commit()
+    cursor.close()
+    ok = r['linhas_antiga'] == r['linhas_nova'] and r['soma_antiga'] == r['soma_nova']
+    logger.info(f"{'✅' if ok else '❌'} Linhas {r['linhas_antiga']:,} x {r['linhas_nova']:,}; "
+                f"soma {r['soma_antiga']} x {r['soma_nova']}")
+    return ok
+
+
+def trocar(conn, espera_trava='5s'):
+    """Troca as tabelas numa transação curta; a antiga vira transacoes_legado"""
+    cursor = conn.cursor()
+    # Sem fila atrás da trava: se não conseguir logo, desiste e pode tentar de novo
+    cursor.execute('SET LOCAL lock_timeout = %s', (espera_trava,))
+    cursor.execute('LOCK TABLE transacoes IN ACCESS EXCLUSIVE MODE')
+    cursor.execute('DROP TRIGGER transacoes_espelhar ON transacoes')
+    cursor.execute('ALTER TABLE transacoes RENAME TO transacoes_legado')
+    cursor.execute('ALTER TABLE transacoes_legado RENAME CONSTRAINT transacoes_pkey TO transacoes_legado_pkey')
+    for nome in INDICES:
+        cursor.execute(f'ALTER INDEX IF EXISTS {nome} RENAME TO {nome}_legado')
+    cursor.execute('ALTER TABLE transacoes_nova RENAME TO transacoes')
+    cursor.execute('ALTER TABLE transacoes RENAME CONSTRAINT transacoes_nova_pkey TO transacoes_pkey')
+    for nome in INDICES:
+        cursor.execute(f'ALTER INDEX {nome}_nova RENAME TO {nome}')
+    # Sem isso, um DROP da tabela legada levaria junto a sequência dos ids
+    cursor.execute('ALTER SEQUENCE transacoes_id_seq OWNED BY transacoes.id')
+    cursor.execute('DROP FUNCTION transacoes_espelhar()')
+    conn.commit()
+    cursor.close()
+    logger.info("🔁 transacoes agora é particionada; a antiga ficou em transacoes_legado")
+
+
+# ============== LINHA DE COMANDO ==============
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Migra transacoes para tabela particionada por mês')
+    parser.add_argument('etapa', choices=['tudo', 'preparar', 'copiar', 'verificar', 'trocar'])
+    parser.add_argument('--lote', type=int, default=LOTE_PADRAO, help='Linhas por lote (faixa de id)')
+    parser.add_argument('--pausa', type=float, default=PAUSA_PADRAO, help='Segundos entre lotes')
+    parser.add_argument('--desde-id', type=int, default=0, help='Retoma a cópia a partir deste id')
+    parser.add_argument('--meses-a-frente', type=int, default=PARTICOES_MESES_A_FRENTE)
+    args = parser.parse_args()
+
+    conn = conectar()
+    try:
+        if args.etapa in ('tudo', 'preparar'):
+            ultimo = preparar(conn, args.meses_a_frente)
+        if args.etapa == 'copiar':
+            cursor = conn.cursor()
+            cursor.execute('SELECT COALESCE(MAX(id), 0) AS ultimo FROM transacoes')
+            ultimo = cursor.fetchone()['ultimo']
+            conn.commit()
+            cursor.close()
+        if args.etapa in ('tudo', 'copiar'):
+            copiar(conn, ultimo, args.desde_id, args.lote, args.pausa)
+        if args.etapa in ('tudo', 'verificar'):
+            if not verificar(conn):
+                sys.exit(1)
+        if args.etapa in ('tudo', 'trocar'):
+            trocar(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,144 @@
+"""
+Partições Mensais de Transações
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- transacoes particionada por RANGE (data), uma partição por mês
+  (transacoes_2025_01, ...) e transacoes_padrao para datas fora das faixas
+- Partições dos próximos meses criadas com antecedência: na subida do app
+  e por uma thread de manutenção nos processos que ficam de pé por dias
+- Filtros de mês como faixa de datas (data >= início AND data < fim), que
+  o planejador consegue podar; TO_CHAR/EXTRACT em data varrem tudo
+
+Bancos ainda com a tabela antiga (sem partições) continuam funcionando; a
+migração é feita à parte por particionar_transacoes.py.
+"""
+
+import logging
+import os
+import threading
+from datetime import date, datetime
+
+logger = logging.getLogger(__name__)
+
+# ============== CONFIGURAÇÕES ==============
+
+PARTICOES_MESES_A_FRENTE = int(os.getenv('PARTICOES_MESES_A_FRENTE', 3))
+PARTICOES_INTERVALO = float(os.getenv('PARTICOES_INTERVALO', 6 * 3600))
+
+# Evita dois workers criando a mesma partição ao mesmo tempo
+TRAVA_PARTICOES = 'simplifica_particoes_transacoes'
+
+
+# ============== DATAS ==============
+
+def inicio_do_mes(dia):
+    return dia.replace(day=1)
+
+
+def proximo_mes(dia):
+    if dia.month == 12:
+        return date(dia.year + 1, 1, 1)
+    return date(dia.year, dia.month + 1, 1)
+
+
+def somar_meses(dia, meses):
+    total = dia.year * 12 + dia.month - 1 + meses
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def intervalo_do_mes(mes):
+    """'2025-03' -> (2025-03-01, 2025-04-01); ValueError se não for AAAA-MM"""
+    inicio = datetime.strptime(mes, '%Y-%m').date()
+    return inicio, proximo_mes(inicio)
+
+
+def intervalo_mes_atual(hoje=None):
+    inicio = inicio_do_mes(hoje or date.today())
+    return inicio, proximo_mes(inicio)
+
+
+def nome_particao(tabela, inicio):
+    return f'{tabela}_{inicio.year:04d}_{inicio.month:02d}'
+
+
+# ============== CRIAÇÃO DAS PARTIÇÕES ==============
+
+def tabela_particionada(cursor, tabela='transacoes'):
+    cursor.execute('''
+        /* consulta: particoes_verificar */
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table p
+            JOIN pg_class c ON c.oid = p.partrelid
+            WHERE c.relname = %s
+            AND c.relnamespace = (SELECT oid FROM pg_namespace WHERE nspname = current_schema())
+        ) AS particionada
+    ''', (tabela,))
+    return cursor.fetchone()['particionada']
+
+
+def criar_particao(cursor, tabela, inicio, prefixo=None):
+    """Partição de um mês (não faz nada se já existir)"""
+    nome = nome_particao(prefixo or tabela, inicio)
+    cursor.execute(f'''
+        /* consulta: particoes_criar */
+        CREATE TABLE IF NOT EXISTS {nome} PARTITION OF {tabela}
+        FOR VALUES FROM (%s) TO (%s)
+    ''', (inicio, proximo_mes(inicio)))
+    return nome
+
+
+def criar_particao_padrao(cursor, tabela='transacoes', prefixo=None):
+    cursor.execute(f'CREATE TABLE IF NOT EXISTS {prefixo or tabela}_padrao PARTITION OF {tabela} DEFAULT')
+
+
+def garantir_particoes(cursor, tabela='transacoes', desde=None, meses_a_frente=PARTICOES_MESES_A_FRENTE,
+                       prefixo=None):
+    """Garante a partição padrão e as mensais de 'desde' (padrão: mês atual) até N meses à frente
+
+    prefixo: nome base das partições quando difere da tabela (a migração cria
+    transacoes_AAAA_MM já presas a transacoes_nova, que depois é renomeada)
+    """
+    if not tabela_particionada(cursor, tabela):
+        return []
+    cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', (TRAVA_PARTICOES,))
+    criar_particao_padrao(cursor, tabela, prefixo)
+    mes = inicio_do_mes(desde or date.today())
+    ultimo = somar_meses(inicio_do_mes(date.today()), meses_a_frente)
+    garantidas = []
+    while mes <= ultimo:
+        garantidas.append(criar_particao(cursor, tabela, mes, prefixo))
+        mes = proximo_mes(mes)
+    return garantidas
+
+
+class ManutencaoParticoes(threading.Thread):
+    """Garante as partições futuras de tempos em tempos (conexão própria)"""
+
+    def __init__(self, conectar, intervalo=PARTICOES_INTERVALO):
+        super().__init__(name='manutencao-particoes', daemon=True)
+        self.conectar = conectar
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+
+    def executar_uma_vez(self):
+        conn = self.conectar()
+        try:
+            cursor = conn.cursor()
+            try:
+                garantir_particoes(cursor)
+                conn.commit()
+            finally:
+                cursor.close()
+        finally:
+            conn.close()
+
+    def run(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.executar_uma_vez()
+            except Exception as e:
+                logger.warning(f"⚠️  Falha ao criar partições futuras: {e}")
+
+    def parar(self):
+        self._parar.set()
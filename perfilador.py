@@ -0,0 +1,163 @@
+"""
+Perfilador por Amostragem (sob demanda)
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- Perfila só as requisições escolhidas: cabeçalho X-Perfilar com o token,
+  rotas ligadas pelo administrador (PERFILADOR_ROTAS) ou 1 a cada N
+- Amostra a pilha Python da thread da requisição num intervalo fixo
+- Tempo dentro do banco aparece como o quadro "db:<consulta>" (cursor do
+  PostgreSQL e do SQLite embutido)
+- Grava no formato "collapsed stacks" (flamegraph.pl, speedscope, inferno)
+  num diretório circular com no máximo PERFILADOR_MAX_ARQUIVOS perfis;
+  diretório 0700 e arquivos 0600, pois os perfis têm SQL e nomes de funções
+
+Desligado, o custo por requisição é só a checagem de cabeçalho/contador.
+"""
+
+import itertools
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import g, request
+
+from banco_sqlite import CursorSQLite
+from diretorio_privado import abrir_privado, preparar_diretorio
+from metricas import CursorMedido, nome_consulta
+
+# ============== CONFIGURAÇÕES ==============
+
+PERFILADOR_DIR = os.getenv('PERFILADOR_DIR', os.path.join(tempfile.gettempdir(), 'simplifica_perfis'))
+PERFILADOR_TOKEN = os.getenv('PERFILADOR_TOKEN')
+PERFILADOR_ROTAS = {r.strip() for r in os.getenv('PERFILADOR_ROTAS', '').split(',') if r.strip()}
+
+# 1 a cada N requisições (0 desliga a amostragem aleatória)
+PERFILADOR_AMOSTRAGEM = int(os.getenv('PERFILADOR_AMOSTRAGEM', 0))
+
+# Intervalo entre amostras da pilha, em segundos (na prática limitado pelo
+# sys.getswitchinterval(), 5 ms por padrão, pois a thread precisa do GIL)
+PERFILADOR_INTERVALO = float(os.getenv('PERFILADOR_INTERVALO', 0.005))
+
+# Quantos perfis manter em disco (os mais antigos são apagados)
+PERFILADOR_MAX_ARQUIVOS = int(os.getenv('PERFILADOR_MAX_ARQUIVOS', 50))
+
+# Quadros em que a consulta está rodando em C (psycopg2 / sqlite3), com a variável local 'query'
+CODIGOS_DB = {CursorMedido.execute.__code__, CursorMedido.executemany.__code__,
+              CursorSQLite._executar.__code__}
+RE_NOME_ARQUIVO = re.compile(r'[^\w.-]+')
+
+_contador = itertools.count(1)
+
+
+# ============== AMOSTRADOR ==============
+
+class AmostradorPilha(threading.Thread):
+    """Thread que conta as pilhas de outra thread a cada intervalo"""
+
+    def __init__(self, thread_id, intervalo=PERFILADOR_INTERVALO):
+        super().__init__(name='perfilador', daemon=True)
+        self.thread_id = thread_id
+        self.intervalo = intervalo
+        self.pilhas = Counter()
+        self.amostras = 0
+        self._parar = threading.Event()
+
+    @staticmethod
+    def descrever_pilha(frame):
+        """Pilha da raiz até o topo, no formato 'funcao (arquivo:linha)'"""
+        quadros = []
+        while frame is not None:
+            codigo = frame.f_code
+            if codigo in CODIGOS_DB:
+                # A consulta roda em C dentro do driver: marca pelo nome dela
+                quadros.append(f"db:{nome_consulta(frame.f_locals.get('query', ''))}")
+            quadros.append(f'{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})')
+            frame = frame.f_back
+        quadros.reverse()
+        return ';'.join(q.replace(';', ',') for q in quadros)
+
+    def run(self):
+        while not self._parar.wait(self.intervalo):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.pilhas[self.descrever_pilha(frame)] += 1
+            self.amostras += 1
+            del frame
+
+    def parar(self):
+        self._parar.set()
+        self.join()
+
+    def exportar(self):
+        """Texto 'pilha contagem' por linha (collapsed stacks)"""
+        return ''.join(f'{pilha} {vezes}\n' for pilha, vezes in self.pilhas.most_common())
+
+
+# ============== ARQUIVOS (DIRETÓRIO CIRCULAR) ==============
+
+def gravar_perfil(conteudo, rota, duracao, diretorio=PERFILADOR_DIR, maximo=PERFILADOR_MAX_ARQUIVOS):
+    """Grava o perfil e apaga os mais antigos além do limite"""
+    preparar_diretorio(diretorio)
+    nome = '{}_{}_{}ms_{}.folded'.format(
+        datetime.now().strftime('%Y%m%d-%H%M%S-%f'), RE_NOME_ARQUIVO.sub('_', rota),
+        int(duracao * 1000), os.getpid()
+    )
+    caminho = os.path.join(diretorio, nome)
+    temporario = f'{caminho}.tmp'
+    with abrir_privado(temporario) as f:
+        f.write(conteudo)
+    os.replace(temporario, caminho)
+
+    perfis = sorted(
+        (os.path.join(diretorio, a) for a in os.listdir(diretorio) if a.endswith('.folded')),
+        key=os.path.getmtime
+    )
+    for antigo in perfis[:max(len(perfis) - maximo, 0)]:
+        try:
+            os.remove(antigo)
+        except OSError:
+            pass  # Outro worker já apagou
+    return caminho
+
+
+# ============== GANCHOS DA REQUISIÇÃO ==============
+
+def deve_perfilar():
+    """Decide se a requisição atual será perfilada"""
+    if PERFILADOR_TOKEN and request.headers.get('X-Perfilar') == PERFILADOR_TOKEN:
+        return True
+    if request.endpoint in PERFILADOR_ROTAS:
+        return True
+    return PERFILADOR_AMOSTRAGEM > 0 and next(_contador) % PERFILADOR_AMOSTRAGEM == 0
+
+
+def iniciar_perfil():
+    if not deve_perfilar():
+        return
+    amostrador = AmostradorPilha(threading.get_ident())
+    g.perfil = (amostrador, time.perf_counter())
+    amostrador.start()
+
+
+def finalizar_perfil(exc=None):
+    perfil = g.pop('perfil', None)
+    if perfil is None:
+        return
+    amostrador, inicio = perfil
+    amostrador.parar()
+    if amostrador.amostras:
+        gravar_perfil(amostrador.exportar(), request.endpoint or 'desconhecida',
+                      time.perf_counter() - inicio)
+
+
+def registrar(app):
+    """Liga o perfilador ao app"""
+    app.before_request(iniciar_perfil)
+    app.teardown_request(finalizar_perfil)
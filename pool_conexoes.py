@@ -0,0 +1,161 @@
+"""
+Pool de Conexões PostgreSQL
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- Reaproveita conexões entre requisições (conn.close() devolve ao pool)
+- Espera por uma vaga até DB_POOL_ESPERA segundos antes de desistir
+- Desfaz transações abertas ao devolver e descarta conexões quebradas
+- Estado do pool (em uso, ociosas, saturação, esgotamentos) para o /health
+- Ganchos ao retirar/devolver (timeout por rota, vigia de desconexão) e
+  depois de cada commit/rollback da conexão emprestada (timeout da rota de
+  novo na transação seguinte)
+- Cada conexão emprestada leva o disjuntor do pool (conn.disjuntor): erros
+  de comando abrem só o disjuntor do banco de onde ela veio
+
+Cada worker do gunicorn tem o seu pool; depois do fork o pool herdado é
+descartado sem fechar os sockets, que ainda pertencem ao processo pai.
+"""
+
+import os
+import threading
+
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, connection
+from psycopg2.pool import PoolError
+
+from metricas import ConexaoMedida
+
+# ============== CONFIGURAÇÕES ==============
+
+DB_POOL_TAMANHO = int(os.getenv('DB_POOL_TAMANHO', 5))
+DB_POOL_ESPERA = float(os.getenv('DB_POOL_ESPERA', 5.0))
+
+
+class PoolEsgotado(PoolError):
+    """Nenhuma conexão livre dentro do tempo de espera"""
+
+
+class ConexaoPool(ConexaoMedida):
+    """Conexão cujo close() devolve ao pool em vez de desconectar"""
+
+    _pool = None
+    _vaga = None
+    emprestada = False
+
+    def commit(self):
+        super().commit()
+        self._nova_transacao()
+
+    def rollback(self):
+        super().rollback()
+        self._nova_transacao()
+
+    def _nova_transacao(self):
+        # Devolvida (rollback do próprio pool) não chama os ganchos
+        if self.emprestada:
+            for gancho in self._pool.apos_transacao:
+                gancho(self)
+
+    def close(self):
+        if self._pool is None:
+            return super().close()
+        if self.emprestada:
+            self._pool.devolver(self)
+        # Já devolvida: um segundo close() não pode fechar a conexão ociosa
+
+    def fechar(self):
+        """Fecha a conexão de verdade"""
+        connection.close(self)
+
+
+class PoolConexoes:
+    """Pool LIFO de conexões com limite de tamanho e espera por vaga"""
+
+    def __init__(self, conectar, tamanho=DB_POOL_TAMANHO, espera=DB_POOL_ESPERA, disjuntor=None):
+        self.conectar = conectar
+        self.tamanho = tamanho
+        self.espera = espera
+        self.disjuntor = disjuntor
+        self.ao_retirar = []
+        self.ao_devolver = []
+        self.apos_transacao = []
+        self._lock = threading.Lock()
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._pid = os.getpid()
+        self._vagas = threading.BoundedSemaphore(self.tamanho)
+        self._ociosas = []
+        self.em_uso = 0
+        self.esgotamentos = 0
+
+    def obter(self, espera=None):
+        """Empresta uma conexão (ociosa ou nova); levanta PoolEsgotado no limite"""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reiniciar()
+
+        vagas = self._vagas
+        if not vagas.acquire(timeout=self.espera if espera is None else espera):
+            with self._lock:
+                self.esgotamentos += 1
+            raise PoolEsgotado(f'Nenhuma das {self.tamanho} conexões do pool ficou livre')
+
+        try:
+            with self._lock:
+                conn = self._ociosas.pop() if self._ociosas else None
+            if conn is None or conn.closed:
+                conn = self.conectar()
+                conn._pool = self
+        except Exception:
+            vagas.release()
+            raise
+
+        conn._vaga = vagas
+        conn.emprestada = True
+        conn.disjuntor = self.disjuntor
+        with self._lock:
+            self.em_uso += 1
+
+        try:
+            for gancho in self.ao_retirar:
+                gancho(conn)
+        except Exception:
+            self.devolver(conn)
+            raise
+        return conn
+
+    def devolver(self, conn):
+        """Recebe a conexão de volta; transação aberta é desfeita, quebrada é descartada"""
+        conn.emprestada = False
+        for gancho in self.ao_devolver:
+            gancho(conn)
+        try:
+            if not conn.closed and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except Exception:
+            conn.fechar()
+
+        with self._lock:
+            self.em_uso = max(self.em_uso - 1, 0)
+            if not conn.closed and conn._vaga is self._vagas:
+                self._ociosas.append(conn)
+        conn._vaga.release()
+
+    def estado(self):
+        """Retrato do pool para o readiness"""
+        with self._lock:
+            return {
+                'tamanho': self.tamanho,
+                'em_uso': self.em_uso,
+                'ociosas': len(self._ociosas),
+                'saturacao': round(self.em_uso / self.tamanho, 2) if self.tamanho else 1.0,
+                'esgotamentos': self.esgotamentos,
+            }
+
+    def fechar_todas(self):
+        with self._lock:
+            ociosas, self._ociosas = self._ociosas, []
+        for conn in ociosas:
+            conn.fechar()
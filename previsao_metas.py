@@ -0,0 +1,241 @@
+"""
+Previsão de Conclusão das Metas
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- Para cada meta ativa: ritmo mensal estimado, data prevista de conclusão e
+  quanto guardar por mês para chegar ao alvo até a data limite
+- Ritmo = o que a meta já juntou por mês desde o início; meta nova (menos
+  de PREVISAO_DIAS_MINIMOS dias ou nada guardado) usa a parte dela no
+  saldo mensal médio do usuário (receitas - despesas dos últimos
+  PREVISAO_FLUXO_MESES meses fechados, dividido entre as metas ativas)
+- Cálculo vetorizado (NumPy) para todas as metas de uma vez: as do usuário
+  quando ele mexe numa meta, as de todos os usuários no lote noturno
+- O resultado fica gravado em metas (previsao_conclusao,
+  aporte_mensal_centavos, ritmo_mensal_centavos, previsao_em): /metas só lê
+- Gravação em lote com um UPDATE ... FROM unnest(arrays) por lote (SQLite:
+  executemany)
+
+Uso (agendar uma vez por noite; percorre DATABASE_URL e DATABASE_SHARDS):
+    python previsao_metas.py [--lote 10000]
+"""
+
+import argparse
+import logging
+import math
+import os
+from datetime import date
+
+import numpy as np
+
+from analitico import numero_do_mes, serie_mensal
+from particoes import inicio_do_mes, somar_meses
+
+logger = logging.getLogger(__name__)
+
+# ============== CONFIGURAÇÕES ==============
+
+PREVISAO_FLUXO_MESES = int(os.getenv('PREVISAO_FLUXO_MESES', 6))
+PREVISAO_DIAS_MINIMOS = int(os.getenv('PREVISAO_DIAS_MINIMOS', 30))
+PREVISAO_LOTE = int(os.getenv('PREVISAO_LOTE', 10000))
+# Previsão além disso (ritmo ínfimo) fica em branco em vez de mostrar um ano absurdo
+PREVISAO_MAX_MESES = 1200
+
+DIAS_POR_MES = 365.25 / 12
+
+COLUNAS_PREVISAO = (
+    ('previsao_conclusao', 'DATE'),
+    ('aporte_mensal_centavos', 'BIGINT'),
+    ('ritmo_mensal_centavos', 'BIGINT'),
+    ('previsao_em', 'TIMESTAMP'),
+)
+
+SQL_METAS_ATIVAS = '''
+    SELECT m.id, m.usuario_id, m.valor_alvo_centavos, m.valor_atual_centavos, m.data_inicio, m.data_limite,
+           (SELECT COUNT(*) FROM metas a WHERE a.usuario_id = m.usuario_id AND a.status = 'ativa') AS ativas
+    FROM metas m
+    WHERE m.status = 'ativa'
+'''
+
+
+def criar_colunas_previsao(cursor):
+    """Colunas da previsão em metas; idempotente"""
+    for coluna, tipo in COLUNAS_PREVISAO:
+        cursor.execute(f'ALTER TABLE metas ADD COLUMN IF NOT EXISTS {coluna} {tipo}')
+
+
+def meses_do_fluxo(hoje=None):
+    """(início, fim) dos PREVISAO_FLUXO_MESES meses fechados antes do atual"""
+    fim = inicio_do_mes(hoje or date.today())
+    return somar_meses(fim, -PREVISAO_FLUXO_MESES), fim
+
+
+def fluxo_mensal_colunas(colunas, hoje=None):
+    """Saldo mensal médio (centavos) das colunas do motor analítico, nos meses do fluxo"""
+    inicio, fim = meses_do_fluxo(hoje)
+    _, receitas, despesas, _ = serie_mensal(colunas, numero_do_mes(inicio), numero_do_mes(fim) - 1)
+    return int(receitas.sum() - despesas.sum()) / PREVISAO_FLUXO_MESES
+
+
+# ============== CÁLCULO VETORIZADO ==============
+
+def prever(alvo, atual, inicio, limite, fluxo, ativas, hoje=None):
+    """Previsão de um conjunto de metas (sequências do mesmo tamanho, uma posição por meta)
+
+    alvo/atual em centavos; inicio/limite datas (limite None = sem prazo);
+    fluxo = saldo mensal médio do dono da meta; ativas = metas ativas do dono.
+    Devolve (ritmo_mensal, previsao_conclusao, aporte_mensal): arrays int64,
+    datetime64[D] (NaT = sem previsão) e float (nan = sem data limite).
+    """
+    hoje = np.datetime64(hoje or date.today(), 'D')
+    alvo = np.asarray(alvo, dtype=np.int64)
+    atual = np.asarray(atual, dtype=np.int64)
+    inicio = np.array(inicio, dtype='datetime64[D]')
+    limite = np.array([d if d is not None else 'NaT' for d in limite], dtype='datetime64[D]')
+    fluxo = np.asarray(fluxo, dtype=np.float64)
+    ativas = np.maximum(np.asarray(ativas, dtype=np.int64), 1)
+
+    faltante = np.maximum(alvo - atual, 0)
+    dias = np.maximum((hoje - inicio).astype(np.int64), 1)
+    ritmo_proprio = atual / dias * DIAS_POR_MES
+    cota_do_fluxo = np.maximum(fluxo, 0) / ativas
+    com_historico = (dias >= PREVISAO_DIAS_MINIMOS) & (atual > 0)
+    ritmo = np.where(com_historico, ritmo_proprio, cota_do_fluxo)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        meses = np.where(faltante == 0, 0.0, faltante / ritmo)
+    previsivel = np.isfinite(meses) & (meses <= PREVISAO_MAX_MESES)
+    dias_ate_concluir = np.ceil(np.where(previsivel, meses, 0) * DIAS_POR_MES).astype(np.int64)
+    previsao = np.where(previsivel, hoje + dias_ate_concluir, np.datetime64('NaT', 'D'))
+
+    # Prazo vencido (ou neste mês): falta tudo de uma vez
+    meses_ate_limite = np.maximum((limite - hoje).astype(np.float64) / DIAS_POR_MES, 1)
+    aporte = np.where(np.isnat(limite), np.nan, np.ceil(faltante / meses_ate_limite))
+    return np.rint(ritmo).astype(np.int64), previsao, aporte
+
+
+def linhas_previsao(ids, ritmo, previsao, aporte):
+    """(id, previsao_conclusao, aporte_mensal_centavos, ritmo_mensal_centavos) prontos para gravar"""
+    return [(int(meta_id), None if np.isnat(quando) else quando.item(),
+             None if math.isnan(valor) else int(valor), int(passo))
+            for meta_id, passo, quando, valor in zip(ids, ritmo, previsao, aporte)]
+
+
+def gravar_previsoes(cursor, linhas, sqlite=False):
+    """Um UPDATE para todas as metas das linhas (id, previsao, aporte, ritmo)"""
+    if not linhas:
+        return
+    if sqlite:
+        cursor.executemany('''
+            UPDATE metas SET previsao_conclusao = %s, aporte_mensal_centavos = %s,
+                ritmo_mensal_centavos = %s, previsao_em = CURRENT_TIMESTAMP
+            WHERE id = %s
+        ''', [(previsao, aporte, ritmo, meta_id) for meta_id, previsao, aporte, ritmo in linhas])
+        return
+    ids, previsoes, aportes, ritmos = (list(coluna) for coluna in zip(*linhas))
+    cursor.execute('''
+        /* consulta: previsao_gravar */
+        UPDATE metas m
+        SET previsao_conclusao = p.previsao, aporte_mensal_centavos = p.aporte,
+            ritmo_mensal_centavos = p.ritmo, previsao_em = CURRENT_TIMESTAMP
+        FROM unnest(%s::int[], %s::date[], %s::bigint[], %s::bigint[]) AS p(id, previsao, aporte, ritmo)
+        WHERE m.id = p.id
+    ''', (ids, previsoes, aportes, ritmos))
+
+
+def prever_metas(cursor, metas, fluxos, hoje=None, sqlite=False):
+    """Calcula e grava a previsão das metas (linhas de SQL_METAS_ATIVAS); fluxos: usuario_id -> saldo mensal"""
+    if not metas:
+        return 0
+    ritmo, previsao, aporte = prever(
+        [m['valor_alvo_centavos'] for m in metas], [m['valor_atual_centavos'] or 0 for m in metas],
+        [m['data_inicio'] for m in metas], [m['data_limite'] for m in metas],
+        [fluxos.get(m['usuario_id'], 0) for m in metas], [m['ativas'] for m in metas], hoje)
+    gravar_previsoes(cursor, linhas_previsao([m['id'] for m in metas], ritmo, previsao, aporte), sqlite)
+    return len(metas)
+
+
+def prever_metas_usuario(cursor, usuario_id, fluxo_mensal, hoje=None, sqlite=False):
+    """Previsão das metas ativas de um usuário (depois de ele criar ou mudar uma meta)"""
+    cursor.execute(f'''
+        /* consulta: previsao_metas_usuario */
+        {SQL_METAS_ATIVAS} AND m.usuario_id = %s
+    ''', (usuario_id,))
+    return prever_metas(cursor, cursor.fetchall(), {usuario_id: fluxo_mensal}, hoje, sqlite)
+
+
+# ============== LOTE NOTURNO ==============
+
+def fluxos_dos_usuarios(cursor, usuarios, hoje=None):
+    """usuario_id -> saldo mensal médio, numa consulta para o lote de usuários"""
+    inicio, fim = meses_do_fluxo(hoje)
+    lista = ', '.join(['%s'] * len(usuarios))
+    cursor.execute(f'''
+        /* consulta: previsao_fluxos */
+        SELECT usuario_id, SUM(CASE WHEN tipo = 'receita' THEN valor ELSE -valor END) AS fluxo
+        FROM (
+            SELECT usuario_id, tipo, valor_centavos AS valor FROM transacoes
+            WHERE usuario_id IN ({lista}) AND data >= %s AND data < %s
+            UNION ALL
+            SELECT usuario_id, tipo, total_centavos FROM resumo_arquivo
+            WHERE usuario_id IN ({lista}) AND mes >= %s AND mes < %s
+        ) movimentos
+        GROUP BY usuario_id
+    ''', (*usuarios, inicio, fim, *usuarios, inicio, fim))
+    return {linha['usuario_id']: int(linha['fluxo'] or 0) / PREVISAO_FLUXO_MESES for linha in cursor.fetchall()}
+
+
+def prever_todas(conn, hoje=None, lote=PREVISAO_LOTE, sqlite=False):
+    """Previsão de todas as metas ativas do banco, em lotes por (usuario_id, id); um commit por lote"""
+    cursor = conn.cursor()
+    ultimo = (0, 0)
+    total = 0
+    try:
+        while True:
+            cursor.execute(f'''
+                /* consulta: previsao_lote */
+                {SQL_METAS_ATIVAS}
+                AND (m.usuario_id > %s OR (m.usuario_id = %s AND m.id > %s))
+                ORDER BY m.usuario_id, m.id
+                LIMIT %s
+            ''', (ultimo[0], ultimo[0], ultimo[1], lote))
+            metas = cursor.fetchall()
+            if not metas:
+                break
+            fluxos = fluxos_dos_usuarios(cursor, sorted({m['usuario_id'] for m in metas}), hoje)
+            total += prever_metas(cursor, metas, fluxos, hoje, sqlite)
+            conn.commit()
+            ultimo = (metas[-1]['usuario_id'], metas[-1]['id'])
+            logger.info(f"🎯 {total:,} metas com previsão atualizada")
+    finally:
+        cursor.close()
+    return total
+
+
+# ============== LINHA DE COMANDO ==============
+
+if __name__ == '__main__':
+    from banco_sqlite import BancoSQLite, caminho_da_url
+    from particionar_transacoes import conectar
+    from shards import dsns_configurados
+
+    parser = argparse.ArgumentParser(description='Recalcula a previsão de conclusão das metas ativas')
+    parser.add_argument('--lote', type=int, default=PREVISAO_LOTE)
+    args = parser.parse_args()
+
+    caminho = caminho_da_url(os.getenv('DATABASE_URL'))
+    if caminho:
+        conn = BancoSQLite(caminho).obter()
+        try:
+            total = prever_todas(conn, lote=args.lote, sqlite=True)
+        finally:
+            conn.fechar()
+    else:
+        total = 0
+        for dsn in [None, *dsns_configurados()]:
+            conn = conectar(dsn)
+            try:
+                total += prever_todas(conn, lote=args.lote)
+            finally:
+                conn.close()
+    logger.info(f"✅ Previsão concluída ({total:,} metas)")
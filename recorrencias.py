@@ -0,0 +1,280 @@
+"""
+Transações Recorrentes
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- Regras de repetição (semanal, mensal ou anual, com data final opcional)
+  em recorrencias; cada ocorrência vira uma transação comum, com
+  recorrencia_id apontando para a regra
+- Materialização em conjunto: um único INSERT ... SELECT gera as ocorrências
+  vencidas de todas as regras (generate_series por regra, a partir de onde
+  a regra parou), marca até onde cada regra foi gerada (gerada_ate) e
+  devolve os usuários afetados, tudo no mesmo comando
+- Idempotente: só gera datas depois de gerada_ate, e o índice único
+  (recorrencia_id, data) com ON CONFLICT DO NOTHING barra repetição mesmo
+  se duas execuções se cruzarem; ocorrência excluída pelo usuário não volta
+- Mensal no dia 31 cai no último dia dos meses mais curtos (29/02 no anual,
+  idem): cada ocorrência é contada a partir do início da regra
+- No SQLite, CTE recursiva no lugar do generate_series (marca em um
+  segundo comando da mesma transação; o SQLite tem um escritor por vez)
+
+Uso (agendar uma vez por dia, logo depois da meia-noite):
+    python recorrencias.py [--ate AAAA-MM-DD] [--lote 0]
+
+Ocorrências copiadas para outro shard ou arquivadas perdem o recorrencia_id;
+a regra não as gera de novo porque gerada_ate vai junto.
+"""
+
+import argparse
+import logging
+import os
+from datetime import date, datetime
+
+logger = logging.getLogger(__name__)
+
+# ============== CONFIGURAÇÕES ==============
+
+FREQUENCIAS = ('semanal', 'mensal', 'anual')
+# Regras por comando (faixas de id); 0 = todas num comando só
+RECORRENCIAS_LOTE = int(os.getenv('RECORRENCIAS_LOTE', 0))
+
+TRAVA_RECORRENCIAS = 'simplifica_recorrencias'
+
+
+def criar_tabelas_recorrencias(cursor):
+    """recorrencias, transacoes.recorrencia_id e o índice que garante uma ocorrência por data; idempotente"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS recorrencias (
+            id SERIAL PRIMARY KEY,
+            usuario_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+            tipo VARCHAR(10) CHECK(tipo IN ('receita', 'despesa')) NOT NULL,
+            valor_centavos BIGINT NOT NULL,
+            descricao VARCHAR(200) NOT NULL,
+            categoria_id INTEGER NOT NULL REFERENCES categorias_personalizadas(id),
+            frequencia VARCHAR(10) CHECK(frequencia IN ('semanal', 'mensal', 'anual')) NOT NULL,
+            data_inicio DATE NOT NULL,
+            data_fim DATE,
+            ativa BOOLEAN NOT NULL DEFAULT TRUE,
+            gerada_ate DATE,
+            data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_recorrencias_usuario_id ON recorrencias(usuario_id)
+    ''')
+    # transacoes_arquivo também: a partição arquivada precisa das mesmas colunas para o ATTACH
+    for tabela in ('transacoes', 'transacoes_arquivo'):
+        cursor.execute(f'ALTER TABLE {tabela} ADD COLUMN IF NOT EXISTS recorrencia_id INTEGER')
+    # Inclui data (chave das partições); transações avulsas (NULL) nunca conflitam
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_transacoes_recorrencia ON transacoes(recorrencia_id, data)
+    ''')
+
+
+# ============== MATERIALIZAÇÃO (POSTGRESQL) ==============
+
+def sql_periodos(data):
+    """Períodos completos entre o início da regra g e a data (mesma conta da ocorrência)"""
+    return f'''(CASE g.frequencia
+        WHEN 'semanal' THEN ({data} - g.data_inicio) / 7
+        WHEN 'mensal' THEN (EXTRACT(YEAR FROM {data}) * 12 + EXTRACT(MONTH FROM {data}))::int
+                         - (EXTRACT(YEAR FROM g.data_inicio) * 12 + EXTRACT(MONTH FROM g.data_inicio))::int
+        ELSE EXTRACT(YEAR FROM {data})::int - EXTRACT(YEAR FROM g.data_inicio)::int
+    END)'''
+
+
+SQL_MATERIALIZAR = f'''
+    /* consulta: recorrencias_materializar */
+    WITH parametros AS (
+        SELECT %s::date AS ate
+    ),
+    regras AS (
+        SELECT r.id, r.usuario_id, r.tipo, r.valor_centavos, r.descricao, r.categoria_id,
+               r.frequencia, r.data_inicio,
+               COALESCE(r.gerada_ate + 1, r.data_inicio) AS desde,
+               LEAST(p.ate, COALESCE(r.data_fim, p.ate)) AS limite
+        FROM recorrencias r CROSS JOIN parametros p
+        WHERE r.ativa AND r.data_inicio <= p.ate
+        AND (r.gerada_ate IS NULL OR r.gerada_ate < LEAST(p.ate, COALESCE(r.data_fim, p.ate)))
+        {{filtro}}
+    ),
+    ocorrencias AS (
+        SELECT g.*, (g.data_inicio + n * CASE g.frequencia
+                        WHEN 'semanal' THEN INTERVAL '7 days'
+                        WHEN 'mensal' THEN INTERVAL '1 month'
+                        ELSE INTERVAL '1 year' END)::date AS data
+        FROM regras g
+        CROSS JOIN LATERAL generate_series(GREATEST({sql_periodos('g.desde')} - 1, 0),
+                                           {sql_periodos('g.limite')}) AS n
+    ),
+    inseridas AS (
+        INSERT INTO transacoes (usuario_id, tipo, valor_centavos, descricao, categoria_id, data, recorrencia_id)
+        SELECT usuario_id, tipo, valor_centavos, descricao, categoria_id, data, id
+        FROM ocorrencias
+        WHERE data >= desde AND data <= limite
+        ON CONFLICT (recorrencia_id, data) DO NOTHING
+        RETURNING usuario_id
+    ),
+    marcadas AS (
+        UPDATE recorrencias r SET gerada_ate = g.limite
+        FROM regras g
+        WHERE r.id = g.id
+    )
+    SELECT usuario_id, COUNT(*) AS quantidade FROM inseridas GROUP BY usuario_id
+'''
+
+
+# ============== MATERIALIZAÇÃO (SQLITE) ==============
+
+def sql_periodos_sqlite(data):
+    return f'''(CASE g.frequencia
+        WHEN 'semanal' THEN CAST((julianday({data}) - julianday(g.data_inicio)) / 7 AS INTEGER)
+        WHEN 'mensal' THEN (CAST(strftime('%%Y', {data}) AS INTEGER) * 12 + CAST(strftime('%%m', {data}) AS INTEGER))
+                         - (CAST(strftime('%%Y', g.data_inicio) AS INTEGER) * 12
+                            + CAST(strftime('%%m', g.data_inicio) AS INTEGER))
+        ELSE CAST(strftime('%%Y', {data}) AS INTEGER) - CAST(strftime('%%Y', g.data_inicio) AS INTEGER)
+    END)'''
+
+
+# n-ésima ocorrência: dia do início no mês de destino, limitado ao último dia desse mês
+SQL_OCORRENCIA_SQLITE = '''(CASE g.frequencia
+    WHEN 'semanal' THEN date(g.data_inicio, '+' || (7 * o.n) || ' days')
+    ELSE MIN(date(g.data_inicio, 'start of month', '+' || (o.n * o.meses) || ' months',
+                  '+' || (CAST(strftime('%%d', g.data_inicio) AS INTEGER) - 1) || ' days'),
+             date(g.data_inicio, 'start of month', '+' || (o.n * o.meses + 1) || ' months', '-1 day'))
+END)'''
+
+SQL_REGRAS_SQLITE = '''
+    FROM recorrencias r
+    WHERE r.ativa AND r.data_inicio <= %s
+    AND (r.gerada_ate IS NULL OR r.gerada_ate < MIN(%s, COALESCE(r.data_fim, %s)))
+    {filtro}
+'''
+
+SQL_MATERIALIZAR_SQLITE = f'''
+    /* consulta: recorrencias_materializar */
+    WITH RECURSIVE regras AS (
+        SELECT r.id, r.usuario_id, r.tipo, r.valor_centavos, r.descricao, r.categoria_id,
+               r.frequencia, r.data_inicio,
+               COALESCE(date(r.gerada_ate, '+1 day'), r.data_inicio) AS desde,
+               MIN(%s, COALESCE(r.data_fim, %s)) AS limite
+        {SQL_REGRAS_SQLITE}
+    ),
+    ocorrencias(id, n, ultimo, meses) AS (
+        SELECT g.id, MAX({sql_periodos_sqlite('g.desde')} - 1, 0), {sql_periodos_sqlite('g.limite')},
+               CASE g.frequencia WHEN 'anual' THEN 12 ELSE 1 END
+        FROM regras g
+        UNION ALL
+        SELECT id, n + 1, ultimo, meses FROM ocorrencias WHERE n < ultimo
+    )
+    INSERT INTO transacoes (usuario_id, tipo, valor_centavos, descricao, categoria_id, data, recorrencia_id)
+    SELECT usuario_id, tipo, valor_centavos, descricao, categoria_id, data, id
+    FROM (
+        SELECT g.*, {SQL_OCORRENCIA_SQLITE} AS data
+        FROM ocorrencias o JOIN regras g ON g.id = o.id
+    ) datas
+    WHERE data >= desde AND data <= limite
+    ON CONFLICT (recorrencia_id, data) DO NOTHING
+    RETURNING usuario_id
+'''
+
+SQL_MARCAR_SQLITE = f'''
+    UPDATE recorrencias SET gerada_ate = MIN(%s, COALESCE(data_fim, %s))
+    WHERE id IN (SELECT r.id {SQL_REGRAS_SQLITE})
+'''
+
+
+def filtro_regras(usuario_id=None, faixa=None):
+    """(trecho do WHERE sobre r, parâmetros): só um usuário e/ou uma faixa de ids (de, até]"""
+    sql, params = '', []
+    if usuario_id is not None:
+        sql += ' AND r.usuario_id = %s'
+        params.append(usuario_id)
+    if faixa is not None:
+        sql += ' AND r.id > %s AND r.id <= %s'
+        params.extend(faixa)
+    return sql, params
+
+
+def materializar(cursor, ate=None, usuario_id=None, faixa=None, sqlite=False):
+    """Gera as ocorrências até 'ate' (inclusive) num comando; devolve {usuario_id: quantidade} (sem commit)"""
+    ate = ate or date.today()
+    filtro, params = filtro_regras(usuario_id, faixa)
+    if sqlite:
+        regras = [ate, ate, ate, *params]
+        cursor.execute(SQL_MATERIALIZAR_SQLITE.format(filtro=filtro), [ate, ate, *regras])
+        afetados = {}
+        for linha in cursor.fetchall():
+            afetados[linha['usuario_id']] = afetados.get(linha['usuario_id'], 0) + 1
+        cursor.execute(SQL_MARCAR_SQLITE.format(filtro=filtro), [ate, ate, *regras])
+        return afetados
+    cursor.execute(SQL_MATERIALIZAR.format(filtro=filtro), [ate, *params])
+    return {linha['usuario_id']: linha['quantidade'] for linha in cursor.fetchall()}
+
+
+def materializar_todas(conn, ate=None, lote=RECORRENCIAS_LOTE, sqlite=False, ao_gerar=None):
+    """Todas as regras, num comando (ou um por faixa de 'lote' ids); um commit por comando
+
+    ao_gerar(usuario_id) é chamado para cada usuário que ganhou transações.
+    """
+    cursor = conn.cursor()
+    if not sqlite:
+        cursor.execute("SET lock_timeout = '5s'")
+        cursor.execute('SELECT pg_try_advisory_lock(hashtext(%s)) AS livre', (TRAVA_RECORRENCIAS,))
+        if not cursor.fetchone()['livre']:
+            logger.warning("⚠️  Materialização de recorrências já em andamento em outro processo")
+            conn.rollback()
+            return 0
+
+    total = 0
+    try:
+        cursor.execute('SELECT COALESCE(MAX(id), 0) AS ultimo FROM recorrencias')
+        ultimo = cursor.fetchone()['ultimo']
+        passo = lote if lote > 0 else max(ultimo, 1)
+        for inicio in range(0, ultimo, passo):
+            afetados = materializar(cursor, ate, faixa=(inicio, inicio + passo), sqlite=sqlite)
+            conn.commit()
+            total += sum(afetados.values())
+            for usuario_id in afetados if ao_gerar else ():
+                ao_gerar(usuario_id)
+            logger.info(f"🔁 {total:,} ocorrências geradas (regras até o id {min(inicio + passo, ultimo):,})")
+    finally:
+        if not sqlite:
+            cursor.execute('SELECT pg_advisory_unlock(hashtext(%s))', (TRAVA_RECORRENCIAS,))
+            conn.commit()
+        cursor.close()
+    return total
+
+
+# ============== LINHA DE COMANDO ==============
+
+if __name__ == '__main__':
+    from analitico import motor_analitico
+    from banco_sqlite import BancoSQLite, caminho_da_url
+    from particionar_transacoes import conectar
+    from shards import dsns_configurados
+
+    parser = argparse.ArgumentParser(description='Gera as transações recorrentes vencidas')
+    parser.add_argument('--ate', type=lambda texto: datetime.strptime(texto, '%Y-%m-%d').date(),
+                        default=date.today(), help='Última data a gerar (padrão: hoje)')
+    parser.add_argument('--lote', type=int, default=RECORRENCIAS_LOTE,
+                        help='Regras por comando (0 = todas num comando só)')
+    args = parser.parse_args()
+
+    # Workers deste servidor recarregam as colunas analíticas de quem ganhou transações
+    caminho = caminho_da_url(os.getenv('DATABASE_URL'))
+    if caminho:
+        conn = BancoSQLite(caminho).obter()
+        try:
+            total = materializar_todas(conn, args.ate, args.lote, sqlite=True, ao_gerar=motor_analitico.invalidar)
+        finally:
+            conn.fechar()
+    else:
+        total = 0
+        for dsn in [None, *dsns_configurados()]:
+            conn = conectar(dsn)
+            try:
+                total += materializar_todas(conn, args.ate, args.lote, ao_gerar=motor_analitico.invalidar)
+            finally:
+                conn.close()
+    logger.info(f"✅ Recorrências em dia até {args.ate} ({total:,} transações novas)")
@@ -0,0 +1,197 @@
+"""
+Leituras em Réplicas do PostgreSQL
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- Rotas só de leitura e pesadas (relatórios, exportações, listagem com os
+  meses disponíveis) usam uma réplica de DATABASE_REPLICA_URLS (separadas
+  por vírgula); todo o resto segue no primário (DATABASE_URL)
+- Atraso de replicação medido na retirada da conexão (no máximo uma vez a
+  cada REPLICA_INTERVALO_ATRASO s por réplica); réplica atrasada demais
+  fica de fora
+- Ler o que acabou de escrever: por REPLICA_JANELA_ESCRITA s depois de um
+  commit do usuário, as leituras dele vão para o primário (marca na sessão,
+  vale para todos os workers)
+- Cada réplica tem pool e disjuntor próprios; sem réplica boa, a leitura
+  cai no primário sem erro para o usuário
+
+Qualquer Postgres serve de "réplica" em testes (um segundo banco local com
+os mesmos dados): fora de recuperação o atraso conta como zero.
+"""
+
+import itertools
+import logging
+import os
+import threading
+import time
+
+import psycopg2
+from flask import g, has_request_context, request, session
+
+import metricas
+from disjuntor import Disjuntor
+from pool_conexoes import PoolConexoes, PoolEsgotado
+
+logger = logging.getLogger(__name__)
+
+# ============== CONFIGURAÇÕES ==============
+
+REPLICA_ATRASO_MAXIMO = float(os.getenv('REPLICA_ATRASO_MAXIMO', 5.0))
+REPLICA_JANELA_ESCRITA = float(os.getenv('REPLICA_JANELA_ESCRITA', 10.0))
+REPLICA_INTERVALO_ATRASO = float(os.getenv('REPLICA_INTERVALO_ATRASO', 2.0))
+REPLICA_POOL_TAMANHO = int(os.getenv('REPLICA_POOL_TAMANHO', 3))
+# Espera curta por vaga: com a réplica cheia é melhor ir ao primário
+REPLICA_POOL_ESPERA = float(os.getenv('REPLICA_POOL_ESPERA', 0.5))
+
+# Rotas que nunca escrevem e podem ler dados com alguns segundos de atraso
+ROTAS_LEITURA = {'relatorios', 'exportar_excel', 'exportar_pdf', 'listar_transacoes'}
+
+# Chave na sessão com o horário (epoch) do último commit do usuário
+CHAVE_ESCRITA = 'escrita_em'
+
+SQL_ATRASO = '''
+    /* consulta: replica_atraso */
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END::FLOAT AS atraso
+'''
+
+
+def dsns_configurados():
+    """DSNs de DATABASE_REPLICA_URLS (postgres:// vira postgresql://, como o primário)"""
+    dsns = [dsn.strip() for dsn in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if dsn.strip()]
+    return [dsn.replace('postgres://', 'postgresql://', 1) for dsn in dsns]
+
+
+class Replica:
+    """Uma réplica: pool próprio, disjuntor próprio e último atraso medido"""
+
+    def __init__(self, nome, conectar, tamanho=REPLICA_POOL_TAMANHO, espera=REPLICA_POOL_ESPERA):
+        self.nome = nome
+        self.disjuntor = Disjuntor()
+        self.pool = PoolConexoes(conectar, tamanho=tamanho, espera=espera, disjuntor=self.disjuntor)
+        self.atraso = None
+        self._medido_em = 0.0
+        self._lock = threading.Lock()
+
+    def atraso_atual(self, conn, intervalo):
+        """Atraso em segundos, medido nesta conexão se a última medida venceu"""
+        with self._lock:
+            if self.atraso is not None and time.monotonic() - self._medido_em < intervalo:
+                return self.atraso
+        cursor = conn.cursor()
+        try:
+            cursor.execute(SQL_ATRASO)
+            atraso = cursor.fetchone()['atraso']
+        finally:
+            cursor.close()
+        with self._lock:
+            self.atraso, self._medido_em = atraso, time.monotonic()
+        return atraso
+
+    def estado(self):
+        return {
+            'nome': self.nome,
+            'disjuntor': self.disjuntor.estado,
+            'atraso_s': None if self.atraso is None else round(self.atraso, 3),
+            'pool': self.pool.estado(),
+        }
+
+
+class RoteadorLeituras:
+    """Escolhe réplica (rodízio) ou primário para a conexão da requisição"""
+
+    def __init__(self, replicas=(), atraso_maximo=REPLICA_ATRASO_MAXIMO,
+                 janela_escrita=REPLICA_JANELA_ESCRITA, intervalo_atraso=REPLICA_INTERVALO_ATRASO,
+                 rotas=ROTAS_LEITURA):
+        self.replicas = list(replicas)
+        self.atraso_maximo = atraso_maximo
+        self.janela_escrita = janela_escrita
+        self.intervalo_atraso = intervalo_atraso
+        self.rotas = set(rotas)
+        self._rodizio = itertools.cycle(range(len(self.replicas))) if self.replicas else None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def do_ambiente(cls, conectar, **kwargs):
+        """Uma Replica por DSN configurado; conectar(dsn) abre a conexão"""
+        replicas = [Replica(f'replica{i}', lambda dsn=dsn: conectar(dsn))
+                    for i, dsn in enumerate(dsns_configurados(), start=1)]
+        return cls(replicas, **kwargs)
+
+    def escrita_recente(self):
+        escrita_em = session.get(CHAVE_ESCRITA)
+        return escrita_em is not None and time.time() - escrita_em < self.janela_escrita
+
+    def motivo_primario(self):
+        """Por que esta requisição não pode ir à réplica (None se pode)"""
+        if not self.replicas:
+            return 'sem_replica'
+        if not has_request_context() or request.endpoint not in self.rotas:
+            return 'rota_de_escrita'
+        if self.escrita_recente():
+            return 'escrita_recente'
+        return None
+
+    def _em_ordem(self):
+        with self._lock:
+            primeira = next(self._rodizio)
+        return self.replicas[primeira:] + self.replicas[:primeira]
+
+    def obter(self):
+        """Conexão de uma réplica em dia, ou None para a requisição usar o primário"""
+        motivo = self.motivo_primario()
+        if motivo is None:
+            for replica in self._em_ordem():
+                conn = self._obter_da_replica(replica)
+                if conn is not None:
+                    metricas.registro.incrementar('simplifica_leituras_roteadas_total',
+                                                  destino=replica.nome, motivo='replica')
+                    return conn
+            motivo = 'replicas_indisponiveis'
+        if motivo not in ('rota_de_escrita', 'sem_replica'):
+            metricas.registro.incrementar('simplifica_leituras_roteadas_total',
+                                          destino='primario', motivo=motivo)
+        return None
+
+    def _obter_da_replica(self, replica):
+        if not replica.disjuntor.permitir():
+            return None
+        inicio = time.perf_counter()
+        try:
+            conn = replica.pool.obter()
+        except (psycopg2.OperationalError, PoolEsgotado) as e:
+            replica.disjuntor.falha()
+            logger.warning(f"⚠️  {replica.nome} indisponível, lendo do primário: {e}")
+            return None
+        metricas.registrar_consulta('conexao', time.perf_counter() - inicio)
+
+        try:
+            atraso = replica.atraso_atual(conn, self.intervalo_atraso)
+        except psycopg2.Error as e:
+            conn.close()
+            replica.disjuntor.falha()
+            logger.warning(f"⚠️  Falha ao medir o atraso da {replica.nome}: {e}")
+            return None
+        replica.disjuntor.sucesso()
+
+        if atraso > self.atraso_maximo:
+            conn.close()
+            logger.info(f"🐢 {replica.nome} {atraso:.1f}s atrasada; lendo do primário")
+            return None
+        return conn
+
+    def marcar_escrita(self, response):
+        """after_request: commit nesta requisição prende as leituras do usuário no primário"""
+        if self.replicas and any(consulta == 'commit' for consulta, _, _ in g.get('consultas', ())):
+            session[CHAVE_ESCRITA] = time.time()
+        return response
+
+    def estado(self):
+        return [replica.estado() for replica in self.replicas]
+
+    def fechar_todas(self):
+        for replica in self.replicas:
+            replica.pool.fechar_todas()
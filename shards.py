@@ -0,0 +1,164 @@
+"""
+Shards por Usuário (vários bancos PostgreSQL)
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- Shard 0 é o banco de DATABASE_URL; DATABASE_SHARDS (DSNs separados por
+  vírgula) acrescenta os shards 1, 2, ...
+- mapa_usuarios, no shard 0, é o diretório: usuario_id (gerado ali, único
+  entre todos os shards), email e shard de cada conta
+- get_db_connection() vai ao shard do usuário logado; login e cadastro
+  consultam o diretório pelo email
+- Cache do diretório por worker com TTL curto (SHARDS_CACHE_TTL), que é
+  também o prazo para todos os workers notarem uma conta em mudança
+- Conta em mudança de shard (mover_usuario_shard.py) fica só leitura por
+  alguns segundos; as demais contas não percebem nada
+
+Com um único banco nada muda: o diretório só é consultado no cadastro.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# ============== CONFIGURAÇÕES ==============
+
+SHARDS_CACHE_TTL = float(os.getenv('SHARDS_CACHE_TTL', 5))
+SHARDS_CACHE_MAX = int(os.getenv('SHARDS_CACHE_MAX', 20000))
+
+
+def dsns_configurados():
+    """DSNs dos shards 1..N (o shard 0 é DATABASE_URL)"""
+    dsns = [dsn.strip() for dsn in os.getenv('DATABASE_SHARDS', '').split(',') if dsn.strip()]
+    return [dsn.replace('postgres://', 'postgresql://', 1) for dsn in dsns]
+
+
+def shards_para_novos(total):
+    """Shards que recebem contas novas (SHARDS_NOVOS=1,2; padrão: todos)"""
+    configurados = [int(n) for n in os.getenv('SHARDS_NOVOS', '').split(',') if n.strip()]
+    return [n for n in configurados if 0 <= n < total] or list(range(total))
+
+
+def criar_diretorio(cursor):
+    """mapa_usuarios no shard 0, preenchido com as contas que já existiam nele"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS mapa_usuarios (
+            usuario_id SERIAL PRIMARY KEY,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            shard INTEGER NOT NULL DEFAULT 0,
+            movendo BOOLEAN NOT NULL DEFAULT FALSE
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO mapa_usuarios (usuario_id, email, shard)
+        SELECT id, email, 0 FROM usuarios
+        ON CONFLICT DO NOTHING
+    ''')
+    # Ids novos saem do diretório: acima de tudo o que o SERIAL de usuarios já deu
+    cursor.execute('''
+        SELECT setval(pg_get_serial_sequence('mapa_usuarios', 'usuario_id'),
+                      GREATEST((SELECT MAX(usuario_id) FROM mapa_usuarios),
+                               (SELECT MAX(id) FROM usuarios), 1))
+    ''')
+
+
+class Shard:
+    """Um banco: número, pool de conexões e disjuntor"""
+
+    def __init__(self, numero, pool, disjuntor):
+        self.numero = numero
+        self.pool = pool
+        self.disjuntor = disjuntor
+
+
+class MapaShards:
+    """Diretório usuario_id/email -> shard, com cache LRU por worker"""
+
+    def __init__(self, obter_diretorio, total, ttl=SHARDS_CACHE_TTL, maximo=SHARDS_CACHE_MAX,
+                 diretorio=True):
+        self.obter_diretorio = obter_diretorio
+        self.total = total
+        self.diretorio = diretorio  # False: banco sem mapa_usuarios (SQLite), o id vem do próprio banco
+        self.ttl = ttl
+        self.maximo = maximo
+        self.novos = shards_para_novos(total)
+        self.ao_mudar = []  # ganchos(usuario_id) quando a conta aparece em outro shard
+        self._usuarios = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def ativo(self):
+        return self.total > 1
+
+    def _consultar(self, sql, params):
+        conn = self.obter_diretorio()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            linha = cursor.fetchone()
+            conn.commit()
+            cursor.close()
+            return linha
+        finally:
+            conn.close()
+
+    def do_usuario(self, usuario_id):
+        """(shard, movendo) da conta; (0, False) com um único banco"""
+        if not self.ativo or usuario_id is None:
+            return 0, False
+        with self._lock:
+            item = self._usuarios.get(usuario_id)
+            if item is not None and time.monotonic() - item[0] < self.ttl:
+                self._usuarios.move_to_end(usuario_id)
+                return item[1], item[2]
+
+        linha = self._consultar('''
+            /* consulta: shards_usuario */
+            SELECT shard, movendo FROM mapa_usuarios WHERE usuario_id = %s
+        ''', (usuario_id,))
+        shard, movendo = (linha['shard'], linha['movendo']) if linha else (0, False)
+        with self._lock:
+            self._usuarios[usuario_id] = (time.monotonic(), shard, movendo)
+            self._usuarios.move_to_end(usuario_id)
+            while len(self._usuarios) > self.maximo:
+                self._usuarios.popitem(last=False)
+        if item is not None and item[1] != shard:
+            for gancho in self.ao_mudar:
+                gancho(usuario_id)
+        return shard, movendo
+
+    def do_email(self, email):
+        """Shard onde procurar a conta no login (0 se o email não existir)"""
+        if not self.ativo:
+            return 0
+        linha = self._consultar('''
+            /* consulta: shards_email */
+            SELECT shard FROM mapa_usuarios WHERE email = %s
+        ''', (email,))
+        return linha['shard'] if linha else 0
+
+    def reservar(self, email):
+        """Reserva o id e escolhe o shard da conta nova (IntegrityError se o email existir)"""
+        if not self.diretorio:
+            return None, 0
+        linha = self._consultar('''
+            /* consulta: shards_reservar */
+            INSERT INTO mapa_usuarios (usuario_id, email, shard)
+            SELECT proximo, %s, (%s::int[])[(proximo %% %s)::int + 1]
+            FROM (SELECT nextval(pg_get_serial_sequence('mapa_usuarios', 'usuario_id')) AS proximo) s
+            RETURNING usuario_id, shard
+        ''', (email, self.novos, len(self.novos)))
+        return linha['usuario_id'], linha['shard']
+
+    def cancelar(self, usuario_id):
+        """Desfaz a reserva de uma conta que não chegou a ser criada no shard"""
+        self._consultar('''
+            /* consulta: shards_cancelar */
+            DELETE FROM mapa_usuarios WHERE usuario_id = %s RETURNING usuario_id
+        ''', (usuario_id,))
+        self.invalidar(usuario_id)
+
+    def invalidar(self, usuario_id):
+        with self._lock:
+            self._usuarios.pop(usuario_id, None)
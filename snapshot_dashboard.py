@@ -0,0 +1,115 @@
+"""
+Snapshot do Dashboard (último resultado bom)
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- Guarda por usuário os agregados do dashboard da última vez que o banco respondeu
+- Arquivo JSON por usuário (compartilhado entre os workers), gravado de
+  forma atômica e no máximo uma vez por SNAPSHOT_INTERVALO
+- Saldos e transações só para o usuário do app: diretório 0700 (recusado se
+  for de outro usuário) e arquivos 0600, mesmo no tmp do sistema
+- Datas e Decimals voltam com o mesmo tipo para os templates
+- Revalidação em segundo plano, uma por usuário, quando o banco volta
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+from diretorio_privado import abrir_privado, preparar_diretorio
+from linhas import Linha
+
+# ============== CONFIGURAÇÕES ==============
+
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', os.path.join(tempfile.gettempdir(), 'simplifica_snapshots'))
+
+# Intervalo mínimo (s) entre gravações do snapshot do mesmo usuário
+SNAPSHOT_INTERVALO = float(os.getenv('SNAPSHOT_INTERVALO', 60))
+
+
+# ============== SERIALIZAÇÃO ==============
+
+def _codificar(valor):
+    if isinstance(valor, Linha):
+        return dict(valor)
+    if isinstance(valor, Decimal):
+        return {'__decimal__': str(valor)}
+    if isinstance(valor, datetime):
+        return {'__datetime__': valor.isoformat()}
+    if isinstance(valor, date):
+        return {'__date__': valor.isoformat()}
+    raise TypeError(f'Tipo não serializável no snapshot: {type(valor).__name__}')
+
+
+def _decodificar(objeto):
+    if '__decimal__' in objeto:
+        return Decimal(objeto['__decimal__'])
+    if '__datetime__' in objeto:
+        return datetime.fromisoformat(objeto['__datetime__'])
+    if '__date__' in objeto:
+        return date.fromisoformat(objeto['__date__'])
+    return objeto
+
+
+# ============== ARMAZENAMENTO ==============
+
+class SnapshotsDashboard:
+    """Último dashboard bom de cada usuário, em disco"""
+
+    def __init__(self, diretorio=SNAPSHOT_DIR, intervalo=SNAPSHOT_INTERVALO):
+        self.diretorio = diretorio
+        self.intervalo = intervalo
+        self._gravados_em = {}
+        self._revalidando = set()
+        self._lock = threading.Lock()
+        preparar_diretorio(self.diretorio)
+
+    def _caminho(self, usuario_id):
+        return os.path.join(self.diretorio, f'{int(usuario_id)}.json')
+
+    def salvar(self, usuario_id, dados, forcar=False):
+        """Grava os dados do dashboard (ignora se gravou há menos de intervalo)"""
+        agora = time.monotonic()
+        if not forcar and agora - self._gravados_em.get(usuario_id, -self.intervalo) < self.intervalo:
+            return False
+        self._gravados_em[usuario_id] = agora
+
+        caminho = self._caminho(usuario_id)
+        temporario = f'{caminho}.{os.getpid()}.tmp'
+        conteudo = {'gerado_em': datetime.now().isoformat(timespec='seconds'), 'dados': dados}
+        with abrir_privado(temporario) as f:
+            json.dump(conteudo, f, default=_codificar)
+        os.replace(temporario, caminho)
+        return True
+
+    def carregar(self, usuario_id):
+        """(dados, gerado_em) do último snapshot, ou (None, None)"""
+        try:
+            with open(self._caminho(usuario_id), encoding='utf-8') as f:
+                conteudo = json.load(f, object_hook=_decodificar)
+        except (OSError, ValueError):
+            return None, None
+        return conteudo['dados'], datetime.fromisoformat(conteudo['gerado_em'])
+
+    def revalidar_em_segundo_plano(self, usuario_id, coletar):
+        """Roda coletar() numa thread e grava o resultado; no máximo uma por usuário"""
+        with self._lock:
+            if usuario_id in self._revalidando:
+                return False
+            self._revalidando.add(usuario_id)
+
+        def revalidar():
+            try:
+                self.salvar(usuario_id, coletar(), forcar=True)
+            except Exception:
+                pass  # Banco ainda fora: o disjuntor já registrou a falha
+            finally:
+                with self._lock:
+                    self._revalidando.discard(usuario_id)
+
+        threading.Thread(target=revalidar, name=f'snapshot-{usuario_id}', daemon=True).start()
+        return True
@@ -0,0 +1,311 @@
+"""
+Sugestões de Descrição e Categoria (Autocompletar)
+Projeto: Gestão Financeira - Simplifica Finanças
+
+Funcionalidades:
+- /sugestoes?campo=descricao|categoria&q=... devolve o que o usuário já
+  lançou começando com o texto digitado (qualquer palavra, sem acentos)
+- Ordem por frequência com peso para o recente: vezes x 0,5^(dias desde o
+  último uso / SUGESTOES_MEIA_VIDA_DIAS)
+- Índice por usuário em memória (LRU com TTL): resposta sem ir ao banco
+- Cópia em disco por usuário (JSON, gravação atômica, compartilhada entre os
+  workers): worker novo ou cache expirado não consulta o banco; a cópia é
+  refeita do banco a cada SUGESTOES_RECONSTRUIR segundos (diretório 0700,
+  arquivos 0600: são descrições do usuário)
+- Transação nova entra na hora no índice em memória; a cópia em disco é
+  atualizada por uma thread do worker (fora da requisição), com trava por
+  usuário (flock) entre os workers para um não perder o que o outro gravou
+
+Exclusões não tiram sugestões na hora: somem na próxima reconstrução.
+"""
+
+import bisect
+import heapq
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos (um worker só)
+    fcntl = None
+
+from categorias import cache_categorias
+from diretorio_privado import abrir_privado, preparar_diretorio
+from particoes import inicio_do_mes, somar_meses
+
+# ============== CONFIGURAÇÕES ==============
+
+SUGESTOES_DIR = os.getenv('SUGESTOES_DIR', os.path.join(tempfile.gettempdir(), 'simplifica_sugestoes'))
+SUGESTOES_CACHE_TTL = float(os.getenv('SUGESTOES_CACHE_TTL', 300))
+SUGESTOES_CACHE_MAX = int(os.getenv('SUGESTOES_CACHE_MAX', 2000))
+SUGESTOES_RECONSTRUIR = float(os.getenv('SUGESTOES_RECONSTRUIR', 6 * 3600))
+SUGESTOES_MEIA_VIDA_DIAS = float(os.getenv('SUGESTOES_MEIA_VIDA_DIAS', 90))
+SUGESTOES_HORIZONTE_MESES = 12
+SUGESTOES_MAX_TERMOS = 5000
+SUGESTOES_LIMITE = 8
+
+CAMPOS_SUGESTAO = ('descricao', 'categoria')
+
+# Posições de cada termo: [texto, tipo, vezes, último uso (date.toordinal), categoria]
+TEXTO, TIPO, VEZES, ULTIMO, CATEGORIA = range(5)
+
+
+def chave_termo(texto):
+    """Forma de comparação: minúsculas, sem acentos e sem espaços repetidos"""
+    sem_acento = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode()
+    return ' '.join(sem_acento.lower().split())
+
+
+def consultar_usos(cursor, usuario_id, hoje=None):
+    """Usos de cada descrição/categoria no horizonte: [(descricao, categoria, tipo, vezes, ultima)]"""
+    desde = somar_meses(inicio_do_mes(hoje or date.today()), -SUGESTOES_HORIZONTE_MESES)
+    cursor.execute('''
+        /* consulta: sugestoes_usos */
+        SELECT descricao, categoria_id, tipo, COUNT(*) AS vezes, MAX(data) AS ultima
+        FROM transacoes
+        WHERE usuario_id = %s AND data >= %s
+        GROUP BY descricao, categoria_id, tipo
+        ORDER BY vezes DESC
+        LIMIT %s
+    ''', (usuario_id, desde, SUGESTOES_MAX_TERMOS))
+    linhas = cursor.fetchall()
+    nomes = cache_categorias.nomes(cursor, usuario_id, {linha['categoria_id'] for linha in linhas})
+    usos = [(linha['descricao'], nomes.get(linha['categoria_id']), linha['tipo'], linha['vezes'], linha['ultima'])
+            for linha in linhas]
+    # Categorias ainda sem transação no horizonte também são sugeridas (peso zero)
+    usados = {uso[1] for uso in usos}
+    usos += [(None, nome, None, 0, None) for nome in nomes.values() if nome not in usados]
+    return usos
+
+
+# ============== ÍNDICE DE UM USUÁRIO ==============
+
+class IndiceUsuario:
+    """Termos de um usuário e, por campo, a lista ordenada (início de palavra, chave)"""
+
+    def __init__(self, termos=None, construido_em=None):
+        self.termos = termos or {campo: {} for campo in CAMPOS_SUGESTAO}
+        self.construido_em = time.time() if construido_em is None else construido_em
+        self.entradas = {campo: sorted(entrada for chave in self.termos[campo]
+                                       for entrada in self._entradas(chave))
+                         for campo in CAMPOS_SUGESTAO}
+
+    @staticmethod
+    def _entradas(chave):
+        """Uma entrada por palavra: 'conta de luz' acha por 'conta', 'de l' e 'luz'"""
+        palavras = chave.split(' ')
+        return [(' '.join(palavras[i:]), chave) for i in range(len(palavras))]
+
+    @classmethod
+    def dos_usos(cls, usos):
+        indice = cls()
+        for descricao, categoria, tipo, vezes, ultima in usos:
+            if descricao:
+                indice.somar('descricao', descricao, tipo, vezes, ultima, categoria)
+            if categoria:
+                indice.somar('categoria', categoria, tipo, vezes, ultima)
+        return indice
+
+    def somar(self, campo, texto, tipo, vezes, ultima, categoria=None):
+        """Acrescenta usos de um termo (o uso mais recente define texto, tipo e categoria)"""
+        chave = chave_termo(texto)
+        if not chave:
+            return
+        if isinstance(ultima, str):
+            ultima = date.fromisoformat(ultima[:10])  # SQLite: MAX(data) não tem tipo declarado
+        ultima = ultima.toordinal() if ultima is not None else 0
+        termo = self.termos[campo].get(chave)
+        if termo is None:
+            self.termos[campo][chave] = [texto, tipo, vezes, ultima, categoria]
+            for entrada in self._entradas(chave):
+                bisect.insort(self.entradas[campo], entrada)
+            return
+        termo[VEZES] += vezes
+        if ultima >= termo[ULTIMO]:
+            termo[TEXTO], termo[ULTIMO] = texto, ultima
+            termo[TIPO] = tipo or termo[TIPO]
+            termo[CATEGORIA] = categoria or termo[CATEGORIA]
+
+    def buscar(self, campo, texto, tipo=None, limite=SUGESTOES_LIMITE, hoje=None):
+        """Termos com alguma palavra começando por texto, dos mais relevantes aos menos"""
+        prefixo = chave_termo(texto)
+        entradas = self.entradas[campo]
+        chaves = set()
+        for i in range(bisect.bisect_left(entradas, (prefixo,)), len(entradas)):
+            if not entradas[i][0].startswith(prefixo):
+                break
+            chaves.add(entradas[i][1])
+
+        hoje = (hoje or date.today()).toordinal()
+        termos = self.termos[campo]
+
+        def peso(chave):
+            termo = termos[chave]
+            return termo[VEZES] * 0.5 ** (max(hoje - termo[ULTIMO], 0) / SUGESTOES_MEIA_VIDA_DIAS)
+
+        candidatas = (chave for chave in chaves if tipo is None or termos[chave][TIPO] in (tipo, None))
+        melhores = heapq.nlargest(limite, candidatas, key=lambda chave: (peso(chave), termos[chave][TEXTO]))
+        return [{'texto': termos[chave][TEXTO], 'categoria': termos[chave][CATEGORIA]} if campo == 'descricao'
+                else {'texto': termos[chave][TEXTO]} for chave in melhores]
+
+
+# ============== ÍNDICE DE TODOS OS USUÁRIOS ==============
+
+class IndiceSugestoes:
+    """LRU de usuários -> IndiceUsuario, com cópia em disco"""
+
+    def __init__(self, diretorio=SUGESTOES_DIR, ttl=SUGESTOES_CACHE_TTL, maximo=SUGESTOES_CACHE_MAX,
+                 reconstruir=SUGESTOES_RECONSTRUIR):
+        self.diretorio = diretorio
+        self.ttl = ttl
+        self.maximo = maximo
+        self.reconstruir = reconstruir
+        self._usuarios = OrderedDict()
+        self._lock = threading.Lock()
+        self._pendentes = None  # Fila da thread de gravação (recriada após fork)
+        self._gravador_pid = None
+        preparar_diretorio(self.diretorio)
+
+    def _caminho(self, usuario_id):
+        return os.path.join(self.diretorio, f'{int(usuario_id)}.json')
+
+    @contextmanager
+    def _travado(self, usuario_id):
+        """Trava exclusiva da cópia em disco do usuário entre os workers"""
+        if fcntl is None:
+            yield
+            return
+        descritor = os.open(os.path.join(self.diretorio, f'{int(usuario_id)}.trava'), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(descritor, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(descritor)  # Fechar solta a trava
+
+    def _guardar(self, usuario_id, indice):
+        with self._lock:
+            self._usuarios[usuario_id] = (time.monotonic(), indice)
+            self._usuarios.move_to_end(usuario_id)
+            while len(self._usuarios) > self.maximo:
+                self._usuarios.popitem(last=False)
+
+    def _em_memoria(self, usuario_id):
+        with self._lock:
+            item = self._usuarios.get(usuario_id)
+            if item is not None and time.monotonic() - item[0] < self.ttl:
+                self._usuarios.move_to_end(usuario_id)
+                return item[1]
+        return None
+
+    def _do_disco(self, usuario_id):
+        """Cópia em disco se existir e ainda não for hora de reconstruir"""
+        try:
+            with open(self._caminho(usuario_id), encoding='utf-8') as f:
+                conteudo = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - conteudo['construido_em'] > self.reconstruir:
+            return None
+        return IndiceUsuario(conteudo['termos'], conteudo['construido_em'])
+
+    def _gravar(self, usuario_id, indice):
+        caminho = self._caminho(usuario_id)
+        temporario = f'{caminho}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with abrir_privado(temporario) as f:
+            json.dump({'construido_em': indice.construido_em, 'termos': indice.termos}, f)
+        os.replace(temporario, caminho)
+
+    def do_usuario(self, usuario_id, carregar):
+        """Índice do usuário: memória, disco ou carregar(usuario_id) (usos vindos do banco)"""
+        indice = self._em_memoria(usuario_id)
+        if indice is None:
+            indice = self._do_disco(usuario_id)
+            if indice is None:
+                indice = IndiceUsuario.dos_usos(carregar(usuario_id))
+                with self._travado(usuario_id):
+                    self._gravar(usuario_id, indice)
+            self._guardar(usuario_id, indice)
+        return indice
+
+    def buscar(self, usuario_id, campo, texto, carregar, tipo=None, limite=SUGESTOES_LIMITE):
+        return self.do_usuario(usuario_id, carregar).buscar(campo, texto, tipo, limite)
+
+    def registrar(self, usuario_id, descricao, categoria, tipo, data):
+        """Transação nova entra no índice em memória e vai para a fila da cópia em disco
+
+        Na requisição não há leitura nem escrita de arquivo: a thread de
+        gravação aplica a fila na cópia em disco (a que tem o que os outros
+        workers registraram).
+        """
+        indice = self._em_memoria(usuario_id)
+        if indice is not None:
+            with self._lock:
+                indice.somar('descricao', descricao, tipo, 1, data, categoria)
+                indice.somar('categoria', categoria, tipo, 1, data)
+        self._fila().put((usuario_id, descricao, categoria, tipo, data))
+
+    def _fila(self):
+        """Fila da thread de gravação deste processo (worker novo, thread nova)"""
+        if self._gravador_pid != os.getpid():
+            with self._lock:
+                if self._gravador_pid != os.getpid():
+                    self._pendentes = queue.Queue()
+                    threading.Thread(target=self._gravar_pendentes, args=(self._pendentes,),
+                                     name='sugestoes-disco', daemon=True).start()
+                    self._gravador_pid = os.getpid()
+        return self._pendentes
+
+    def _gravar_pendentes(self, pendentes):
+        while True:
+            lote = [pendentes.get()]
+            while True:
+                try:
+                    lote.append(pendentes.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._aplicar_no_disco(lote)
+            except Exception:
+                pass  # Disco cheio etc.: a próxima reconstrução volta a ter tudo do banco
+            finally:
+                for _ in lote:
+                    pendentes.task_done()
+
+    def _aplicar_no_disco(self, lote):
+        """Lê, soma e grava a cópia de cada usuário do lote, com a trava entre workers"""
+        por_usuario = OrderedDict()
+        for usuario_id, *transacao in lote:
+            por_usuario.setdefault(usuario_id, []).append(transacao)
+        for usuario_id, transacoes in por_usuario.items():
+            with self._travado(usuario_id):
+                indice = self._do_disco(usuario_id)
+                if indice is None:
+                    continue  # Sem cópia válida: a próxima carga vem do banco, já com as transações
+                for descricao, categoria, tipo, data in transacoes:
+                    indice.somar('descricao', descricao, tipo, 1, data, categoria)
+                    indice.somar('categoria', categoria, tipo, 1, data)
+                self._gravar(usuario_id, indice)
+
+    def aguardar_gravacoes(self):
+        """Espera a thread de gravação esvaziar a fila (testes e desligamento)"""
+        if self._gravador_pid == os.getpid():
+            self._pendentes.join()
+
+    def invalidar(self, usuario_id):
+        with self._lock:
+            self._usuarios.pop(usuario_id, None)
+        try:
+            os.remove(self._caminho(usuario_id))
+        except OSError:
+            pass
+
+
+indice_sugestoes = IndiceSugestoes()
@@ -3,23 +3,69 @@
 Testes Automatizados - Sistema de Gestão Financeira
 Projeto A3 - Gestão e Qualidade de Software
 
-Total: 15 testes automatizados
-- 5 Testes Unitários
-- 4 Testes de Integração
-- 6 Testes Funcionais
+Total: 47 testes automatizados
+- 31 Testes Unitários
+- 6 Testes de Integração
+- 10 Testes Funcionais
 """
 
 import unittest
 import sys
 import os
+import socket
+import json
+import logging
+import tempfile
+import threading
+import time
 from datetime import datetime, timedelta
+from decimal import Decimal
 from werkzeug.security import generate_password_hash, check_password_hash
 
 # Adiciona o diretório raiz ao path para importar app
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app import app, get_db_connection, get_cor_clara
-import mysql.connector
+# Sem PostgreSQL configurado, os testes usam um banco SQLite temporário
+if not os.getenv('DATABASE_URL') and not os.getenv('DB_HOST'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'testes.db')
+
+from flask import session
+from app import app, get_db_connection, get_cor_clara, listar_tabelas
+import app as app_module
+from compressao import CompressaoMiddleware
+import compressao
+from orcamento_consultas import (OrcamentoExcedido, capturar_consultas, montar_relatorio,
+                                 normalizar_sql, verificar_orcamento)
+from perfilador import AmostradorPilha, gravar_perfil
+from log_estruturado import FiltroAmostragem, FormatadorJSON
+import log_estruturado
+from metricas import RegistroMetricas
+from pool_conexoes import PoolConexoes, PoolEsgotado
+import metricas
+from limites_consulta import (TIMEOUT_PADRAO_MS, TIMEOUTS_ROTA_MS, VigiaDesconexao, aplicar_timeout,
+                              cliente_desconectou, refazer_timeout, timeout_da_rota)
+from controle_admissao import ControleAdmissao, idade_na_fila, prioridade_da_rota
+from disjuntor import BancoIndisponivel, Disjuntor, disjuntor_db
+from snapshot_dashboard import SnapshotsDashboard
+from linhas import classe_linha
+from diretorio_privado import DiretorioInseguro, abrir_privado, preparar_diretorio
+from dinheiro import ValorInvalido, formatar_moeda, para_centavos, para_reais, valor_para_campo
+from categorias import CacheCategorias, normalizar_nome
+from particoes import intervalo_do_mes, nome_particao, somar_meses
+from arquivo_transacoes import corte_do_arquivo
+from replicas import Replica, RoteadorLeituras
+from shards import MapaShards, shards_para_novos
+from banco_sqlite import BancoSQLite, traduzir_sql
+from busca_transacoes import condicao_busca, consulta_prefixos, palavras_busca
+import busca_transacoes
+from sugestoes import IndiceSugestoes, chave_termo
+from analitico import (ColunasUsuario, MotorAnalitico, maiores, media_movel, numero_do_mes, serie_mensal,
+                       somas_por_categoria, totais_por_tipo, transacao)
+from previsao_metas import linhas_previsao, prever
+from recorrencias import materializar, materializar_todas
+import numpy as np
+import pandas as pd
+import psycopg2
 
 
 class TestAutenticacao(unittest.TestCase):
@@ -147,26 +193,26 @@ class TestBancoDados(unittest.TestCase):
         """
         TA-06: Verificar conexão com banco de dados
         Tipo: Integração / Infraestrutura
-        Objetivo: Validar conectividade com MySQL
+        Objetivo: Validar conectividade com o banco (PostgreSQL ou SQLite)
         """
         print("\n🧪 Executando TA-06: Conexão com Banco...")
         
         try:
             conn = get_db_connection()
-            self.assertTrue(conn.is_connected(), "Não conectou ao banco")
+            self.assertFalse(conn.closed, "Não conectou ao banco")
             
             cursor = conn.cursor()
-            cursor.execute("SELECT 1")
+            cursor.execute("SELECT 1 AS um")
             result = cursor.fetchone()
             
-            self.assertEqual(result[0], 1, "Query de teste falhou")
+            self.assertEqual(result['um'], 1, "Query de teste falhou")
             
             cursor.close()
             conn.close()
             
             print("✅ TA-06: PASSOU - Conexão com banco funcionando")
             
-        except mysql.connector.Error as e:
+        except psycopg2.Error as e:
             self.fail(f"Erro na conexão com banco: {e}")
     
     def test_07_estrutura_tabelas(self):
@@ -183,8 +229,7 @@ class TestBancoDados(unittest.TestCase):
             conn = get_db_connection()
             cursor = conn.cursor()
             
-            cursor.execute("SHOW TABLES")
-            tabelas_existentes = [table[0] for table in cursor.fetchall()]
+            tabelas_existentes = listar_tabelas(cursor)
             
             for tabela in tabelas_esperadas:
                 self.assertIn(
@@ -198,7 +243,7 @@ class TestBancoDados(unittest.TestCase):
             
             print(f"✅ TA-07: PASSOU - {len(tabelas_esperadas)} tabelas encontradas")
             
-        except mysql.connector.Error as e:
+        except psycopg2.Error as e:
             self.fail(f"Erro ao verificar tabelas: {e}")
 
 
@@ -421,6 +466,1583 @@ class TestIntegracao(unittest.TestCase):
         print("✅ TA-15: PASSOU - Modo de interface funcionando")
 
 
+class TestFragmentos(unittest.TestCase):
+    """
+    TESTES DAS ROTAS DE FRAGMENTOS (ATUALIZAÇÃO PARCIAL)
+    """
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.app = app
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+    
+    def test_16_fragmentos_exigem_login(self):
+        """
+        TA-16: Fragmentos não podem ser acessados sem login
+        Tipo: Segurança
+        Objetivo: Garantir que as rotas parciais seguem a mesma proteção das páginas
+        """
+        print("\n🧪 Executando TA-16: Proteção dos Fragmentos...")
+        
+        for rota in ['/fragmentos/resumo', '/fragmentos/transacoes', '/fragmentos/meta/1']:
+            response = self.client.get(rota, headers={'X-Fragmento': '1'})
+            self.assertEqual(response.status_code, 302, f"{rota} não redirecionou")
+            self.assertIn('/login', response.headers['Location'], f"{rota} não levou ao login")
+        
+        print("✅ TA-16: PASSOU - Fragmentos protegidos corretamente")
+    
+    def test_44_fragmentos_parciais_e_exclusao(self):
+        """
+        TA-44: Fragmentos devolvem só o HTML parcial e a exclusão refaz a lista
+        Tipo: Funcional
+        Objetivo: Cabeçalho X-Fragmento, total da paginação após excluir e página inteira sem o cabeçalho
+        """
+        print("\n🧪 Executando TA-44: Fragmentos e Exclusão...")
+        
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        email = f'fragmentos{int(datetime.now().timestamp())}@teste.com'
+        cursor.execute("INSERT INTO usuarios (nome, email, senha) VALUES (%s, %s, %s)", ('Frag', email, 'x'))
+        cursor.execute('SELECT id FROM usuarios WHERE email = %s', (email,))
+        usuario_id = cursor.fetchone()['id']
+        cursor.execute('''
+            INSERT INTO categorias_personalizadas (usuario_id, nome, tipo) VALUES (%s, 'Casa', 'despesa')
+        ''', (usuario_id,))
+        cursor.execute('SELECT id FROM categorias_personalizadas WHERE usuario_id = %s', (usuario_id,))
+        categoria_id = cursor.fetchone()['id']
+        for numero in range(21):
+            cursor.execute('''
+                INSERT INTO transacoes (usuario_id, tipo, valor_centavos, descricao, categoria_id, data)
+                VALUES (%s, 'despesa', 1000, %s, %s, %s)
+            ''', (usuario_id, f'Gasto {numero}', categoria_id, datetime(2024, 5, 10).date()))
+        cursor.execute('SELECT id FROM transacoes WHERE usuario_id = %s ORDER BY id', (usuario_id,))
+        ids = [linha['id'] for linha in cursor.fetchall()]
+        conn.commit()
+        cursor.close()
+        conn.close()
+        
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = usuario_id
+            sess['user_nome'] = 'Frag'
+            sess['user_modo'] = 'simples'
+        fragmento = {'X-Fragmento': '1'}
+        
+        # Com o cabeçalho: só a tabela e a paginação, sem o layout da página
+        response = self.client.get('/fragmentos/transacoes?pagina=2', headers=fragmento)
+        self.assertEqual(response.status_code, 200)
+        html = response.get_data(as_text=True)
+        self.assertNotIn('<html', html, "Fragmento trouxe a página inteira")
+        self.assertIn('id="transacoes-corpo"', html)
+        self.assertIn('21 transação(ões)', html)
+        self.assertIn(f'id="transacao-{ids[0]}"', html, "Página 2 deveria ter a transação mais antiga")
+        
+        response = self.client.get('/fragmentos/resumo', headers=fragmento)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('id="resumo-cards"', response.get_data(as_text=True))
+        self.assertNotIn('<html', response.get_data(as_text=True))
+        
+        # Sem o cabeçalho a mesma lista vem na página completa
+        response = self.client.get('/transacoes?pagina=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('<html', response.get_data(as_text=True))
+        
+        # Exclusão pela lista: tabela e paginação refeitas; a página 2 sumiu, volta para a 1
+        response = self.client.get(f'/excluir-transacao/{ids[0]}?pagina=2', headers=fragmento)
+        self.assertEqual(response.status_code, 200)
+        html = response.get_data(as_text=True)
+        self.assertNotIn('<html', html)
+        self.assertIn('20 transação(ões)', html, "Total da paginação não foi atualizado")
+        self.assertNotIn(f'id="transacao-{ids[0]}"', html)
+        self.assertIn(f'id="transacao-{ids[1]}"', html)
+        
+        # Exclusão pelo dashboard (sem página na URL): 204 sem corpo
+        response = self.client.get(f'/excluir-transacao/{ids[1]}', headers=fragmento)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response.get_data(), b'')
+        
+        # Sem o cabeçalho: redireciona de volta, como antes dos fragmentos
+        response = self.client.get(f'/excluir-transacao/{ids[2]}?pagina=1')
+        self.assertEqual(response.status_code, 302)
+        response = self.client.get('/fragmentos/transacoes', headers=fragmento)
+        self.assertIn('18 transação(ões)', response.get_data(as_text=True))
+        
+        print("✅ TA-44: PASSOU - Fragmentos parciais e exclusão com total atualizado")
+
+
+class TestCompressao(unittest.TestCase):
+    """
+    TESTES DO MIDDLEWARE DE COMPRESSÃO
+    """
+    
+    def test_17_compressao_negociacao(self):
+        """
+        TA-17: Verificar negociação e elegibilidade da compressão
+        Tipo: Unitário
+        Objetivo: Comprimir HTML grande e ignorar downloads binários
+        """
+        print("\n🧪 Executando TA-17: Compressão de Respostas...")
+        
+        middleware = CompressaoMiddleware(None, tamanho_minimo=500)
+        
+        self.assertEqual(middleware.escolher_codificacao('gzip, deflate'), 'gzip')
+        self.assertIsNone(middleware.escolher_codificacao('identity'))
+        self.assertIsNone(middleware.escolher_codificacao('gzip;q=0'))
+        
+        html = [('Content-Type', 'text/html; charset=utf-8'), ('Content-Length', '8000')]
+        pdf = [('Content-Type', 'application/pdf'), ('Content-Length', '8000')]
+        pequeno = [('Content-Type', 'text/html; charset=utf-8'), ('Content-Length', '100')]
+        stream = [('Content-Type', 'text/html; charset=utf-8')]
+        
+        self.assertTrue(middleware.deve_comprimir('200 OK', html), "HTML não seria comprimido")
+        self.assertFalse(middleware.deve_comprimir('200 OK', pdf), "PDF seria recomprimido")
+        self.assertFalse(middleware.deve_comprimir('200 OK', pequeno), "Resposta pequena seria comprimida")
+        self.assertTrue(middleware.deve_comprimir('200 OK', stream), "Streaming não seria comprimido")
+        self.assertFalse(middleware.deve_comprimir('304 NOT MODIFIED', html), "304 seria comprimido")
+        
+        # Maior q vence; empate fica com brotli (se instalado)
+        self.assertEqual(middleware.escolher_codificacao('gzip;q=1, br;q=0.1'), 'gzip',
+                         "Cliente preferia gzip e recebeu brotli")
+        preferida = 'br' if compressao.brotli is not None else 'gzip'
+        self.assertEqual(middleware.escolher_codificacao('gzip, br'), preferida)
+        self.assertEqual(middleware.escolher_codificacao('*'), preferida)
+        
+        # ETag por codificação e 304 com a ETag que o cliente guardou
+        def app_etag(environ, start_response):
+            if environ.get('HTTP_IF_NONE_MATCH') == '"v1"':
+                start_response('304 NOT MODIFIED', [('ETag', '"v1"')])
+                return [b'']
+            start_response('200 OK', [('Content-Type', 'text/css'), ('ETag', '"v1"'),
+                                      ('Content-Length', '2000')])
+            return [b'a' * 2000]
+        
+        comprimido = CompressaoMiddleware(app_etag, tamanho_minimo=500)
+        respostas = []
+        
+        def pedir(**cabecalhos):
+            environ = {'HTTP_ACCEPT_ENCODING': 'gzip'}
+            environ.update(cabecalhos)
+            b''.join(comprimido(environ, lambda status, headers, exc_info=None: respostas.append(
+                (status, dict(headers)))))
+            return respostas[-1]
+        
+        status, cabecalhos = pedir()
+        self.assertEqual(cabecalhos['ETag'], '"v1-gz"', "Corpo gzip com a mesma ETag do original")
+        self.assertIn('Accept-Encoding', cabecalhos['Vary'])
+        status, cabecalhos = pedir(HTTP_IF_NONE_MATCH='"v1-gz"')
+        self.assertTrue(status.startswith('304'), "ETag com sufixo não gerou 304")
+        self.assertEqual(cabecalhos['ETag'], '"v1-gz"')
+        self.assertEqual(CompressaoMiddleware.etag_com_sufixo('W/"v1"', '-br'), 'W/"v1-br"')
+        
+        print("✅ TA-17: PASSOU - Compressão negociada corretamente")
+
+
+class TestOrcamentoConsultas(unittest.TestCase):
+    """
+    TESTES DO ORÇAMENTO DE CONSULTAS (DETECTOR DE N+1)
+    """
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.app = app
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+    
+    def test_18_deteccao_consultas_repetidas(self):
+        """
+        TA-18: Detectar comandos repetidos que só mudam nos parâmetros
+        Tipo: Unitário
+        Objetivo: Apontar o padrão N+1 e o estouro do orçamento da rota
+        """
+        print("\n🧪 Executando TA-18: Detecção de N+1...")
+        
+        self.assertEqual(
+            normalizar_sql("/* consulta: x */ SELECT * FROM metas WHERE id = 7 AND tipo IN ('a', 'b')"),
+            normalizar_sql("SELECT *  FROM metas\n WHERE id = %s AND tipo IN (%s, %s, %s)"),
+            "Comandos equivalentes não foram normalizados igual"
+        )
+        
+        consultas = [('conexao', None, 0.001)]
+        consultas += [('select_metas', f"SELECT * FROM metas WHERE id = {i}", 0.001) for i in range(5)]
+        relatorio = montar_relatorio('dashboard', consultas)
+        
+        self.assertEqual(relatorio.comandos, 5)
+        self.assertEqual(relatorio.idas_ao_banco, 6)
+        self.assertEqual(list(relatorio.repetidos.values()), [5], "Repetição não detectada")
+        
+        with self.assertRaises(OrcamentoExcedido):
+            verificar_orcamento([relatorio], {'dashboard': 4})
+        
+        print("✅ TA-18: PASSOU - N+1 e orçamento detectados")
+    
+    def test_19_orcamento_paginas_principais(self):
+        """
+        TA-19: Dashboard e transações dentro do orçamento de idas ao banco
+        Tipo: Integração / Desempenho
+        Objetivo: Barrar regressões que multipliquem as consultas por requisição
+        """
+        print("\n🧪 Executando TA-19: Orçamento de Consultas...")
+        
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_nome'] = 'Teste'
+            sess['user_modo'] = 'avancado'
+        
+        with capturar_consultas() as relatorios:
+            for rota in ['/dashboard', '/transacoes', '/fragmentos/resumo']:
+                response = self.client.get(rota)
+                self.assertEqual(response.status_code, 200, f"{rota} falhou")
+                if rota != '/fragmentos/resumo':
+                    self.assertIn('X-Consultas', response.headers)
+        
+        # O resumo sai das colunas do motor analítico (carregadas pelo dashboard)
+        self.assertEqual([r.rota for r in relatorios][:2], ['dashboard', 'listar_transacoes'])
+        self.assertTrue(all(r.comandos == 0 for r in relatorios if r.rota == 'fragmento_resumo'),
+                        "Resumo não deveria consultar o banco")
+        verificar_orcamento(relatorios)
+        for relatorio in relatorios:
+            self.assertFalse(relatorio.repetidos, f"Possível N+1 em {relatorio.rota}")
+        
+        print("✅ TA-19: PASSOU - Páginas dentro do orçamento")
+
+
+class TestPerfilador(unittest.TestCase):
+    """
+    TESTES DO PERFILADOR POR AMOSTRAGEM
+    """
+    
+    def test_20_perfil_amostrado_e_rotacionado(self):
+        """
+        TA-20: Amostrar a pilha de uma função lenta e manter o limite de perfis
+        Tipo: Unitário
+        Objetivo: Garantir saída "collapsed stacks" e diretório circular
+        """
+        print("\n🧪 Executando TA-20: Perfilador por Amostragem...")
+        
+        def funcao_lenta():
+            fim = time.perf_counter() + 0.1
+            while time.perf_counter() < fim:
+                pass
+        
+        amostrador = AmostradorPilha(threading.get_ident(), intervalo=0.002)
+        amostrador.start()
+        funcao_lenta()
+        amostrador.parar()
+        
+        self.assertGreater(amostrador.amostras, 0, "Nenhuma amostra coletada")
+        linha = amostrador.exportar().splitlines()[0]
+        pilha, vezes = linha.rsplit(' ', 1)
+        self.assertIn('funcao_lenta', pilha, "Função lenta fora do perfil")
+        self.assertGreater(int(vezes), 0)
+        
+        with tempfile.TemporaryDirectory() as diretorio:
+            for _ in range(4):
+                gravar_perfil(linha + '\n', 'relatorios', 0.1, diretorio=diretorio, maximo=2)
+            self.assertEqual(len(os.listdir(diretorio)), 2, "Perfis antigos não foram apagados")
+            self.assertEqual(os.stat(os.path.join(diretorio, os.listdir(diretorio)[0])).st_mode & 0o777, 0o600,
+                             "Perfil (com SQL) legível por outros usuários")
+        
+        # Consulta no SQLite embutido também vira o quadro db:<consulta>
+        with tempfile.TemporaryDirectory() as diretorio:
+            banco = BancoSQLite(os.path.join(diretorio, 'perfil.db'))
+            conn = banco.obter()
+            cursor = conn.cursor()
+            amostrador_db = AmostradorPilha(threading.get_ident(), intervalo=0.002)
+            amostrador_db.start()
+            fim = time.perf_counter() + 0.1
+            while time.perf_counter() < fim:
+                cursor.execute('''
+                    /* consulta: perfil_lenta */
+                    WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 20000)
+                    SELECT COUNT(*) FROM n
+                ''')
+                cursor.fetchall()
+            amostrador_db.parar()
+            cursor.close()
+            conn.close()
+        self.assertTrue(any(pilha.endswith('db:perfil_lenta') for pilha in amostrador_db.pilhas),
+                        "Tempo no SQLite não apareceu como quadro do banco")
+        
+        print(f"✅ TA-20: PASSOU - {amostrador.amostras} amostras coletadas")
+
+
+class TestLogEstruturado(unittest.TestCase):
+    """
+    TESTES DO LOGGING ESTRUTURADO
+    """
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.app = app
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+    
+    def test_21_log_json_request_id_e_amostragem(self):
+        """
+        TA-21: Linhas JSON com request_id e amostragem dos logs quentes
+        Tipo: Unitário
+        Objetivo: Garantir logs estruturados e rastreáveis por requisição
+        """
+        print("\n🧪 Executando TA-21: Logging Estruturado...")
+        
+        response = self.client.get('/login', headers={'X-Request-ID': 'req-teste-21'})
+        self.assertEqual(response.headers.get('X-Request-ID'), 'req-teste-21', "Request id não propagado")
+        
+        registro = logging.LogRecord('app', logging.INFO, __file__, 1, 'Usuário %s logou', (7,), None)
+        registro.request_id = 'req-teste-21'
+        registro.usuario_id = 7
+        linha = json.loads(FormatadorJSON().format(registro))
+        self.assertEqual(linha['mensagem'], 'Usuário 7 logou')
+        self.assertEqual(linha['request_id'], 'req-teste-21')
+        self.assertEqual(linha['usuario_id'], 7, "Campo do extra= não foi para o JSON")
+        
+        filtro = FiltroAmostragem({'app': 0.0})
+        self.assertFalse(filtro.filter(registro), "INFO amostrado com taxa 0 passou")
+        registro.levelno = logging.WARNING
+        self.assertTrue(filtro.filter(registro), "WARNING não pode ser descartado")
+        
+        print("✅ TA-21: PASSOU - Logs estruturados com request_id")
+    
+    def test_47_log_de_worker_criado_por_fork(self):
+        """
+        TA-47: Worker criado por fork depois da configuração também escreve os logs
+        Tipo: Unitário
+        Objetivo: Com gunicorn --preload a thread de escrita do pai não existe no worker
+        """
+        print("\n🧪 Executando TA-47: Logs Depois do Fork...")
+        
+        if not hasattr(os, 'fork'):
+            self.skipTest('Sistema sem fork')
+        
+        with tempfile.TemporaryDirectory() as diretorio:
+            arquivo = os.path.join(diretorio, 'app.log')
+            log_estruturado.configurar_logging(arquivo=arquivo)
+            try:
+                logging.getLogger('teste').warning('antes do fork')
+                pid = os.fork()
+                if pid == 0:
+                    try:
+                        logging.getLogger('teste').warning('do worker')
+                        log_estruturado.encerrar_logging()
+                    finally:
+                        os._exit(0)
+                os.waitpid(pid, 0)
+                log_estruturado.encerrar_logging()
+                with open(arquivo, encoding='utf-8') as f:
+                    mensagens = [json.loads(linha)['mensagem'] for linha in f]
+            finally:
+                log_estruturado.configurar_logging(arquivo=os.getenv('LOG_ARQUIVO'))
+        
+        self.assertEqual(mensagens.count('antes do fork'), 1, "Worker repetiu o que estava na fila do pai")
+        self.assertIn('do worker', mensagens, "Log do worker ficou parado na fila")
+        
+        print("✅ TA-47: PASSOU - Worker escreve os próprios logs")
+
+
+class TestSaudeEPool(unittest.TestCase):
+    """
+    TESTES DO POOL DE CONEXÕES E DAS SONDAS DE SAÚDE
+    """
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.app = app
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+    
+    def test_22_pool_reaproveita_e_limita(self):
+        """
+        TA-22: Pool reaproveita conexões e respeita o tamanho máximo
+        Tipo: Unitário
+        Objetivo: Evitar abrir uma conexão nova por requisição
+        """
+        print("\n🧪 Executando TA-22: Pool de Conexões...")
+        
+        class ConexaoFalsa:
+            closed = 0
+            _pool = None
+            
+            def get_transaction_status(self):
+                return 0
+            
+            def fechar(self):
+                self.closed = 1
+        
+        abertas = []
+        pool = PoolConexoes(lambda: abertas.append(ConexaoFalsa()) or abertas[-1], tamanho=2, espera=0)
+        
+        primeira = pool.obter()
+        pool.devolver(primeira)
+        self.assertIs(pool.obter(), primeira, "Conexão ociosa não foi reaproveitada")
+        pool.obter()
+        
+        self.assertEqual(pool.estado()['saturacao'], 1.0)
+        with self.assertRaises(PoolEsgotado):
+            pool.obter()
+        self.assertEqual(len(abertas), 2, "Pool abriu conexões além do tamanho")
+        self.assertEqual(pool.estado()['esgotamentos'], 1)
+        
+        print("✅ TA-22: PASSOU - Pool reaproveitando e limitando conexões")
+    
+    def test_23_liveness_sem_banco(self):
+        """
+        TA-23: Liveness responde sem tocar no banco
+        Tipo: Funcional
+        Objetivo: Sonda barata para a plataforma reiniciar só processos travados
+        """
+        print("\n🧪 Executando TA-23: Liveness...")
+        
+        with capturar_consultas() as relatorios:
+            response = self.client.get('/health/live')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['status'], 'alive')
+        self.assertEqual(relatorios, [], "Liveness foi ao banco")
+        
+        print("✅ TA-23: PASSOU - Liveness sem ida ao banco")
+
+
+class TestLimitesConsulta(unittest.TestCase):
+    """
+    TESTES DOS TIMEOUTS E DO CANCELAMENTO DE CONSULTAS
+    """
+    
+    def test_24_timeouts_e_cliente_desconectado(self):
+        """
+        TA-24: Timeouts por rota e detecção de cliente desconectado
+        Tipo: Unitário
+        Objetivo: Uma consulta ruim não pode prender o worker indefinidamente
+        """
+        print("\n🧪 Executando TA-24: Timeouts e Cancelamento...")
+        
+        self.assertEqual(timeout_da_rota('dashboard'), TIMEOUT_PADRAO_MS)
+        self.assertGreater(timeout_da_rota('exportar_pdf'), timeout_da_rota('dashboard'),
+                           "Exportação deveria ter mais tempo que o dashboard")
+        for rota, timeout in TIMEOUTS_ROTA_MS.items():
+            self.assertLess(timeout, 30000, f"{rota} passa do timeout do gunicorn")
+        
+        cliente, servidor = socket.socketpair()
+        try:
+            self.assertFalse(cliente_desconectou(servidor), "Cliente ativo dado como desconectado")
+            cliente.close()
+            self.assertTrue(cliente_desconectou(servidor), "Desconexão não detectada")
+        finally:
+            servidor.close()
+        
+        class ConexaoFalsa:
+            ao_conferir = None
+            
+            def __init__(self):
+                self.comandos = []
+                self.cancelamentos = 0
+            
+            @property
+            def closed(self):
+                if self.ao_conferir:
+                    self.ao_conferir()
+                    self.ao_conferir = None
+                return 0
+            
+            def cursor(self):
+                conn = self
+                
+                class Cursor:
+                    def execute(self, query, vars=None):
+                        conn.comandos.append(vars)
+                    
+                    def close(self):
+                        pass
+                return Cursor()
+            
+            def cancel(self):
+                self.cancelamentos += 1
+        
+        # Rota pesada: timeout refeito na transação seguinte ao commit
+        conn = ConexaoFalsa()
+        with app.test_request_context('/relatorios'):
+            aplicar_timeout(conn)
+        refazer_timeout(conn)
+        self.assertEqual(conn.comandos, [(timeout_da_rota('relatorios'),)] * 2,
+                         "statement_timeout da rota não foi refeito depois do commit")
+        
+        # Sem a thread do vigia: as passadas são feitas pelo teste
+        vigia = VigiaDesconexao()
+        vigia._thread = threading.current_thread()
+        cliente, morto = socket.socketpair()
+        cliente.close()
+        outro_cliente, vivo = socket.socketpair()
+        try:
+            # Entre a leitura dos sockets e o cancel, a conexão voltou ao pool e foi para outro cliente
+            conn = ConexaoFalsa()
+            vigia.observar(conn, morto)
+            conn.ao_conferir = lambda: (vigia.esquecer(conn), vigia.observar(conn, vivo))
+            vigia.conferir()
+            self.assertEqual(conn.cancelamentos, 0, "Vigia cancelou a consulta de outra requisição")
+            
+            conn = ConexaoFalsa()
+            vigia.observar(conn, morto)
+            vigia.conferir()
+            self.assertEqual(conn.cancelamentos, 1, "Cliente desconectado não teve a consulta cancelada")
+        finally:
+            for sock in (morto, outro_cliente, vivo):
+                sock.close()
+        
+        print("✅ TA-24: PASSOU - Timeouts e desconexão verificados")
+
+
+class TestControleAdmissao(unittest.TestCase):
+    """
+    TESTES DO CONTROLE DE ADMISSÃO (LOAD SHEDDING)
+    """
+    
+    def test_25_admissao_prioridades_e_prazo(self):
+        """
+        TA-25: Limite de vagas, prioridade das rotas e rejeição por prazo
+        Tipo: Unitário
+        Objetivo: Falhar rápido com 503 em vez de acumular requisições
+        """
+        print("\n🧪 Executando TA-25: Controle de Admissão...")
+        
+        self.assertEqual(prioridade_da_rota('login', 'GET'), 'leve')
+        self.assertEqual(prioridade_da_rota('login', 'POST'), 'normal')
+        self.assertEqual(prioridade_da_rota('exportar_pdf', 'GET'), 'pesada')
+        
+        controle = ControleAdmissao(limite=2, limite_pesadas=1, fila_max=5)
+        self.assertIsNone(controle.admitir('pesada', 0))
+        self.assertEqual(controle.admitir('pesada', 0.01), 'prazo', "Segunda pesada passou da cota")
+        self.assertIsNone(controle.admitir('normal', 0))
+        self.assertEqual(controle.admitir('normal', 0.01), 'prazo', "Limite total não respeitado")
+        
+        controle.liberar('normal')
+        self.assertIsNone(controle.admitir('normal', 0), "Vaga liberada não foi reaproveitada")
+        
+        self.assertAlmostEqual(idade_na_fila('t=1700000000000000', agora=1700000005.0), 5.0)
+        self.assertAlmostEqual(idade_na_fila('1700000000000', agora=1700000002.0), 2.0)
+        
+        print("✅ TA-25: PASSOU - Admissão com prioridade e prazo")
+
+
+class TestDisjuntorSnapshot(unittest.TestCase):
+    """
+    TESTES DO DISJUNTOR DO BANCO E DO SNAPSHOT DO DASHBOARD
+    """
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.app = app
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+    
+    def test_26_disjuntor_abre_e_testa(self):
+        """
+        TA-26: Disjuntor abre após falhas seguidas e libera uma tentativa depois
+        Tipo: Unitário
+        Objetivo: Não martelar um banco que já está com problemas
+        """
+        print("\n🧪 Executando TA-26: Disjuntor...")
+        
+        disjuntor = Disjuntor(falhas_para_abrir=2, tempo_aberto=0.05)
+        disjuntor.falha()
+        self.assertTrue(disjuntor.permitir(), "Abriu antes do limite de falhas")
+        disjuntor.falha()
+        self.assertFalse(disjuntor.permitir(), "Não abriu após as falhas")
+        with self.assertRaises(BancoIndisponivel):
+            disjuntor.verificar()
+        
+        time.sleep(0.06)
+        self.assertTrue(disjuntor.permitir(), "Não liberou a tentativa de teste")
+        self.assertFalse(disjuntor.permitir(), "Liberou duas tentativas ao mesmo tempo")
+        disjuntor.sucesso()
+        self.assertTrue(disjuntor.permitir(), "Não fechou após o sucesso")
+        
+        print("✅ TA-26: PASSOU - Disjuntor abrindo e fechando")
+    
+    def test_27_dashboard_servido_do_snapshot(self):
+        """
+        TA-27: Com o disjuntor aberto o dashboard vem do último snapshot
+        Tipo: Funcional
+        Objetivo: Usuário vê os últimos dados (com aviso) em vez de um erro
+        """
+        print("\n🧪 Executando TA-27: Snapshot do Dashboard...")
+        
+        dados = {
+            'saldo': 150050,
+            'mes_atual': {'receitas': 300000, 'despesas': 149950, 'saldo': 150050},
+            'transacoes': [{'id': 1, 'data': datetime(2025, 1, 10).date(), 'descricao': 'Venda',
+                            'categoria': 'Vendas', 'tipo': 'receita', 'valor_centavos': 300000}],
+            'metas_ativas': [],
+        }
+        
+        with tempfile.TemporaryDirectory() as diretorio:
+            snapshots = SnapshotsDashboard(diretorio=diretorio)
+            snapshots.salvar(999, dados)
+            recuperados, gerado_em = snapshots.carregar(999)
+            self.assertEqual(recuperados, dados, "Snapshot não preservou centavos/date")
+            self.assertEqual(os.stat(diretorio).st_mode & 0o777, 0o700)
+            self.assertEqual(os.stat(os.path.join(diretorio, '999.json')).st_mode & 0o777, 0o600,
+                             "Snapshot com saldos legível por outros usuários")
+            
+            original = app_module.snapshots_dashboard
+            app_module.snapshots_dashboard = snapshots
+            with self.client.session_transaction() as sess:
+                sess['user_id'] = 999
+                sess['user_nome'] = 'Teste'
+                sess['user_modo'] = 'avancado'
+            try:
+                for _ in range(disjuntor_db.falhas_para_abrir):
+                    disjuntor_db.falha()
+                response = self.client.get('/dashboard')
+            finally:
+                disjuntor_db.sucesso()
+                app_module.snapshots_dashboard = original
+        
+        self.assertEqual(response.status_code, 200, "Dashboard não foi servido do snapshot")
+        texto = response.data.decode('utf-8')
+        self.assertIn(f"dados de {gerado_em.strftime('%H:%M')}", texto, "Aviso de dados antigos ausente")
+        self.assertIn('Venda', texto)
+        self.assertIn('R$ 3.000,00', texto)
+        
+        print("✅ TA-27: PASSOU - Dashboard servido do snapshot")
+    
+    def test_43_meio_aberto_fecha_ao_conectar(self):
+        """
+        TA-43: Aberto -> meio aberto -> fechado pela conexão obtida do pool
+        Tipo: Unitário
+        Objetivo: Tentativa que não passa pelo CursorMedido não deixa o disjuntor preso no meio aberto
+        """
+        print("\n🧪 Executando TA-43: Disjuntor Meio Aberto...")
+        
+        class ConexaoFalsa:
+            closed = 0
+            _pool = None
+            
+            def get_transaction_status(self):
+                return 0
+        
+        shard = app_module.novo_shard(len(app_module.shards_db), 'postgresql://shard.invalido/banco')
+        shard.pool.conectar = ConexaoFalsa
+        shard.pool.ao_retirar, shard.pool.ao_devolver = [], []
+        shard.disjuntor.tempo_aberto = 0.02
+        app_module.shards_db.append(shard)
+        try:
+            for _ in range(shard.disjuntor.falhas_para_abrir):
+                shard.disjuntor.falha()
+            self.assertEqual(shard.disjuntor.estado, 'aberto')
+            with self.assertRaises(BancoIndisponivel):
+                app_module.conexao_do_shard(shard.numero)
+            
+            time.sleep(0.03)
+            conn = app_module.conexao_do_shard(shard.numero)
+            self.assertEqual(shard.disjuntor.estado, 'fechado', "Conexão obtida não fechou o disjuntor")
+            self.assertTrue(shard.disjuntor.permitir())
+            shard.pool.devolver(conn)
+        finally:
+            app_module.shards_db.remove(shard)
+        
+        print("✅ TA-43: PASSOU - Disjuntor fechado pela tentativa do meio aberto")
+
+
+class TestLinhasCompactas(unittest.TestCase):
+    """
+    TESTES DAS LINHAS COMPACTAS DE RESULTADO
+    """
+    
+    def test_28_linha_compacta_compativel(self):
+        """
+        TA-28: Linha compacta com acesso por atributo e por chave
+        Tipo: Unitário
+        Objetivo: Trocar o dict por linha sem quebrar templates, pandas e JSON
+        """
+        print("\n🧪 Executando TA-28: Linhas Compactas...")
+        
+        campos = ('id', 'descricao', 'valor', 'data')
+        valores = (1, 'Venda', Decimal('10.50'), datetime(2025, 1, 10).date())
+        linha = classe_linha(campos)(valores)
+        
+        self.assertIs(classe_linha(campos), type(linha), "Classe da linha não foi reaproveitada")
+        self.assertEqual(linha.descricao, 'Venda')
+        self.assertEqual(linha['valor'], Decimal('10.50'))
+        self.assertIsNone(linha.get('inexistente'))
+        self.assertEqual(dict(linha), dict(zip(campos, valores)))
+        self.assertFalse(hasattr(linha, '__dict__'), "Linha não deveria ter __dict__")
+        
+        self.assertEqual(list(pd.DataFrame([linha]).columns), list(campos))
+        self.assertEqual(json.loads(app.json.dumps([linha]))[0]['descricao'], 'Venda')
+        
+        print("✅ TA-28: PASSOU - Linha compacta compatível com dict")
+
+
+class TestDinheiroCentavos(unittest.TestCase):
+    """
+    TESTES DO DINHEIRO EM CENTAVOS
+    """
+    
+    def test_29_valores_em_centavos(self):
+        """
+        TA-29: Conversão e formatação de valores em centavos
+        Tipo: Unitário
+        Objetivo: Garantir valores exatos do formulário até a tela, sem float
+        """
+        print("\n🧪 Executando TA-29: Dinheiro em Centavos...")
+        
+        self.assertEqual(para_centavos('10.50'), 1050)
+        self.assertEqual(para_centavos('1.234,56'), 123456)
+        self.assertEqual(para_centavos('R$ 0,10'), 10)
+        self.assertEqual(para_centavos(Decimal('19.90')), 1990)
+        
+        for invalido in ['abc', '10.555', 'NaN', '', '9' * 29 + '.123', '1e999999999']:
+            with self.assertRaises(ValorInvalido, msg=f"{invalido!r} deveria ser rejeitado"):
+                para_centavos(invalido)
+        with self.assertRaises(ValorInvalido):
+            para_centavos(10.5)
+        
+        # 0,10 + 0,20 em centavos é exato (em float daria 0.30000000000000004)
+        self.assertEqual(para_centavos('0,10') + para_centavos('0,20'), para_centavos('0,30'))
+        
+        self.assertEqual(formatar_moeda(123456), 'R$ 1.234,56')
+        self.assertEqual(formatar_moeda(-5), '-R$ 0,05')
+        self.assertEqual(formatar_moeda(None), 'R$ 0,00')
+        self.assertEqual(formatar_moeda(99950, inteiro=True), 'R$ 1.000')
+        self.assertEqual(valor_para_campo(123456), '1234.56')
+        self.assertEqual(para_reais(123456), Decimal('1234.56'))
+        
+        print("✅ TA-29: PASSOU - Valores em centavos exatos")
+
+
+class TestCategorias(unittest.TestCase):
+    """
+    TESTES DO CACHE DE CATEGORIAS POR USUÁRIO
+    """
+    
+    def test_30_cache_de_categorias(self):
+        """
+        TA-30: Categorias por id com cache por usuário
+        Tipo: Unitário
+        Objetivo: Filtro e relatórios sem consultar as categorias a cada página
+        """
+        print("\n🧪 Executando TA-30: Cache de Categorias...")
+        
+        class CursorFalso:
+            def __init__(self):
+                self.banco = {1: 'Alimentação', 2: 'Vendas'}
+                self.consultas = []
+            
+            def execute(self, sql, params):
+                self.consultas.append(sql)
+                if 'INSERT' in sql:
+                    self.banco[len(self.banco) + 1] = params[1]
+                    self.resultado = [{'id': len(self.banco)}]
+                else:
+                    self.resultado = [{'id': i, 'nome': n} for i, n in sorted(self.banco.items(), key=lambda x: x[1])]
+            
+            def fetchall(self):
+                return self.resultado
+            
+            def fetchone(self):
+                return self.resultado[0]
+        
+        cursor = CursorFalso()
+        diretorio = tempfile.mkdtemp()
+        cache = CacheCategorias(diretorio=diretorio)
+        
+        self.assertEqual(list(cache.do_usuario(cursor, 7).values()), ['Alimentação', 'Vendas'])
+        self.assertEqual(cache.id_por_nome(cursor, 7, 'Vendas'), 2)
+        self.assertEqual(cache.obter_ou_criar(cursor, 7, '  Alimentação '), 1)
+        self.assertEqual(len(cursor.consultas), 1, "Cache não evitou consultas repetidas")
+        
+        self.assertEqual(cache.obter_ou_criar(cursor, 7, 'Lazer', 'despesa'), 3)
+        self.assertEqual(cache.nomes(cursor, 7, {3})[3], 'Lazer', "Categoria nova não apareceu após invalidar")
+        self.assertEqual(normalizar_nome(''), 'Outros')
+        
+        # Outro worker (mesmo diretório de marcas) cria uma categoria: este vê na próxima leitura
+        outro_worker = CacheCategorias(diretorio=diretorio)
+        outro_worker.obter_ou_criar(cursor, 7, 'Saúde', 'despesa')
+        self.assertIn('Saúde', cache.do_usuario(cursor, 7).values(), "Categoria de outro worker invisível")
+        self.assertEqual(os.stat(os.path.join(diretorio, '7.marca')).st_mode & 0o777, 0o600)
+        # Sem marca (ex.: criada direto no banco): nome desconhecido recarrega
+        cursor.banco[5] = 'Viagem'
+        self.assertEqual(cache.id_por_nome(cursor, 7, 'Viagem'), 5)
+        
+        print("✅ TA-30: PASSOU - Categorias em cache por usuário")
+
+
+class TestParticoes(unittest.TestCase):
+    """
+    TESTES DO PARTICIONAMENTO POR MÊS
+    """
+    
+    def test_31_filtro_de_mes_poda_particoes(self):
+        """
+        TA-31: Filtro de mês vira faixa de datas (poda de partições)
+        Tipo: Unitário
+        Objetivo: Listagem e resumo do mês lerem só a partição do mês
+        """
+        print("\n🧪 Executando TA-31: Partições por Mês...")
+        
+        self.assertEqual(intervalo_do_mes('2025-12'), (datetime(2025, 12, 1).date(), datetime(2026, 1, 1).date()))
+        self.assertEqual(somar_meses(datetime(2025, 1, 20).date(), -11), datetime(2024, 2, 1).date())
+        self.assertEqual(nome_particao('transacoes', datetime(2025, 3, 1).date()), 'transacoes_2025_03')
+        
+        class CursorFalso:
+            def __init__(self):
+                self.consultas = []
+            
+            def execute(self, sql, params):
+                self.consultas.append((sql, list(params)))
+            
+            def fetchone(self):
+                return {'total': 0, 'arquivadas': 0}
+            
+            def fetchall(self):
+                return []
+        
+        cursor = CursorFalso()
+        app_module.consultar_pagina_transacoes(cursor, 1, {'mes': '2025-03'}, 1)
+        for sql, params in cursor.consultas:
+            self.assertNotIn('TO_CHAR', sql, "Filtro de mês não permite poda de partições")
+            self.assertIn(datetime(2025, 4, 1).date(), params)
+        
+        cursor = CursorFalso()
+        app_module.consultar_pagina_transacoes(cursor, 1, {'mes': 'março'}, 1)
+        self.assertIn('AND FALSE', cursor.consultas[0][0], "Mês inválido deveria não trazer nada")
+        
+        print("✅ TA-31: PASSOU - Filtro de mês como faixa de datas")
+
+
+class TestArquivo(unittest.TestCase):
+    """
+    TESTES DO ARQUIVO DE TRANSAÇÕES ANTIGAS
+    """
+    
+    def test_32_listagem_le_arquivo_so_depois_das_ativas(self):
+        """
+        TA-32: Leitura do arquivo sob demanda
+        Tipo: Unitário
+        Objetivo: Listagem e exportações só lerem transacoes_arquivo quando a página ou o período chegam lá
+        """
+        print("\n🧪 Executando TA-32: Arquivo de Transações...")
+        
+        self.assertEqual(corte_do_arquivo(datetime(2026, 10, 19).date(), 24), datetime(2024, 10, 1).date())
+        
+        class CursorFalso:
+            def __init__(self):
+                self.consultas = []
+            
+            def execute(self, sql, params):
+                self.consultas.append((sql, list(params)))
+            
+            def fetchone(self):
+                return {'total': 25, 'arquivadas': 10}
+            
+            def fetchall(self):
+                sql, params = self.consultas[-1]
+                limite, offset = params[-2:]
+                if 'transacoes_pagina_arquivo' in sql:
+                    return [{'id': 'arquivada'}] * limite
+                return [{'id': i} for i in range(offset, min(offset + limite, 25))]
+        
+        # Página 1: só ativas, arquivo intocado
+        cursor = CursorFalso()
+        transacoes, total = app_module.consultar_pagina_transacoes(cursor, 1, {}, 1)
+        self.assertEqual(total, 35, "Total deveria somar as arquivadas (pelo resumo)")
+        self.assertFalse(any('FROM transacoes_arquivo' in sql for sql, _ in cursor.consultas))
+        
+        # Página 2: 5 ativas + 15 do arquivo a partir do início
+        cursor = CursorFalso()
+        transacoes, _ = app_module.consultar_pagina_transacoes(cursor, 1, {}, 2)
+        sql, params = cursor.consultas[-1]
+        self.assertIn('FROM transacoes_arquivo', sql)
+        self.assertEqual(params[-2:], [15, 0])
+        self.assertEqual(len(transacoes), 20)
+        
+        # Exportação: período recente não lê o arquivo; histórico inteiro lê
+        desde = corte_do_arquivo().strftime('%Y-%m')
+        origem, params, _ = app_module.origem_exportacao(1, {'desde': desde})
+        self.assertNotIn('transacoes_arquivo', origem)
+        origem, params, _ = app_module.origem_exportacao(1, {})
+        self.assertIn('transacoes_arquivo', origem)
+        self.assertEqual(params, [1, 1])
+        
+        print("✅ TA-32: PASSOU - Arquivo lido só quando necessário")
+
+
+class TestReplicas(unittest.TestCase):
+    """
+    TESTES DO ROTEAMENTO DE LEITURAS PARA RÉPLICAS
+    """
+    
+    def test_33_roteamento_para_replica(self):
+        """
+        TA-33: Leituras pesadas na réplica, com volta ao primário
+        Tipo: Unitário
+        Objetivo: Réplica só para rotas de leitura, em dia e sem escrita recente do usuário
+        """
+        print("\n🧪 Executando TA-33: Réplicas de Leitura...")
+        
+        class CursorAtraso:
+            def __init__(self, atraso):
+                self.atraso = atraso
+            
+            def execute(self, sql, params=None):
+                pass
+            
+            def fetchone(self):
+                return {'atraso': self.atraso}
+            
+            def close(self):
+                pass
+        
+        class ConexaoFalsa:
+            closed = False
+            
+            def __init__(self, atraso):
+                self.atraso = atraso
+            
+            def cursor(self):
+                return CursorAtraso(self.atraso)
+            
+            def get_transaction_status(self):
+                return 0  # ociosa
+            
+            def close(self):
+                self._pool.devolver(self)
+        
+        def roteador(atraso):
+            return RoteadorLeituras([Replica('replica1', lambda: ConexaoFalsa(atraso))], intervalo_atraso=0)
+        
+        with app.test_request_context('/relatorios'):
+            self.assertIsInstance(roteador(0.5).obter(), ConexaoFalsa)
+            self.assertIsNone(roteador(60).obter(), "Réplica atrasada deveria cair no primário")
+            
+            session['escrita_em'] = time.time()
+            self.assertEqual(roteador(0).motivo_primario(), 'escrita_recente')
+            self.assertIsNone(roteador(0).obter(), "Logo após escrever, o usuário lê do primário")
+        
+        with app.test_request_context('/dashboard'):
+            self.assertEqual(roteador(0).motivo_primario(), 'rota_de_escrita')
+        
+        def recusar():
+            raise psycopg2.OperationalError('réplica fora do ar')
+        
+        fora = RoteadorLeituras([Replica('replica1', recusar)])
+        with app.test_request_context('/relatorios'):
+            self.assertIsNone(fora.obter())
+        self.assertEqual(fora.replicas[0].disjuntor.falhas, 1)
+        
+        print("✅ TA-33: PASSOU - Réplica em dia ou primário")
+
+
+class TestShards(unittest.TestCase):
+    """
+    TESTES DO DIRETÓRIO DE SHARDS
+    """
+    
+    def test_34_diretorio_de_shards(self):
+        """
+        TA-34: Shard do usuário pelo diretório, com cache
+        Tipo: Unitário
+        Objetivo: Um banco só não consulta o diretório; com vários, cache por TTL e aviso de mudança de shard
+        """
+        print("\n🧪 Executando TA-34: Shards por Usuário...")
+        
+        diretorio = {'shard': 1, 'movendo': False}
+        consultas = []
+        
+        class ConexaoFalsa:
+            def cursor(self):
+                return self
+            
+            def execute(self, sql, params):
+                consultas.append(params)
+            
+            def fetchone(self):
+                return dict(diretorio)
+            
+            def commit(self):
+                pass
+            
+            def close(self):
+                pass
+        
+        unico = MapaShards(ConexaoFalsa, total=1)
+        self.assertEqual(unico.do_usuario(7), (0, False))
+        self.assertEqual(unico.do_email('a@b.com'), 0)
+        self.assertEqual(consultas, [], "Com um banco só o diretório não deveria ser consultado")
+        
+        mapa = MapaShards(ConexaoFalsa, total=3, ttl=60)
+        mudancas = []
+        mapa.ao_mudar.append(mudancas.append)
+        self.assertEqual(mapa.do_usuario(7), (1, False))
+        self.assertEqual(mapa.do_usuario(7), (1, False))
+        self.assertEqual(len(consultas), 1, "Segunda busca deveria vir do cache")
+        
+        diretorio.update(shard=2, movendo=True)
+        mapa.ttl = 0
+        self.assertEqual(mapa.do_usuario(7), (2, True))
+        self.assertEqual(mudancas, [7], "Mudança de shard deveria avisar (cache de categorias)")
+        
+        os.environ['SHARDS_NOVOS'] = '1,2,9'
+        try:
+            self.assertEqual(shards_para_novos(3), [1, 2])
+        finally:
+            del os.environ['SHARDS_NOVOS']
+        
+        print("✅ TA-34: PASSOU - Diretório de shards com cache")
+
+    def test_41_erro_em_um_shard_nao_abre_os_outros(self):
+        """
+        TA-41: Comando com erro no shard 1 abre só o disjuntor do shard 1
+        Tipo: Unitário
+        Objetivo: Um banco com problema não pode tirar do ar os usuários dos outros
+        """
+        print("\n🧪 Executando TA-41: Disjuntor por Shard...")
+        
+        class ConexaoFalsa:
+            closed = 0
+            _pool = None
+            
+            def get_transaction_status(self):
+                return 0
+        
+        shard = app_module.novo_shard(1, 'postgresql://shard1.invalido/banco')
+        shard.pool.conectar = ConexaoFalsa
+        shard.pool.ao_retirar, shard.pool.ao_devolver = [], []
+        conn = shard.pool.obter()
+        self.assertIs(conn.disjuntor, shard.disjuntor, "Conexão não levou o disjuntor do shard")
+        
+        try:
+            for _ in range(shard.disjuntor.falhas_para_abrir):
+                metricas.registrar_erro_banco('transacoes_lista', psycopg2.OperationalError('timeout'), conn)
+            self.assertFalse(shard.disjuntor.permitir(), "Disjuntor do shard 1 não abriu")
+            self.assertEqual(app_module.shards_db[0].disjuntor.estado, 'fechado',
+                             "Erro no shard 1 abriu o disjuntor do shard 0")
+            self.assertEqual(disjuntor_db.falhas, 0)
+        finally:
+            shard.pool.devolver(conn)
+        
+        print("✅ TA-41: PASSOU - Disjuntor isolado por shard")
+    
+    def test_46_revalidacao_do_snapshot_no_shard_do_usuario(self):
+        """
+        TA-46: Revalidação do dashboard em segundo plano lê o shard do usuário
+        Tipo: Unitário
+        Objetivo: Fora da requisição não há sessão; sem o shard explícito o snapshot viria do shard 0
+        """
+        print("\n🧪 Executando TA-46: Snapshot no Shard do Usuário...")
+        
+        shards_pedidos = []
+        original_conexao = app_module.get_db_connection
+        original_do_usuario = app_module.mapa_shards.do_usuario
+        
+        def conexao_registrada(shard=None):
+            shards_pedidos.append(shard)
+            return original_conexao(shard=shard)
+        
+        app_module.get_db_connection = conexao_registrada
+        app_module.mapa_shards.do_usuario = lambda usuario_id: (2, False)
+        try:
+            with tempfile.TemporaryDirectory() as diretorio:
+                snapshots = SnapshotsDashboard(diretorio=diretorio)
+                snapshots.revalidar_em_segundo_plano(1, lambda: app_module.coletar_dashboard(1))
+                for thread in threading.enumerate():
+                    if thread.name == 'snapshot-1':
+                        thread.join(5)
+                dados, _ = snapshots.carregar(1)
+        finally:
+            app_module.get_db_connection = original_conexao
+            app_module.mapa_shards.do_usuario = original_do_usuario
+        
+        self.assertEqual(shards_pedidos, [2], "Revalidação não usou o shard do usuário")
+        self.assertIsNotNone(dados, "Snapshot revalidado não foi gravado")
+        
+        print("✅ TA-46: PASSOU - Revalidação no shard do usuário")
+
+
+class TestBancoSQLite(unittest.TestCase):
+    """
+    TESTES DO BANCO SQLITE EMBUTIDO
+    """
+    
+    def test_35_traducao_e_conexao_sqlite(self):
+        """
+        TA-35: SQL do PostgreSQL traduzido e executado no SQLite
+        Tipo: Unitário
+        Objetivo: Mesmas consultas, linhas e exceções nos dois bancos
+        """
+        print("\n🧪 Executando TA-35: Banco SQLite...")
+        
+        self.assertEqual(traduzir_sql("SELECT TO_CHAR(data, 'YYYY-MM') FROM t WHERE id = %s"),
+                         "SELECT strftime('%Y-%m', data) FROM t WHERE id = ?")
+        self.assertEqual(traduzir_sql('SELECT EXTRACT(MONTH FROM data)::INTEGER'),
+                         "SELECT CAST(strftime('%m', data) AS INTEGER)")
+        self.assertEqual(traduzir_sql('SELECT data_limite - CURRENT_DATE'),
+                         'SELECT CAST(julianday(data_limite) - julianday(CURRENT_DATE) AS INTEGER)')
+        self.assertEqual(traduzir_sql("WHERE data >= CURRENT_DATE - INTERVAL '30 days'"),
+                         "WHERE data >= date(CURRENT_DATE, '-30 days')")
+        self.assertEqual(traduzir_sql('SELECT LEAST(a, b) WHERE nome ILIKE %s'),
+                         'SELECT MIN(a, b) WHERE nome LIKE ?')
+        
+        with tempfile.TemporaryDirectory() as diretorio:
+            banco = BancoSQLite(os.path.join(diretorio, 'teste.db'))
+            banco.criar_tabelas()
+            conn = banco.obter()
+            self.assertIs(banco.obter(), conn, "Mesma thread deveria reaproveitar a conexão")
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO usuarios (nome, email, senha) VALUES (%s, %s, %s)", ('A', 'a@a', 'x'))
+            cursor.execute('''
+                INSERT INTO categorias_personalizadas (usuario_id, nome, tipo) VALUES (1, 'Mercado', 'despesa')
+            ''')
+            cursor.execute('''
+                INSERT INTO transacoes (usuario_id, tipo, valor_centavos, descricao, categoria_id, data)
+                VALUES (1, 'despesa', 12345, 'Compra', 1, %s)
+            ''', (datetime(2025, 3, 9).date(),))
+            conn.commit()
+            
+            cursor.execute('''
+                SELECT TO_CHAR(data, 'DD/MM/YYYY') AS dia, data, SUM(valor_centavos)::BIGINT AS total
+                FROM transacoes WHERE usuario_id = %s GROUP BY data
+            ''', (1,))
+            linha = cursor.fetchone()
+            self.assertEqual((linha.dia, linha['total']), ('09/03/2025', 12345))
+            self.assertEqual(linha.data, datetime(2025, 3, 9).date(), "DATE deveria voltar como date")
+            
+            with self.assertRaises(psycopg2.IntegrityError):
+                cursor.execute("INSERT INTO usuarios (nome, email, senha) VALUES ('B', 'a@a', 'y')")
+            conn.close()
+            conn.close()
+            self.assertFalse(conn._conn.in_transaction, "Último close() deveria desfazer o pendente")
+            conn.fechar()
+        
+        print("✅ TA-35: PASSOU - SQLite com o SQL do app")
+
+
+class TestBuscaTransacoes(unittest.TestCase):
+    """
+    TESTES DA BUSCA POR DESCRIÇÃO
+    """
+    
+    def test_36_busca_por_descricao(self):
+        """
+        TA-36: Busca na descrição com prefixos e junto dos outros filtros
+        Tipo: Unitário
+        Objetivo: Texto digitado vira tsquery segura e entra no WHERE da listagem
+        """
+        print("\n🧪 Executando TA-36: Busca por Descrição...")
+        
+        self.assertEqual(palavras_busca("Farmácia & 'centro' | !"), ['farmácia', 'centro'])
+        self.assertEqual(consulta_prefixos(['farm', 'cent']), 'farm:* & cent:*')
+        self.assertIsNone(condicao_busca('  !!  '), "Sem palavras não deveria filtrar")
+        
+        sql, params = condicao_busca('Farm centro')
+        self.assertIn("to_tsquery('simplifica_pt', %s)", sql)
+        self.assertIn('%%>', sql, "Operador de trigramas deveria vir escapado para o psycopg2")
+        self.assertEqual(params, ['farm:* & centro:*', 'farm centro'])
+        self.assertEqual(condicao_busca('Farm centro', sqlite=True)[1], ['%farm%centro%'])
+        
+        filtros = app_module.filtros_transacoes({'busca': 'farm', 'tipo': 'despesa', 'mes': ''})
+        self.assertEqual(filtros, {'tipo': 'despesa', 'busca': 'farm'})
+        
+        executadas = []
+        
+        class CursorFalso:
+            def execute(self, sql, params):
+                executadas.append((sql, list(params)))
+            
+            def fetchone(self):
+                return {'total': 0, 'arquivadas': 0}
+        
+        original = app_module.banco_local
+        app_module.banco_local = None  # SQL do PostgreSQL
+        try:
+            transacoes, total = app_module.consultar_pagina_transacoes(CursorFalso(), 5, filtros, 1)
+        finally:
+            app_module.banco_local = original
+        sql, params = executadas[0]
+        self.assertIn('FROM transacoes_arquivo t', sql, "Com busca, arquivadas vêm do arquivo")
+        self.assertNotIn('resumo_arquivo', sql)
+        self.assertEqual(params, [5, 'despesa', 'farm:*', 'farm'] * 2)
+        self.assertEqual((transacoes, total), ([], 0))
+        
+        # Curingas do LIKE digitados pelo usuário valem como texto
+        sql, params = condicao_busca('a_b 100%', sqlite=True)
+        self.assertIn("ESCAPE '\\'", sql)
+        self.assertEqual(params, ['%a\\_b%100%'])
+        with tempfile.TemporaryDirectory() as diretorio:
+            banco = BancoSQLite(os.path.join(diretorio, 'busca.db'))
+            conn = banco.obter()
+            cursor = conn.cursor()
+            cursor.execute('CREATE TABLE t (descricao TEXT)')
+            cursor.executemany('INSERT INTO t VALUES (%s)', [('Taxa a_b',), ('Taxa axb',)])
+            cursor.execute('SELECT descricao FROM t WHERE 1 = 1' + sql, condicao_busca('a_b', sqlite=True)[1])
+            self.assertEqual([linha['descricao'] for linha in cursor.fetchall()], ['Taxa a_b'],
+                             "_ digitado casou com qualquer caractere")
+            cursor.close()
+            conn.close()
+        
+        # Sem as extensões: nenhum CREATE EXTENSION na subida, aviso e busca por ILIKE
+        class CursorExtensoes:
+            def __init__(self):
+                self.comandos = []
+            
+            def execute(self, sql, params=None):
+                self.comandos.append(sql)
+            
+            def fetchall(self):
+                return [{'extname': 'unaccent'}]
+        
+        cursor = CursorExtensoes()
+        try:
+            with self.assertLogs('busca_transacoes', level='WARNING'):
+                self.assertFalse(busca_transacoes.criar_indices_busca(cursor))
+            self.assertEqual(len(cursor.comandos), 1)
+            self.assertNotIn('CREATE EXTENSION', cursor.comandos[0])
+            self.assertIn('ILIKE', condicao_busca('farm')[0], "Sem extensões a busca não pode usar o índice")
+        finally:
+            busca_transacoes.extensoes_instaladas = True
+        
+        print("✅ TA-36: PASSOU - Busca por descrição")
+
+
+class TestSugestoes(unittest.TestCase):
+    """
+    TESTES DO AUTOCOMPLETAR
+    """
+    
+    def test_37_sugestoes_ordenadas_e_incrementais(self):
+        """
+        TA-37: Sugestões por início de palavra, frequência e recência
+        Tipo: Unitário
+        Objetivo: Índice em memória responde sem banco e aprende com transações novas
+        """
+        print("\n🧪 Executando TA-37: Sugestões de Descrição...")
+        
+        hoje = datetime(2025, 6, 30).date()
+        usos = [
+            ('Farmácia Centro', 'Saúde', 'despesa', 3, hoje - timedelta(days=400)),
+            ('Farmácia Popular', 'Saúde', 'despesa', 2, hoje - timedelta(days=2)),
+            ('Conta de luz', 'Moradia', 'despesa', 12, hoje - timedelta(days=20)),
+            ('Salário', 'Salário', 'receita', 6, hoje - timedelta(days=5)),
+            (None, 'Presentes', None, 0, None),
+        ]
+        carregamentos = []
+        
+        def carregar(usuario_id):
+            carregamentos.append(usuario_id)
+            return usos
+        
+        self.assertEqual(chave_termo('  Farmácia   CENTRO '), 'farmacia centro')
+        
+        with tempfile.TemporaryDirectory() as diretorio:
+            indice = IndiceSugestoes(diretorio=diretorio)
+            usuario = indice.do_usuario(7, carregar)
+            
+            # Recente vence o mais usado há mais de um ano; busca sem acento e pelo meio
+            textos = [s['texto'] for s in usuario.buscar('descricao', 'farm', hoje=hoje)]
+            self.assertEqual(textos, ['Farmácia Popular', 'Farmácia Centro'])
+            self.assertEqual(usuario.buscar('descricao', 'LUZ', hoje=hoje),
+                             [{'texto': 'Conta de luz', 'categoria': 'Moradia'}])
+            self.assertEqual(usuario.buscar('descricao', 'sal', tipo='despesa', hoje=hoje), [])
+            self.assertIn({'texto': 'Presentes'}, usuario.buscar('categoria', 'pre', hoje=hoje))
+            
+            inicio = time.perf_counter()
+            indice.buscar(7, 'descricao', 'f', carregar)
+            self.assertLess(time.perf_counter() - inicio, 0.005, "Sugestão em memória deveria levar < 5 ms")
+            
+            indice.registrar(7, 'Farmácia Centro', 'Saúde', 'despesa', hoje)
+            indice.registrar(7, 'Padaria', 'Alimentação', 'despesa', hoje)
+            usuario = indice.do_usuario(7, carregar)
+            self.assertEqual(usuario.termos['descricao']['farmacia centro'][2], 4)
+            self.assertEqual(usuario.buscar('descricao', 'pad', hoje=hoje)[0]['categoria'], 'Alimentação')
+            
+            # Outro worker (memória vazia) lê a cópia em disco, sem consultar o banco
+            indice.aguardar_gravacoes()
+            outro = IndiceSugestoes(diretorio=diretorio)
+            self.assertEqual(outro.buscar(7, 'descricao', 'padaria', carregar)[0]['texto'], 'Padaria')
+            self.assertEqual(carregamentos, [7], "Cópia em disco deveria evitar nova carga do banco")
+            
+            # Dois workers registrando ao mesmo tempo: nenhum perde o que o outro gravou
+            for _ in range(20):
+                indice.registrar(7, 'Farmácia Centro', 'Saúde', 'despesa', hoje)
+                outro.registrar(7, 'Farmácia Centro', 'Saúde', 'despesa', hoje)
+            indice.aguardar_gravacoes()
+            outro.aguardar_gravacoes()
+            terceiro = IndiceSugestoes(diretorio=diretorio)
+            self.assertEqual(terceiro.do_usuario(7, carregar).termos['descricao']['farmacia centro'][2], 44,
+                             "Registro de um worker sobrescreveu o do outro na cópia em disco")
+        
+        print("✅ TA-37: PASSOU - Sugestões ordenadas e incrementais")
+
+
+class TestMotorAnalitico(unittest.TestCase):
+    """
+    TESTES DO MOTOR ANALÍTICO EM COLUNAS
+    """
+    
+    def test_38_kernels_e_atualizacao_incremental(self):
+        """
+        TA-38: Somas, série mensal e maiores valores saem das colunas em memória
+        Tipo: Unitário
+        Objetivo: Kernels iguais ao SQL; escrita atualiza as colunas e avisa os outros workers
+        """
+        print("\n🧪 Executando TA-38: Motor Analítico...")
+        
+        d = datetime(2025, 1, 1).date()
+        linhas = [
+            (1, 'despesa', 12000, 'Mercado', 10, d + timedelta(days=40)),
+            (2, 'receita', 300000, 'Salário', 20, d + timedelta(days=4)),
+            (3, 'despesa', 5000, 'Luz', 11, str(d + timedelta(days=9))),  # SQLite: data em texto
+            (4, 'despesa', 8000, 'Mercado', 10, d + timedelta(days=70)),
+        ]
+        carregamentos = []
+        
+        def carregar(usuario_id):
+            carregamentos.append(usuario_id)
+            return linhas
+        
+        colunas = ColunasUsuario(linhas)
+        self.assertEqual(colunas.dia.dtype, np.int32)
+        self.assertEqual(colunas.categoria.dtype, np.int16)
+        self.assertEqual(list(colunas.id), [2, 3, 1, 4], "Colunas ordenadas por data")
+        self.assertEqual(somas_por_categoria(colunas, 'despesa'), [(10, 20000, 2), (11, 5000, 1)])
+        self.assertEqual(somas_por_categoria(colunas, 'despesa', de=d + timedelta(days=31)), [(10, 20000, 2)])
+        self.assertEqual(totais_por_tipo(colunas, d, d + timedelta(days=31)), {'receitas': 300000, 'despesas': 5000})
+        
+        meses, receitas, despesas, quantidades = serie_mensal(colunas, numero_do_mes(d), numero_do_mes(d) + 3)
+        self.assertEqual(list(receitas), [300000, 0, 0, 0])
+        self.assertEqual(list(despesas), [5000, 12000, 8000, 0])
+        self.assertEqual(list(quantidades), [2, 1, 1, 0])
+        self.assertEqual(list(media_movel(np.array([3, 6, 9, 12]), 2)), [3.0, 4.5, 7.5, 10.5])
+        self.assertEqual([int(colunas.id[p]) for p in maiores(colunas, 'despesa', 2)], [1, 4])
+        
+        with tempfile.TemporaryDirectory() as diretorio:
+            worker_a = MotorAnalitico(diretorio=diretorio)
+            worker_b = MotorAnalitico(diretorio=diretorio)
+            worker_a.do_usuario(7, carregar)
+            worker_b.do_usuario(7, carregar)
+            self.assertIs(worker_a.do_usuario(7, carregar), worker_a.do_usuario(7, carregar))
+            self.assertEqual(len(carregamentos), 2)
+            
+            # Escrita no worker A: entra nas colunas dele sem recarregar
+            worker_a.adicionar(7, 5, 'despesa', 700, 'Padaria', 12, d + timedelta(days=41))
+            worker_a.remover(7, 3)
+            self.assertEqual(os.stat(os.path.join(diretorio, '7.marca')).st_mode & 0o777, 0o600)
+            atual = worker_a.do_usuario(7, carregar)
+            self.assertEqual(len(carregamentos), 2)
+            self.assertEqual(list(atual.id), [2, 1, 5, 4])
+            self.assertEqual(transacao(atual, 2)['descricao'], 'Padaria')
+            self.assertEqual(len(colunas), 4, "Colunas antigas não mudam")
+            
+            # Worker B vê a marca nova e recarrega do banco
+            worker_b.do_usuario(7, carregar)
+            self.assertEqual(len(carregamentos), 3)
+            
+            # Limite de bytes: o usuário menos usado sai
+            worker_a.max_bytes = atual.nbytes + 1
+            worker_a.do_usuario(8, carregar)
+            self.assertNotIn(7, worker_a._usuarios)
+        
+        print("✅ TA-38: PASSOU - Motor analítico em colunas")
+
+
+class TestPrevisaoMetas(unittest.TestCase):
+    """
+    TESTES DA PREVISÃO DE CONCLUSÃO DAS METAS
+    """
+    
+    def test_39_previsao_vetorizada(self):
+        """
+        TA-39: Data prevista e aporte mensal de várias metas numa passada
+        Tipo: Unitário
+        Objetivo: Ritmo próprio da meta, parte do saldo mensal para metas novas e prazo vencido
+        """
+        print("\n🧪 Executando TA-39: Previsão de Metas...")
+        
+        hoje = datetime(2025, 7, 1).date()
+        ritmo, previsao, aporte = prever(
+            alvo=[120000, 100000, 50000, 10000],
+            atual=[60000, 0, 0, 10000],
+            inicio=[hoje - timedelta(days=183), hoje, hoje - timedelta(days=400), hoje - timedelta(days=60)],
+            limite=[hoje + timedelta(days=365), None, hoje - timedelta(days=10), None],
+            fluxo=[0, 40000, -5000, 0],
+            ativas=[1, 2, 1, 1],
+            hoje=hoje)
+        linhas = linhas_previsao([1, 2, 3, 4], ritmo, previsao, aporte)
+        
+        # Meta 1: 600 em ~6 meses -> ~100/mês, faltam 600 -> ~6 meses; 12 meses de prazo
+        self.assertAlmostEqual(linhas[0][3], 9982, delta=20)
+        self.assertEqual((linhas[0][1].year, linhas[0][1].month), (2025, 12))
+        self.assertAlmostEqual(linhas[0][2], 5000, delta=10)
+        # Meta 2: nova, metade do saldo mensal (2 metas ativas) e sem data limite
+        self.assertEqual(linhas[1][3], 20000)
+        self.assertEqual((linhas[1][1].year, linhas[1][1].month), (2025, 12))
+        self.assertIsNone(linhas[1][2])
+        # Meta 3: sem ritmo e saldo negativo -> sem previsão; prazo vencido pede tudo
+        self.assertEqual(linhas[2][1:], (None, 50000, 0))
+        # Meta 4: já alcançada
+        self.assertEqual(linhas[3][1], hoje)
+        
+        print("✅ TA-39: PASSOU - Previsão vetorizada de metas")
+
+
+class TestRecorrencias(unittest.TestCase):
+    """
+    TESTES DAS TRANSAÇÕES RECORRENTES
+    """
+    
+    def test_40_materializacao_recorrencias(self):
+        """
+        TA-40: Ocorrências de todas as regras geradas num comando, sem repetir
+        Tipo: Integração
+        Objetivo: Datas de fim de mês, data final da regra e execução repetida idempotente
+        """
+        print("\n🧪 Executando TA-40: Transações Recorrentes...")
+        
+        with tempfile.TemporaryDirectory() as diretorio:
+            banco = BancoSQLite(os.path.join(diretorio, 'teste.db'))
+            banco.criar_tabelas()
+            conn = banco.obter()
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO usuarios (nome, email, senha) VALUES (%s, %s, %s)", ('A', 'a@a', 'x'))
+            cursor.execute('''
+                INSERT INTO categorias_personalizadas (usuario_id, nome, tipo) VALUES (1, 'Casa', 'despesa')
+            ''')
+            regras = [('mensal', datetime(2024, 1, 31).date(), None),
+                      ('semanal', datetime(2024, 1, 1).date(), datetime(2024, 2, 1).date()),
+                      ('anual', datetime(2020, 2, 29).date(), None)]
+            for frequencia, inicio, fim in regras:
+                cursor.execute('''
+                    INSERT INTO recorrencias (usuario_id, tipo, valor_centavos, descricao, categoria_id,
+                                              frequencia, data_inicio, data_fim)
+                    VALUES (1, 'despesa', 10000, 'Conta', 1, %s, %s, %s)
+                ''', (frequencia, inicio, fim))
+            conn.commit()
+            
+            def datas(regra):
+                cursor.execute('SELECT data FROM transacoes WHERE recorrencia_id = %s ORDER BY data', (regra,))
+                return [linha['data'].isoformat() for linha in cursor.fetchall()]
+            
+            self.assertEqual(materializar(cursor, datetime(2024, 4, 15).date(), sqlite=True), {1: 13})
+            conn.commit()
+            # Dia 31 cai no último dia dos meses curtos; 29/02 vira 28/02 fora dos bissextos
+            self.assertEqual(datas(1), ['2024-01-31', '2024-02-29', '2024-03-31'])
+            self.assertEqual(datas(2), ['2024-01-01', '2024-01-08', '2024-01-15', '2024-01-22', '2024-01-29'])
+            self.assertEqual(datas(3), ['2020-02-29', '2021-02-28', '2022-02-28', '2023-02-28', '2024-02-29'])
+            
+            # Mesma data de novo: nada a gerar; ocorrência excluída pelo usuário não volta
+            self.assertEqual(materializar(cursor, datetime(2024, 4, 15).date(), sqlite=True), {})
+            cursor.execute("DELETE FROM transacoes WHERE data = '2024-03-31'")
+            conn.commit()
+            
+            # Lote por faixas de id: só o que venceu depois da última execução
+            self.assertEqual(materializar_todas(conn, datetime(2024, 6, 30).date(), lote=2, sqlite=True), 3)
+            self.assertEqual(datas(1), ['2024-01-31', '2024-02-29', '2024-04-30', '2024-05-31', '2024-06-30'])
+            self.assertEqual(len(datas(2)), 5)
+        
+        print("✅ TA-40: PASSOU - Recorrências materializadas em lote")
+
+
+class TestMetricas(unittest.TestCase):
+    """
+    TESTES DA AGREGAÇÃO DE MÉTRICAS ENTRE WORKERS
+    """
+    
+    def setUp(self):
+        """Configuração antes de cada teste"""
+        self.app = app
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+    
+    def test_42_snapshots_de_workers_mortos_e_token(self):
+        """
+        TA-42: Snapshot de worker morto é apagado e /metrics exige token
+        Tipo: Unitário
+        Objetivo: Contadores de processos encerrados não ficam para sempre no total
+        """
+        print("\n🧪 Executando TA-42: Métricas entre Workers...")
+        
+        with tempfile.TemporaryDirectory() as diretorio:
+            registro = RegistroMetricas(diretorio=diretorio)
+            registro.incrementar('simplifica_requisicoes_total', rota='dashboard')
+            registro.gravar_snapshot(forcar=True)
+            proprio = os.listdir(diretorio)
+            self.assertEqual(len(proprio), 1)
+            self.assertTrue(proprio[0].startswith(f'{os.getpid()}-'), "Arquivo sem pid e início do processo")
+            self.assertEqual(os.stat(os.path.join(diretorio, proprio[0])).st_mode & 0o777, 0o600,
+                             "Snapshot de métricas legível por outros usuários")
+            
+            # Worker que já terminou e pid reaproveitado (mesmo pid, outro início)
+            estado = {'contadores': [['simplifica_requisicoes_total', [['rota', 'dashboard']], 50]],
+                      'histogramas': [], 'buckets': {}}
+            for morto in ['999999999-1.json', f'{os.getpid()}-0.json']:
+                with open(os.path.join(diretorio, morto), 'w', encoding='utf-8') as f:
+                    json.dump(estado, f)
+            
+            contadores, _, _ = registro.agregar()
+            self.assertEqual(contadores[('simplifica_requisicoes_total', (('rota', 'dashboard'),))], 1,
+                             "Snapshot de processo morto entrou no total")
+            self.assertEqual(os.listdir(diretorio), proprio, "Snapshots de processos mortos não foram apagados")
+        
+        token = os.environ.pop('METRICAS_TOKEN', None)
+        try:
+            self.assertEqual(self.client.get('/metrics').status_code, 403, "/metrics aberto sem token")
+            os.environ['METRICAS_TOKEN'] = 'segredo'
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            response = self.client.get('/metrics', headers={'Authorization': 'Bearer segredo'})
+            self.assertEqual(response.status_code, 200)
+        finally:
+            os.environ.pop('METRICAS_TOKEN', None)
+            if token is not None:
+                os.environ['METRICAS_TOKEN'] = token
+        
+        print("✅ TA-42: PASSOU - Métricas só de workers vivos e com token")
+
+
+class TestDiretorioPrivado(unittest.TestCase):
+    """
+    TESTES DOS DIRETÓRIOS PRIVADOS NO TMP COMPARTILHADO
+    """
+    
+    def test_45_diretorio_privado(self):
+        """
+        TA-45: Diretório criado com 0700 e recusado se outro usuário puder plantar arquivos
+        Tipo: Unitário / Segurança
+        Objetivo: Cache de bytecode e snapshots não leem nada que outro usuário local gravou
+        """
+        print("\n🧪 Executando TA-45: Diretórios Privados...")
+        
+        with tempfile.TemporaryDirectory() as base:
+            novo = preparar_diretorio(os.path.join(base, 'novo'))
+            self.assertEqual(os.stat(novo).st_mode & 0o777, 0o700)
+            with abrir_privado(os.path.join(novo, 'a.json')) as f:
+                f.write('{}')
+            self.assertEqual(os.stat(os.path.join(novo, 'a.json')).st_mode & 0o777, 0o600)
+            
+            # Nosso, só com leitura aberta (umask antiga): é fechado
+            antigo = os.path.join(base, 'antigo')
+            os.mkdir(antigo)
+            os.chmod(antigo, 0o755)
+            preparar_diretorio(antigo)
+            self.assertEqual(os.stat(antigo).st_mode & 0o777, 0o700)
+            
+            # Gravável por outros, link simbólico ou de outro dono: recusado
+            aberto = os.path.join(base, 'aberto')
+            os.mkdir(aberto)
+            os.chmod(aberto, 0o777)
+            with self.assertRaises(DiretorioInseguro):
+                preparar_diretorio(aberto)
+            os.symlink(novo, os.path.join(base, 'link'))
+            with self.assertRaises(DiretorioInseguro):
+                preparar_diretorio(os.path.join(base, 'link'))
+            if os.getuid() == 0:
+                alheio = os.path.join(base, 'alheio')
+                os.mkdir(alheio, 0o700)
+                os.chown(alheio, 12345, 12345)
+                with self.assertRaises(DiretorioInseguro):
+                    preparar_diretorio(alheio)
+        
+        print("✅ TA-45: PASSOU - Diretórios privados conferidos")
+
+
 def executar_suite_testes():
     """
     Executa todos os testes e gera relatório
@@ -442,6 +2064,30 @@ def executar_suite_testes():
     suite.addTests(loader.loadTestsFromTestCase(TestMetas))
     suite.addTests(loader.loadTestsFromTestCase(TestUtilitarios))
     suite.addTests(loader.loadTestsFromTestCase(TestIntegracao))
+    suite.addTests(loader.loadTestsFromTestCase(TestFragmentos))
+    suite.addTests(loader.loadTestsFromTestCase(TestCompressao))
+    suite.addTests(loader.loadTestsFromTestCase(TestOrcamentoConsultas))
+    suite.addTests(loader.loadTestsFromTestCase(TestPerfilador))
+    suite.addTests(loader.loadTestsFromTestCase(TestLogEstruturado))
+    suite.addTests(loader.loadTestsFromTestCase(TestSaudeEPool))
+    suite.addTests(loader.loadTestsFromTestCase(TestLimitesConsulta))
+    suite.addTests(loader.loadTestsFromTestCase(TestControleAdmissao))
+    suite.addTests(loader.loadTestsFromTestCase(TestDisjuntorSnapshot))
+    suite.addTests(loader.loadTestsFromTestCase(TestLinhasCompactas))
+    suite.addTests(loader.loadTestsFromTestCase(TestDinheiroCentavos))
+    suite.addTests(loader.loadTestsFromTestCase(TestCategorias))
+    suite.addTests(loader.loadTestsFromTestCase(TestParticoes))
+    suite.addTests(loader.loadTestsFromTestCase(TestArquivo))
+    suite.addTests(loader.loadTestsFromTestCase(TestReplicas))
+    suite.addTests(loader.loadTestsFromTestCase(TestShards))
+    suite.addTests(loader.loadTestsFromTestCase(TestBancoSQLite))
+    suite.addTests(loader.loadTestsFromTestCase(TestBuscaTransacoes))
+    suite.addTests(loader.loadTestsFromTestCase(TestSugestoes))
+    suite.addTests(loader.loadTestsFromTestCase(TestMotorAnalitico))
+    suite.addTests(loader.loadTestsFromTestCase(TestPrevisaoMetas))
+    suite.addTests(loader.loadTestsFromTestCase(TestRecorrencias))
+    suite.addTests(loader.loadTestsFromTestCase(TestMetricas))
+    suite.addTests(loader.loadTestsFromTestCase(TestDiretorioPrivado))
     
     # Executa os testes
     runner = unittest.TextTestRunner(verbosity=2)